@@ -22,9 +22,9 @@ exp_dir=$1
 data=data
 
 # We have three different preprocessors for which we need to prepare the lists
-# embd_proc_cts_aug.pkl             # LDA and cts_aug mean subtraction
-# embd_proc_sre16_major.pkl         # LDA and sre16_major mean subtracion (Only used for SRE16)
-# embd_proc_sre18_dev_unlabeled.pkl # LDA and sre18_dev_unlabeled mean subtracion (Only used for SRE18)
+# embd_proc_cts_aug.npz             # LDA and cts_aug mean subtraction
+# embd_proc_sre16_major.npz         # LDA and sre16_major mean subtracion (Only used for SRE16)
+# embd_proc_sre18_dev_unlabeled.npz # LDA and sre18_dev_unlabeled mean subtracion (Only used for SRE18)
 
 
 ### !!!
@@ -23,7 +23,7 @@ enroll_scp=sre16/eval/enrollment/xvector.scp
 test_scp=sre16/eval/test/xvector.scp
 utt2spk=data/sre16/eval/enrollment/utt2spk
 preprocessing_chain='length-norm'
-preprocessing_path="${exp_dir}/embd_proc.pkl"
+preprocessing_path="${exp_dir}/embd_proc.npz"
 
 stage=-1
 stop_stage=-1
@@ -38,7 +38,7 @@ else
 fi
 
 echo "preprocessing_path $preprocessing_path"
-preproc_name=$(basename $preprocessing_path .pkl)
+preproc_name=$(basename $preprocessing_path .npz)
 echo "preproc_name $preproc_name"
 
 
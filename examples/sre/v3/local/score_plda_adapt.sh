@@ -23,7 +23,7 @@ enroll_scp=sre16/eval/enrollment/xvector.scp
 test_scp=sre16/eval/test/xvector.scp
 indomain_scp=sre16/major/xvector.scp    # For adaptation
 utt2spk=data/sre16/eval/enrollment/utt2spk
-preprocessing_path=${exp_dir}/embd_proc_sre16_major.pkl
+preprocessing_path=${exp_dir}/embd_proc_sre16_major.npz
 
 stage=-1
 stop_stage=-1
@@ -37,7 +37,7 @@ else
     sre_plda_data=sre_aug
 fi
 
-preproc_name=$(basename $preprocessing_path .pkl)
+preproc_name=$(basename $preprocessing_path .npz)
 
 if [ ${stage} -le 1 ] && [ ${stop_stage} -ge 1 ]; then
     echo "Applying preprocessing on evaluation and adaptation data."
@@ -319,7 +319,7 @@ if [ ${stage} -le 7 ] && [ ${stop_stage} -ge 7 ]; then
   utt2spk=${data}/cts_aug/utt2spk
   lda_dim=100
   preprocessing_chain="mean-subtract --scp $mean1_scp | length-norm | lda --scp $lda_scp --utt2spk $utt2spk --dim $lda_dim | length-norm"
-  preprocessing_path_cts_aug=${exp_dir}/embd_proc_cts_aug.pkl
+  preprocessing_path_cts_aug=${exp_dir}/embd_proc_cts_aug.npz
 
   # Run stage 1-6 here to train the embedding preprocessing chain and the PLDA model as well
   # as to evaluate SRE16 which is the default set to evaluate if no eval set is provided.
@@ -353,7 +353,7 @@ if [ ${stage} -le 7 ] && [ ${stop_stage} -ge 7 ]; then
   # but we do need to update the embedding preprocessing chain.
   mean1_scp=${exp_dir}/embeddings/sre16/major/xvector.scp
   new_link="mean-subtract --scp $mean1_scp "
-  preprocessing_path_sre16_major=${exp_dir}/embd_proc_sre16_major.pkl
+  preprocessing_path_sre16_major=${exp_dir}/embd_proc_sre16_major.npz
 
   # The following command replaces link 0 (cts_aug mean subtraction) with a new link (sre16 major mean subtraction)
   python wespeaker/bin/update_embd_proc.py --in_path $preprocessing_path_cts_aug --out_path $preprocessing_path_sre16_major --link_no_to_remove 0 --new_link "$new_link"
@@ -370,7 +370,7 @@ if [ ${stage} -le 7 ] && [ ${stop_stage} -ge 7 ]; then
   # Similarly for SRE18
   mean1_scp=${exp_dir}/embeddings/sre18/dev/unlabeled/xvector.scp
   new_link="mean-subtract --scp $mean1_scp "
-  preprocessing_path_sre18_unlab=${exp_dir}/embd_proc_sre18_dev_unlabeled.pkl
+  preprocessing_path_sre18_unlab=${exp_dir}/embd_proc_sre18_dev_unlabeled.npz
 
   python wespeaker/bin/update_embd_proc.py --in_path $preprocessing_path_cts_aug --out_path $preprocessing_path_sre18_unlab --link_no_to_remove 0 --new_link "$new_link"
 
@@ -408,11 +408,11 @@ if [ ${stage} -le 8 ] && [ ${stop_stage} -ge 8 ]; then
       --stage 1 --stop-stage 4 \
       --data ${data} \
       --exp_dir $exp_dir \
-      --preprocessing_path ${exp_dir}/embd_proc_sre16_major.pkl \
+      --preprocessing_path ${exp_dir}/embd_proc_sre16_major.npz \
       --aug_plda_data ${aug_plda_data}
   }
 
-  preprocessing_path_sre18_unlab=${exp_dir}/embd_proc_sre18_dev_unlabeled.pkl
+  preprocessing_path_sre18_unlab=${exp_dir}/embd_proc_sre18_dev_unlabeled.npz
   echo "### --- Mean: SRE18 Unlabeled --- ###"
   # Stage 1 is only needed to be run once per domain so we could have set stage 1-4 for
   # sre18_eval and stage 1,3,4 for sre18_dev but since stage 2 is very fast we keep it
@@ -42,16 +42,13 @@ fi
 if [ ${stage} -le 2 ] && [ ${stop_stage} -ge 2 ]; then
   echo "compute metrics (EER/minDCF) ..."
   scores_dir=${exp_dir}/scores
-  for x in $trials; do
-    python wespeaker/bin/compute_metrics.py \
-        --p_target 0.01 \
-        --c_fa 1 \
-        --c_miss 1 \
-        ${scores_dir}/${x}.score \
-        2>&1 | tee -a ${scores_dir}/vox1_cos_result
-
-    echo "compute DET curve ..."
-    python wespeaker/bin/compute_det.py \
-        ${scores_dir}/${x}.score
-  done
+  # all the trial lists at once, the DET curves from the same pass
+  python wespeaker/bin/compute_metrics.py \
+      --p_target 0.01 \
+      --c_fa 1 \
+      --c_miss 1 \
+      $(for x in $trials; do echo ${scores_dir}/${x}.score; done) \
+      --det True \
+      --num_workers 3 \
+      2>&1 | tee -a ${scores_dir}/vox1_cos_result
 fi
@@ -17,40 +17,48 @@ import kaldiio
 import os
 import numpy as np
 
-from tqdm import tqdm
+from wespeaker.utils.embedding_aggregation import read_spk2utt, \
+    speaker_means
+from wespeaker.utils.embedding_store import EmbeddingStoreWriter
 from wespeaker.utils.utils import validate_path
 
 
-def compute_vector_mean(spk2utt, xvector_scp, spk_xvector_ark):
-    # read spk2utt
-    spk2utt_dict = {}
-    with open(spk2utt, 'r', encoding='utf-8') as fin:
-        lines = fin.readlines()
-        for line in lines:
-            line = line.strip().split(' ')
-            spk2utt_dict[line[0]] = line[1:]
+def compute_vector_mean(spk2utt,
+                        xvector_scp,
+                        spk_xvector_ark='',
+                        spk_xvector_store='',
+                        length_norm=False,
+                        batch_size=100000):
+    spk2utt_dict = read_spk2utt(spk2utt)
+    utt2spk = {
+        utt: spk
+        for spk, utts in spk2utt_dict.items()
+        for utt in utts
+    }
 
-    utt2embs = {}
-    for utt, emb in kaldiio.load_scp_sequential(xvector_scp):
-        utt2embs[utt] = emb
+    # kaldi scp or embedding store, one streaming pass
+    spks, means, counts = speaker_means(xvector_scp,
+                                        utt2spk,
+                                        spks=list(spk2utt_dict.keys()),
+                                        length_norm=length_norm,
+                                        batch_size=batch_size)
+    num_missing = sum(len(spk2utt_dict[spk]) for spk in spks) - counts.sum()
+    if num_missing > 0:
+        print('Warning: {} utterances of {} are missing in {}'.format(
+            num_missing, spk2utt, xvector_scp))
+    means = means.astype(np.float32)
 
-    validate_path(spk_xvector_ark)
-    spk_xvector_ark = os.path.abspath(spk_xvector_ark)
-    spk_xvector_scp = spk_xvector_ark[:-3] + "scp"
-    with kaldiio.WriteHelper('ark,scp:' + spk_xvector_ark + "," +
-                             spk_xvector_scp) as writer:
-        for spk in tqdm(spk2utt_dict.keys()):
-            utts = spk2utt_dict[spk]
-            mean_vec = None
-            utt_num = 0
-            for utt in utts:
-                vec = utt2embs[utt]
-                if mean_vec is None:
-                    mean_vec = np.zeros_like(vec)
-                mean_vec += vec
-                utt_num += 1
-            mean_vec = mean_vec / utt_num
-            writer(spk, mean_vec)
+    if spk_xvector_ark:
+        validate_path(spk_xvector_ark)
+        spk_xvector_ark = os.path.abspath(spk_xvector_ark)
+        spk_xvector_scp = spk_xvector_ark[:-3] + "scp"
+        with kaldiio.WriteHelper('ark,scp:' + spk_xvector_ark + "," +
+                                 spk_xvector_scp) as writer:
+            for spk, mean_vec in zip(spks, means):
+                writer(spk, mean_vec)
+    if spk_xvector_store:
+        with EmbeddingStoreWriter(spk_xvector_store) as writer:
+            writer.write_batch(spks, means)
 
 
 if __name__ == '__main__':
@@ -59,8 +67,23 @@ if __name__ == '__main__':
     parser.add_argument('--xvector_scp',
                         type=str,
                         default='',
-                        help='xvector file (kaldi format)')
+                        help='xvector file (kaldi format) or embedding '
+                        'store')
     parser.add_argument('--spk_xvector_ark', type=str, default='')
+    parser.add_argument('--spk_xvector_store',
+                        type=str,
+                        default='',
+                        help='optional embedding store of the speaker means')
+    parser.add_argument('--length_norm',
+                        action='store_true',
+                        help='length normalize the embeddings before the '
+                        'means')
+    parser.add_argument('--batch_size',
+                        type=int,
+                        default=100000,
+                        help='number of embeddings read at a time')
     args = parser.parse_args()
 
-    compute_vector_mean(args.spk2utt, args.xvector_scp, args.spk_xvector_ark)
+    compute_vector_mean(args.spk2utt, args.xvector_scp, args.spk_xvector_ark,
+                        args.spk_xvector_store, args.length_norm,
+                        args.batch_size)
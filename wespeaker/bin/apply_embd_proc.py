@@ -16,6 +16,8 @@ import argparse
 import kaldiio
 import numpy as np
 from wespeaker.utils.embedding_processing import EmbeddingProcessingChain
+from wespeaker.utils.embedding_store import EmbeddingStoreWriter, \
+    load_embeddings
 
 if __name__ == '__main__':
     """
@@ -29,28 +31,25 @@ if __name__ == '__main__':
     parser.add_argument('--input',
                         type=str,
                         default='',
-                        help='Input scp file.')
+                        help='Input scp file or embedding store.')
     parser.add_argument('--output',
                         type=str,
                         default='',
-                        help='Output scp/ark file.')
+                        help='Output scp/ark file or embedding store '
+                        '(.store).')
     args = parser.parse_args()
 
     processingChain = EmbeddingProcessingChain()
     processingChain.load(args.path)
 
-    embd = []
-    utt = []
-    for k, v in kaldiio.load_scp_sequential(args.input):
-        utt.append(k)
-        embd.append(v)
-    embd = np.array(embd)
+    utt, embd = load_embeddings(args.input)
     utt = np.array(utt)
 
     print("Read {} embeddings of dimension {}.".format(embd.shape[0],
                                                        embd.shape[1]))
 
-    embd = processingChain(embd)
+    # the loaded embeddings are not needed after the processing
+    embd = processingChain(embd, inplace=True)
 
     # Store both ark and scp if extention '.ark,scp' or '.scp,ark'. Or, only
     # ark if extension is '.ark'
@@ -64,6 +63,10 @@ if __name__ == '__main__':
                 e = embd[i]
                 writer(u, e)
 
+    elif output_file.endswith('.store'):
+        with EmbeddingStoreWriter(output_file) as writer:
+            writer.write_batch(utt, embd)
+
     elif output_file.endswith('ark'):
         with kaldiio.WriteHelper('ark:' + output_file) as writer:
             for i, u in enumerate(utt):
@@ -0,0 +1,99 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Report the training memory and throughput with and without
+`gradient_checkpointing` in model_args.
+
+Peak memory is only available on GPU (torch.cuda.max_memory_allocated).
+
+Example:
+    python wespeaker/bin/benchmark_checkpointing.py \
+        --models ResNet221,ResNet293,ERes2Net34_Large,ReDimNetB2 \
+        --batch_size 128 --num_frms 600
+"""
+
+import argparse
+import time
+
+import torch
+
+from wespeaker.models.speaker_model import get_speaker_model
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='benchmark activation checkpointing')
+    parser.add_argument('--models',
+                        default='ResNet221,ResNet293,ERes2Net34_Large,'
+                        'ReDimNetB2',
+                        help='comma separated model names')
+    parser.add_argument('--feat_dim', default=72, type=int)
+    parser.add_argument('--embed_dim', default=256, type=int)
+    parser.add_argument('--batch_size', default=64, type=int)
+    parser.add_argument('--num_frms', default=200, type=int)
+    parser.add_argument('--warmup', default=3, type=int)
+    parser.add_argument('--steps', default=10, type=int)
+    args = parser.parse_args()
+    return args
+
+
+def bench(model, args, device):
+    model.to(device).train()
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01, momentum=0.9)
+    feats = torch.randn(args.batch_size, args.num_frms,
+                        args.feat_dim).to(device)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    for i in range(args.warmup + args.steps):
+        if i == args.warmup:
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.time()
+        outputs = model(feats)
+        embeds = outputs[-1] if isinstance(outputs, tuple) else outputs
+        loss = embeds.pow(2).mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    peak_mem = 'n/a'
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        peak_mem = '{:.0f}'.format(torch.cuda.max_memory_allocated() / 2**20)
+    steps_per_sec = args.steps / (time.time() - start)
+    return steps_per_sec, peak_mem
+
+
+def main():
+    args = get_args()
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    print('| model | checkpointing | steps/s | peak memory (MB) |')
+    print('| --- | --- | --- | --- |')
+    for model_name in args.models.split(','):
+        for gradient_checkpointing in [False, True]:
+            model = get_speaker_model(model_name)(
+                feat_dim=args.feat_dim,
+                embed_dim=args.embed_dim,
+                gradient_checkpointing=gradient_checkpointing)
+            steps_per_sec, peak_mem = bench(model, args, device)
+            print('| {} | {} | {:.2f} | {} |'.format(model_name,
+                                                     gradient_checkpointing,
+                                                     steps_per_sec, peak_mem))
+            del model
+            if device.type == 'cuda':
+                torch.cuda.empty_cache()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare eager, torch.jit.script and torch.compile execution of the
+speaker models, for training steps/s and extraction utts/s.
+
+The embedding agreement with the eager model is reported as a cheap
+accuracy check. For the EER of each mode, train/extract with
+`compile: True` (`extract_compile: True`) in the recipe and score as usual.
+
+Example:
+    python wespeaker/bin/benchmark_compile.py \
+        --models ResNet34,ECAPA_TDNN_GLOB_c512,CAMPPlus \
+        --modes eager,script,compile --amp_dtype bfloat16
+"""
+
+import argparse
+import copy
+import time
+
+import torch
+
+from wespeaker.models.projections import get_projection
+from wespeaker.models.speaker_model import get_speaker_model
+from wespeaker.utils.utils import compile_model, get_amp_dtype
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='benchmark eager/script/compile speaker models')
+    parser.add_argument('--models',
+                        default='ResNet34,ECAPA_TDNN_GLOB_c512,CAMPPlus',
+                        help='comma separated model names')
+    parser.add_argument('--modes',
+                        default='eager,script,compile',
+                        help='comma separated modes: eager, script, compile,'
+                        ' the first one is the embedding reference')
+    parser.add_argument('--feat_dim', default=80, type=int)
+    parser.add_argument('--embed_dim', default=256, type=int)
+    parser.add_argument('--num_class', default=5994, type=int)
+    parser.add_argument('--batch_size', default=64, type=int)
+    parser.add_argument('--num_frms', default=200, type=int)
+    parser.add_argument('--test_frms',
+                        default='300,500,1000',
+                        help='comma separated frame numbers for extraction,'
+                        ' variable lengths exercise the dynamic shapes')
+    parser.add_argument('--amp_dtype',
+                        default=None,
+                        help='float16 or bfloat16, None for fp32')
+    parser.add_argument('--warmup', default=5, type=int)
+    parser.add_argument('--steps', default=20, type=int)
+    args = parser.parse_args()
+    return args
+
+
+def build_model(model_name, feat_dim, embed_dim, num_class):
+    model = get_speaker_model(model_name)(feat_dim=feat_dim,
+                                          embed_dim=embed_dim)
+    projection = get_projection({
+        'project_type': 'arc_margin',
+        'embed_dim': embed_dim,
+        'num_class': num_class,
+        'scale': 32.0,
+        'easy_margin': False
+    })
+    model.add_module('projection', projection)
+    return model
+
+
+def prepare_model(base_model, mode, **compile_args):
+    model = copy.deepcopy(base_model)
+    if mode == 'script':
+        model = torch.jit.script(model)
+    elif mode == 'compile':
+        # do not let the shapes seen by a previous run leak into this one
+        torch._dynamo.reset()
+        compile_model(model, **compile_args)
+    return model
+
+
+def sync(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def bench_train(model, args, device, amp_dtype):
+    model.train()
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01, momentum=0.9)
+    criterion = torch.nn.CrossEntropyLoss()
+    feats = torch.randn(args.batch_size, args.num_frms,
+                        args.feat_dim).to(device)
+    targets = torch.randint(0, args.num_class, (args.batch_size, )).to(device)
+    for i in range(args.warmup + args.steps):
+        if i == args.warmup:
+            sync(device)
+            start = time.time()
+        with torch.autocast(device.type,
+                            enabled=amp_dtype is not None,
+                            dtype=amp_dtype or torch.float16):
+            outputs = model(feats)
+            embeds = outputs[-1] if isinstance(outputs, tuple) else outputs
+            outputs = model.projection(embeds, targets)
+            loss = criterion(outputs, targets)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+    sync(device)
+    return args.steps / (time.time() - start)
+
+
+def bench_extract(model, args, device, amp_dtype):
+    model.eval()
+    test_frms = [int(x) for x in args.test_frms.split(',')]
+    embeds_list = []
+    num_utts = 0
+    with torch.no_grad():
+        for i in range(args.warmup + args.steps):
+            if i == args.warmup:
+                sync(device)
+                start = time.time()
+                num_utts = 0
+            torch.manual_seed(i % len(test_frms))
+            feats = torch.randn(1, test_frms[i % len(test_frms)],
+                                args.feat_dim).to(device)
+            with torch.autocast(device.type,
+                                enabled=amp_dtype is not None,
+                                dtype=amp_dtype or torch.float16):
+                outputs = model(feats)
+            embeds = outputs[-1] if isinstance(outputs, tuple) else outputs
+            if i < len(test_frms):
+                embeds_list.append(embeds.float())
+            num_utts += 1
+    sync(device)
+    return num_utts / (time.time() - start), torch.cat(embeds_list)
+
+
+def main():
+    args = get_args()
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    amp_dtype = get_amp_dtype(args.amp_dtype) if args.amp_dtype else None
+    modes = args.modes.split(',')
+
+    print('| model | mode | train steps/s | extract utts/s | min cos to ref |')
+    print('| --- | --- | --- | --- | --- |')
+    for model_name in args.models.split(','):
+        torch.manual_seed(0)
+        base_model = build_model(model_name, args.feat_dim, args.embed_dim,
+                                 args.num_class)
+        ref_embeds = None
+        for mode in modes:
+            # extraction mirrors bin/extract.py (dynamic T), training mirrors
+            # bin/train.py (fixed num_frms, default compile args)
+            model = prepare_model(base_model, mode, dynamic=True).to(device)
+            utts_per_sec, embeds = bench_extract(model, args, device,
+                                                 amp_dtype)
+            if ref_embeds is None:
+                ref_embeds = embeds
+            cos = torch.nn.functional.cosine_similarity(
+                embeds, ref_embeds).min().item()
+            model = prepare_model(base_model, mode).to(device)
+            steps_per_sec = bench_train(model, args, device, amp_dtype)
+            print('| {} | {} | {:.2f} | {:.2f} | {:.5f} |'.format(
+                model_name, mode, steps_per_sec, utts_per_sec, cos))
+
+
+if __name__ == '__main__':
+    main()
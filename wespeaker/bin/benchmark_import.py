@@ -0,0 +1,109 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Import time regression check of the wespeaker entry points.
+
+Each statement runs in a fresh interpreter, the median wall time over
+--repeats runs is reported together with the heavy modules it loaded. It
+fails (exit code 1) if a statement loads a module that it must not load,
+e.g. umap/hdbscan for the speaker embedding CLI, or takes longer than
+--max_seconds.
+
+Example:
+    python wespeaker/bin/benchmark_import.py --repeats 5 --max_seconds 3
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+# the optional dependencies that are only needed by some tasks/models
+HEAVY_MODULES = [
+    'silero_vad', 'umap', 'hdbscan', 'numba', 'kaldiio', 'onnxruntime',
+    'whisper', 's3prl', 'sklearn', 'matplotlib'
+]
+
+# (name, statement, modules that must not be loaded)
+CHECKS = [
+    ('import wespeaker', 'import wespeaker', HEAVY_MODULES),
+    ('import cli.speaker', 'import wespeaker.cli.speaker', HEAVY_MODULES),
+    ('build ResNet34', 'from wespeaker.models.speaker_model import '
+     'get_speaker_model; get_speaker_model("ResNet34")(feat_dim=80, '
+     'embed_dim=256)', HEAVY_MODULES + [
+         'wespeaker.models.redimnet', 'wespeaker.models.whisper_PMFA',
+         'wespeaker.models.campplus'
+     ]),
+    ('build CAMPPlus', 'from wespeaker.models.speaker_model import '
+     'get_speaker_model; get_speaker_model("CAMPPlus")(feat_dim=80, '
+     'embed_dim=192)', HEAVY_MODULES + [
+         'wespeaker.models.redimnet', 'wespeaker.models.whisper_PMFA',
+         'wespeaker.models.resnet'
+     ]),
+]
+
+_RUNNER = '''
+import json, sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": sorted(sys.modules)}}))
+'''
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='benchmark import time')
+    parser.add_argument('--repeats', default=3, type=int)
+    parser.add_argument('--max_seconds',
+                        default=None,
+                        type=float,
+                        help='fail if a statement takes longer')
+    args = parser.parse_args()
+    return args
+
+
+def run(statement):
+    output = subprocess.run(
+        [sys.executable, '-c',
+         _RUNNER.format(statement=statement)],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+    return json.loads(output.strip().split('\n')[-1])
+
+
+def main():
+    args = get_args()
+    failed = False
+    print('| statement | median import (s) | heavy modules loaded |')
+    print('| --- | --- | --- |')
+    for name, statement, forbidden in CHECKS:
+        results = [run(statement) for _ in range(args.repeats)]
+        seconds = sorted(r['seconds'] for r in results)[len(results) // 2]
+        modules = set(results[-1]['modules'])
+        loaded = [m for m in HEAVY_MODULES if m in modules]
+        print('| {} | {:.3f} | {} |'.format(name, seconds,
+                                            ', '.join(loaded) or '-'))
+        unexpected = [m for m in forbidden if m in modules]
+        if unexpected:
+            print('[error] {} loads {}'.format(name, ', '.join(unexpected)))
+            failed = True
+        if args.max_seconds is not None and seconds > args.max_seconds:
+            print('[error] {} takes more than {} s'.format(
+                name, args.max_seconds))
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Inference cost of the speaker models on CPU, to compare the backbones and
+to track them across releases.
+
+For each model and each mode (eager, script: torch.jit.script, onnx:
+onnxruntime on the export of torch.onnx.export) it reports the parameters,
+the MACs of a 1 s input (torch.utils.flop_counter, torch>=2.1), the latency
+at batch 1 for inputs of 1/3/10/60 s, the throughput at batch 64 and the
+peak RSS. Each (model, mode) runs in a fresh process, so that the peak RSS
+is not inherited from the previous runs.
+
+Example:
+    python wespeaker/bin/benchmark_models.py \
+        --models ResNet34,ECAPA_TDNN_GLOB_c512,CAMPPlus \
+        --output_json benchmark.json --output_md benchmark.md
+
+    # the model and model_args of recipe configs
+    python wespeaker/bin/benchmark_models.py \
+        --configs conf/resnet.yaml,conf/campplus.yaml
+"""
+
+import argparse
+import inspect
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from queue import Empty
+
+import torch
+import yaml
+
+from wespeaker.models.speaker_model import get_speaker_model
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='benchmark the inference cost of speaker models')
+    parser.add_argument('--models',
+                        default='',
+                        help='comma separated model names')
+    parser.add_argument('--configs',
+                        default='',
+                        help='comma separated config files, model and '
+                        'model_args are used')
+    parser.add_argument('--modes',
+                        default='eager,script,onnx',
+                        help='comma separated modes: eager, script, onnx')
+    parser.add_argument('--feat_dim', default=80, type=int)
+    parser.add_argument('--embed_dim', default=256, type=int)
+    parser.add_argument('--durations',
+                        default='1,3,10,60',
+                        help='comma separated seconds for the latency')
+    parser.add_argument('--batch_size',
+                        default=64,
+                        type=int,
+                        help='batch size for the throughput')
+    parser.add_argument('--throughput_duration',
+                        default=2.0,
+                        type=float,
+                        help='seconds of each utterance for the throughput')
+    parser.add_argument('--num_threads', default=1, type=int)
+    parser.add_argument('--warmup', default=2, type=int)
+    parser.add_argument('--repeats', default=5, type=int)
+    parser.add_argument('--timeout',
+                        default=3600,
+                        type=float,
+                        help='seconds allowed for one model and mode')
+    parser.add_argument('--output_json', default=None, help='json output')
+    parser.add_argument('--output_md', default=None, help='markdown output')
+    args = parser.parse_args()
+    return args
+
+
+def num_frames(seconds, frame_shift=10, frame_length=25):
+    """ kaldi fbank frames of a 16k waveform
+    """
+    return int(1 + (seconds * 1000 - frame_length) // frame_shift)
+
+
+def count_macs(model, feats):
+    try:
+        from torch.utils.flop_counter import FlopCounterMode
+    except ImportError:
+        return None
+    with FlopCounterMode(display=False) as counter:
+        with torch.no_grad():
+            model(feats)
+    return counter.get_total_flops() // 2
+
+
+def peak_rss_mb():
+    # kilobytes on linux, bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+class EmbeddingModel(torch.nn.Module):
+    """ feats => embeds, the same wrapper as export_onnx.py
+    """
+
+    def __init__(self, model):
+        super(EmbeddingModel, self).__init__()
+        self.model = model
+
+    def forward(self, feats):
+        outputs = self.model(feats)
+        return outputs[-1] if isinstance(outputs, tuple) else outputs
+
+
+def build_runner(model, mode, feat_dim, num_threads, tmp_dir):
+    if mode == 'eager':
+        return lambda feats: model(feats)
+    if mode == 'script':
+        script_model = torch.jit.script(model)
+        return lambda feats: script_model(feats)
+    assert mode == 'onnx', 'unknown mode {}'.format(mode)
+    import onnxruntime as ort
+    onnx_path = os.path.join(tmp_dir, 'model.onnx')
+    export_args = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # the torchscript exporter, as export_onnx.py with older torch
+        export_args['dynamo'] = False
+    torch.onnx.export(model,
+                      torch.ones(1, 200, feat_dim),
+                      onnx_path,
+                      do_constant_folding=True,
+                      opset_version=14,
+                      input_names=['feats'],
+                      output_names=['embs'],
+                      dynamic_axes={
+                          'feats': {
+                              0: 'B',
+                              1: 'T'
+                          },
+                          'embs': {
+                              0: 'B'
+                          }
+                      },
+                      **export_args)
+    so = ort.SessionOptions()
+    so.inter_op_num_threads = 1
+    so.intra_op_num_threads = num_threads
+    session = ort.InferenceSession(onnx_path, sess_options=so)
+    return lambda feats: session.run(['embs'], {'feats': feats.numpy()})
+
+
+def timeit(runner, feats, warmup, repeats):
+    """ Average seconds of one forward
+    """
+    for _ in range(warmup):
+        runner(feats)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        runner(feats)
+    return (time.perf_counter() - start) / repeats
+
+
+def benchmark(name, model_args, mode, args):
+    torch.set_num_threads(args.num_threads)
+    torch.manual_seed(0)
+    feat_dim = model_args['feat_dim']
+    model = EmbeddingModel(get_speaker_model(name)(**model_args)).eval()
+    result = {
+        'model': name,
+        'mode': mode,
+        'params_m': sum(p.numel() for p in model.parameters()) / 1e6,
+        'threads': args.num_threads,
+    }
+    feats = torch.randn(1, num_frames(1.0), feat_dim)
+    macs = count_macs(model, feats)
+    result['gmacs_1s'] = None if macs is None else macs / 1e9
+    with tempfile.TemporaryDirectory() as tmp_dir, torch.no_grad():
+        runner = build_runner(model, mode, feat_dim, args.num_threads,
+                              tmp_dir)
+        for seconds in args.durations.split(','):
+            feats = torch.randn(1, num_frames(float(seconds)), feat_dim)
+            latency = timeit(runner, feats, args.warmup, args.repeats)
+            result['latency_ms_{}s'.format(seconds)] = latency * 1000
+        feats = torch.randn(args.batch_size,
+                            num_frames(args.throughput_duration), feat_dim)
+        latency = timeit(runner, feats, 1, max(args.repeats // 2, 1))
+        result['throughput_utts_per_s'] = args.batch_size / latency
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def _worker(queue, name, model_args, mode, args):
+    try:
+        queue.put(benchmark(name, model_args, mode, args))
+    except Exception as e:
+        # the first line only, e.g. the models that are not scriptable
+        error = '{}: {}'.format(type(e).__name__,
+                                str(e).strip().split('\n')[0])
+        queue.put({'model': name, 'mode': mode, 'error': error})
+
+
+def run_isolated(name, model_args, mode, args):
+    """ Benchmark in a fresh process, a crash (e.g. killed on OOM) or a
+        run longer than args.timeout seconds is reported as an error
+    """
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_worker,
+                          args=(queue, name, model_args, mode, args))
+    process.start()
+    start = time.time()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1.0)
+        except Empty:
+            if not process.is_alive():
+                # it may have put its result just before exiting
+                try:
+                    result = queue.get(timeout=1.0)
+                except Empty:
+                    error = 'process exited with code {}'.format(
+                        process.exitcode)
+                    result = {'model': name, 'mode': mode, 'error': error}
+            elif time.time() - start > args.timeout:
+                process.terminate()
+                error = 'timeout after {} s'.format(args.timeout)
+                result = {'model': name, 'mode': mode, 'error': error}
+    process.join()
+    return result
+
+
+def to_markdown(results, durations, batch_size):
+    durations = durations.split(',')
+    header = ['model', 'mode', 'params (M)', 'GMACs (1 s)'] + \
+        ['{} s (ms)'.format(d) for d in durations] + \
+        ['utts/s (batch {})'.format(batch_size), 'peak RSS (MB)']
+    lines = [
+        '| ' + ' | '.join(header) + ' |',
+        '| ' + ' | '.join(['---'] * len(header)) + ' |'
+    ]
+    for r in results:
+        if 'error' in r:
+            row = [r['model'], r['mode'], r['error']] + \
+                [''] * (len(header) - 3)
+        else:
+            row = [
+                r['model'], r['mode'], '{:.2f}'.format(r['params_m']),
+                'n/a' if r['gmacs_1s'] is None else '{:.2f}'.format(
+                    r['gmacs_1s'])
+            ]
+            row += [
+                '{:.1f}'.format(r['latency_ms_{}s'.format(d)])
+                for d in durations
+            ]
+            row += [
+                '{:.1f}'.format(r['throughput_utts_per_s']),
+                '{:.0f}'.format(r['peak_rss_mb'])
+            ]
+        lines.append('| ' + ' | '.join(row) + ' |')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    args = get_args()
+    models = []
+    for name in filter(None, args.models.split(',')):
+        models.append((name, {
+            'feat_dim': args.feat_dim,
+            'embed_dim': args.embed_dim
+        }))
+    for config in filter(None, args.configs.split(',')):
+        with open(config, 'r') as fin:
+            configs = yaml.load(fin, Loader=yaml.FullLoader)
+        models.append((configs['model'], configs['model_args']))
+    assert len(models) > 0, 'no models given by --models or --configs'
+
+    results = []
+    for name, model_args in models:
+        for mode in args.modes.split(','):
+            result = run_isolated(name, model_args, mode, args)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+
+    markdown = to_markdown(results, args.durations, args.batch_size)
+    print(markdown)
+    if args.output_json:
+        with open(args.output_json, 'w') as fout:
+            json.dump(
+                {
+                    'torch': torch.__version__,
+                    'num_threads': args.num_threads,
+                    'batch_size': args.batch_size,
+                    'results': results
+                },
+                fout,
+                indent=2)
+    if args.output_md:
+        with open(args.output_md, 'w') as fout:
+            fout.write(markdown)
+
+
+if __name__ == '__main__':
+    main()
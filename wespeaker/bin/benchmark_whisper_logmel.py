@@ -0,0 +1,82 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare the batched whisper log-mel (LogMelSpectrogram) with the per
+utterance whisper.log_mel_spectrogram loop, speed and max abs difference.
+
+Example:
+    python wespeaker/bin/benchmark_whisper_logmel.py --batch_size 128
+"""
+
+import argparse
+import time
+
+import torch
+import whisper
+
+from wespeaker.frontend.whisper_encoder import LogMelSpectrogram
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='benchmark whisper log-mel')
+    parser.add_argument('--batch_size', default=128, type=int)
+    parser.add_argument('--seconds', default='2,3,10', help='chunk lengths')
+    parser.add_argument('--n_mels', default=128, type=int)
+    parser.add_argument('--repeats', default=10, type=int)
+    parser.add_argument('--device',
+                        default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+    return args
+
+
+def loop_log_mel(wavs, n_mels):
+    return torch.stack([
+        whisper.log_mel_spectrogram(wav, n_mels=n_mels) for wav in wavs
+    ])
+
+
+def timeit(func, repeats, device):
+    func()  # warmup
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(repeats):
+        func()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.time() - start) / repeats * 1000
+
+
+def main():
+    args = get_args()
+    device = torch.device(args.device)
+    log_mel = LogMelSpectrogram(args.n_mels).to(device)
+
+    print('| seconds | loop (ms) | batched (ms) | speedup | max abs diff |')
+    print('| --- | --- | --- | --- | --- |')
+    for seconds in args.seconds.split(','):
+        wavs = torch.randn(args.batch_size,
+                           int(float(seconds) * 16000),
+                           device=device)
+        with torch.no_grad():
+            diff = (loop_log_mel(wavs, args.n_mels) -
+                    log_mel(wavs)).abs().max().item()
+            loop_ms = timeit(lambda: loop_log_mel(wavs, args.n_mels),
+                             args.repeats, device)
+            batched_ms = timeit(lambda: log_mel(wavs), args.repeats, device)
+        print('| {} | {:.2f} | {:.2f} | {:.2f}x | {:.2e} |'.format(
+            seconds, loop_ms, batched_ms, loop_ms / batched_ms, diff))
+
+
+if __name__ == '__main__':
+    main()
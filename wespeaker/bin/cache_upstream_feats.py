@@ -0,0 +1,133 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Fill the frozen upstream feature cache offline, with every chunk on the
+grid of processor.grid_random_chunk of every training utterance, so that
+training reads all of its upstream features from the cache from the first
+epoch on. It takes the training config, several processes can fill the
+same cache with different shard_id.
+
+Example:
+    python wespeaker/bin/cache_upstream_feats.py \
+        --config conf/ecapa_tdnn_WavLM_frozen.yaml \
+        --train_data data/vox2_dev/shard.list --data_type shard \
+        --num_shards 8 --shard_id 0 --gpu 0
+"""
+
+import copy
+
+import fire
+import torch
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+from wespeaker.dataset.dataset import Dataset
+from wespeaker.dataset.processor import cache_chunk_offsets
+from wespeaker.frontend import *
+from wespeaker.frontend.feature_cache import UpstreamFeatureCache
+from wespeaker.utils.utils import parse_config_or_kwargs
+
+
+def grid_chunks(wav, chunk_len, num_chunks, step):
+    """ All the (offset, chunk) that grid_random_chunk can produce
+    """
+    if len(wav) <= chunk_len:
+        repeat_factor = chunk_len // len(wav) + 1
+        return [(0, wav.repeat(repeat_factor)[:chunk_len])]
+    return [(offset, wav[offset:offset + chunk_len])
+            for offset in cache_chunk_offsets(len(wav), chunk_len,
+                                              num_chunks, step)]
+
+
+def cache_upstream_feats(config='conf/config.yaml', **kwargs):
+    configs = parse_config_or_kwargs(config, **kwargs)
+    num_shards = configs.get('num_shards', 1)
+    shard_id = configs.get('shard_id', 0)
+    batch_size = configs.get('cache_batch_size', 64)
+    device = torch.device('cuda:{}'.format(configs.get('gpu', 0))
+                          if torch.cuda.is_available() else 'cpu')
+
+    dataset_conf = copy.deepcopy(configs['dataset_args'])
+    frontend_type = dataset_conf['frontend']
+    frontend_args = frontend_type + '_args'
+    assert dataset_conf[frontend_args].get('frozen', False)
+    frontend = frontend_class_dict[frontend_type](
+        **dataset_conf[frontend_args],
+        sample_rate=dataset_conf['resample_rate'])
+    frontend.to(device).eval()
+
+    cache_args = dataset_conf['feature_cache_args']
+    cache = UpstreamFeatureCache(cache_args['cache_dir'],
+                                 dtype=cache_args.get('dtype', 'float16'),
+                                 map_size=cache_args.get('map_size', 2**42))
+    # the same chunk grid as wespeaker/dataset/dataset.py
+    resample_rate = dataset_conf['resample_rate']
+    frame_shift = dataset_conf[frontend_args].get('frame_shift', 10)
+    frame_length = dataset_conf[frontend_args].get('frame_length', 25)
+    chunk_len = ((dataset_conf.get('num_frms', 200) - 1) * frame_shift +
+                 frame_length) * resample_rate // 1000
+    num_chunks = cache_args.get('chunks_per_utt', 4)
+    step = frame_shift * resample_rate // 1000
+
+    # whole clean utterances, the same filter as in training
+    dataset_conf['shuffle'] = False
+    dataset_conf['speed_perturb'] = False
+    dataset_conf['aug_prob'] = 0.0
+    dataset_conf['feature_cache'] = False
+    dataset = Dataset(configs['data_type'],
+                      configs['train_data'],
+                      dataset_conf,
+                      spk2id_dict={},
+                      whole_utt=True,
+                      repeat_dataset=False)
+    dataloader = DataLoader(dataset,
+                            batch_size=None,
+                            num_workers=configs.get('num_workers', 4))
+
+    keys, chunks = [], []
+
+    def flush():
+        wavs = torch.stack(chunks).to(device)
+        wavs_len = torch.LongTensor([wavs.shape[1]]).repeat(
+            wavs.shape[0]).to(device)
+        with torch.no_grad():
+            feats = frontend.forward_upstream(wavs, wavs_len)
+        num_put = cache.put(keys, [cache.encode(feat) for feat in feats])
+        keys.clear()
+        chunks.clear()
+        return num_put
+
+    num_cached = 0
+    for i, sample in enumerate(tqdm(dataloader)):
+        if cache.full:
+            break
+        if i % num_shards != shard_id:
+            continue
+        for offset, chunk in grid_chunks(sample['wav'][0], chunk_len,
+                                         num_chunks, step):
+            key = cache.make_key(sample['key'], offset, chunk_len)
+            if key in cache:
+                continue
+            keys.append(key)
+            chunks.append(chunk.float())
+            if len(chunks) == batch_size:
+                num_cached += flush()
+    if len(chunks) > 0 and not cache.full:
+        num_cached += flush()
+    if cache.full:
+        print('Warning: {} is full, raise feature_cache_args.map_size to '
+              'cache the remaining chunks'.format(cache.cache_dir))
+    print('{} chunks cached in {}'.format(num_cached, cache.cache_dir))
+
+if __name__ == '__main__':
+    fire.Fire(cache_upstream_feats)
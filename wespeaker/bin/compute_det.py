@@ -14,24 +14,13 @@
 # limitations under the License.
 
 import fire
-import numpy as np
 
-from wespeaker.utils.score_metrics import compute_pmiss_pfa_rbst, plot_det_curve
+from wespeaker.utils.score_metrics import compute_pmiss_pfa_rbst, \
+    plot_det_curve, read_scores
 
 
 def compute_det(scores_file, det_file):
-    scores = []
-    labels = []
-
-    with open(scores_file) as readlines:
-        for line in readlines:
-            tokens = line.strip().split()
-            # assert len(tokens) == 4
-            scores.append(float(tokens[2]))
-            labels.append(tokens[3] == 'target')
-
-    scores = np.hstack(scores)
-    labels = np.hstack(labels)
+    scores, labels = read_scores(scores_file)
 
     fnr, fpr = compute_pmiss_pfa_rbst(scores, labels)
     plot_det_curve(fnr, fpr, det_file)
@@ -13,46 +13,85 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import concurrent.futures
 import os
 
 import fire
-import numpy as np
 
-from wespeaker.utils.score_metrics import (compute_pmiss_pfa_rbst, compute_eer,
-                                           compute_c_norm)
+from wespeaker.utils.score_metrics import (compute_all_metrics, read_scores,
+                                           plot_det_curve)
 
 
-def compute_metrics(scores_file, p_target=0.01, c_miss=1, c_fa=1):
-    scores = []
-    labels = []
+def compute_metrics(scores_file,
+                    p_target=0.01,
+                    c_miss=1,
+                    c_fa=1,
+                    llr=False,
+                    num_bootstrap=0,
+                    confidence=0.95,
+                    det=False):
+    """ Returns the report of scores_file, p_target is one value or a list.
+        llr: the scores are log-likelihood ratios, also report actDCF and
+            Cllr
+        num_bootstrap: number of resamplings of the trials for the
+            confidence intervals of EER and minDCF, 0 for none
+        det: also plot the DET curve into scores_file.det.png
+    """
+    p_targets = p_target if isinstance(p_target, (list, tuple)) \
+        else [p_target]
+    scores, labels = read_scores(scores_file)
+    results = compute_all_metrics(scores, labels, p_targets, c_miss, c_fa,
+                                  num_bootstrap, confidence)
 
-    with open(scores_file) as readlines:
-        for line in readlines:
-            tokens = line.strip().split()
-            # assert len(tokens) == 4
-            scores.append(float(tokens[2]))
-            labels.append(tokens[3] == 'target')
+    lines = ["---- {} -----".format(os.path.basename(scores_file))]
+    lines.append("EER = {0:.3f}".format(100 * results['eer']))
+    for i, p in enumerate(p_targets):
+        lines.append("minDCF (p_target:{} c_miss:{} c_fa:{}) = {:.3f}".format(
+            p, c_miss, c_fa, results['min_dcf'][i]))
+    if llr:
+        for i, p in enumerate(p_targets):
+            lines.append(
+                "actDCF (p_target:{} c_miss:{} c_fa:{}) = {:.3f}".format(
+                    p, c_miss, c_fa, results['act_dcf'][i]))
+        lines.append("Cllr = {:.3f}".format(results['cllr']))
+    if num_bootstrap > 0:
+        lines.append("EER {:g}% CI = [{:.3f}, {:.3f}]".format(
+            100 * confidence, *(100 * x for x in results['eer_ci'])))
+        for i, p in enumerate(p_targets):
+            lines.append("minDCF (p_target:{}) {:g}% CI = [{:.3f}, {:.3f}]"
+                         .format(p, 100 * confidence,
+                                 *results['min_dcf_ci'][i]))
+    if det:
+        # the same sort as the metrics, no second parse of the file
+        det_file = scores_file + ".det.png"
+        plot_det_curve(results['fnr'], results['fpr'], det_file)
+        lines.append("DET curve saved in {}".format(det_file))
+    return '\n'.join(lines)
 
-    scores = np.hstack(scores)
-    labels = np.hstack(labels)
 
-    fnr, fpr = compute_pmiss_pfa_rbst(scores, labels)
-    eer, thres = compute_eer(fnr, fpr, scores)
-
-    min_dcf = compute_c_norm(fnr,
-                             fpr,
-                             p_target=p_target,
-                             c_miss=c_miss,
-                             c_fa=c_fa)
-    print("---- {} -----".format(os.path.basename(scores_file)))
-    print("EER = {0:.3f}".format(100 * eer))
-    print("minDCF (p_target:{} c_miss:{} c_fa:{}) = {:.3f}".format(
-        p_target, c_miss, c_fa, min_dcf))
-
-
-def main(p_target=0.01, c_miss=1, c_fa=1, *scores_files):
-    for scores_file in scores_files:
-        compute_metrics(scores_file, p_target, c_miss, c_fa)
+def main(p_target=0.01,
+         c_miss=1,
+         c_fa=1,
+         *scores_files,
+         llr=False,
+         num_bootstrap=0,
+         confidence=0.95,
+         det=False,
+         num_workers=1):
+    # the score files are processed by num_workers processes, the reports
+    # are printed in the order of scores_files
+    args = (p_target, c_miss, c_fa, llr, num_bootstrap, confidence, det)
+    if num_workers <= 1 or len(scores_files) <= 1:
+        for scores_file in scores_files:
+            print(compute_metrics(scores_file, *args))
+        return
+    with concurrent.futures.ProcessPoolExecutor(num_workers) as executor:
+        futures = [
+            executor.submit(compute_metrics, scores_file, *args)
+            for scores_file in scores_files
+        ]
+        for future in futures:
+            print(future.result())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Convert embeddings between kaldi ark/scp and the memory-mapped embedding
+store (wespeaker/utils/embedding_store.py).
+
+Example:
+    # scp => store
+    python wespeaker/bin/convert_embeddings.py \
+        --input exp/xxx/embeddings/vox1/xvector.scp \
+        --output exp/xxx/embeddings/vox1/xvector.store --dtype float16
+
+    # store => ark,scp
+    python wespeaker/bin/convert_embeddings.py \
+        --input exp/xxx/embeddings/vox1/xvector.store \
+        --output exp/xxx/embeddings/vox1/xvector.ark
+"""
+
+import argparse
+import time
+
+from wespeaker.utils.embedding_store import is_embedding_store, \
+    scp_to_store, store_to_ark
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='convert embeddings between ark/scp and store')
+    parser.add_argument('--input',
+                        required=True,
+                        help='kaldi scp or embedding store directory')
+    parser.add_argument('--output',
+                        required=True,
+                        help='embedding store directory for a scp input, '
+                        'ark file (the scp is written next to it) for a '
+                        'store input')
+    parser.add_argument('--dtype',
+                        default='float32',
+                        choices=['float32', 'float16'],
+                        help='dtype of the store')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = get_args()
+    start = time.time()
+    if is_embedding_store(args.input):
+        assert args.output.endswith('.ark'), 'the output should be an ark'
+        num = store_to_ark(args.input, args.output)
+    else:
+        num = scp_to_store(args.input, args.output, args.dtype)
+    print('Converted {} embeddings in {:.1f} s, see {}'.format(
+        num,
+        time.time() - start, args.output))
+
+
+if __name__ == '__main__':
+    main()
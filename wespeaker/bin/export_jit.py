@@ -20,6 +20,7 @@ import os
 import torch
 import yaml
 
+from wespeaker.models.optimize import optimize_for_inference
 from wespeaker.models.speaker_model import get_speaker_model
 from wespeaker.utils.checkpoint import load_checkpoint
 
@@ -32,6 +33,10 @@ def get_args():
     parser.add_argument('--output_quant_file',
                         default=None,
                         help='output quantized model file')
+    parser.add_argument('--optimize',
+                        action='store_true',
+                        help='fold BatchNorm and strip training modules, '
+                        'see wespeaker/bin/optimize_model.py')
     args = parser.parse_args()
     return args
 
@@ -48,6 +53,10 @@ def main():
 
     load_checkpoint(model, args.checkpoint)
     model.eval()
+    if args.optimize:
+        model, num_folded = optimize_for_inference(
+            model, feat_dim=configs['model_args'].get('feat_dim', 80))
+        print('Folded {} BatchNorm layers'.format(num_folded))
     # Export jit torch script model
 
     script_model = torch.jit.script(model)
@@ -22,6 +22,7 @@ import torch
 import torch.nn as nn
 import yaml
 
+from wespeaker.models.optimize import optimize_for_inference
 from wespeaker.models.speaker_model import get_speaker_model
 from wespeaker.utils.checkpoint import load_checkpoint
 
@@ -39,6 +40,10 @@ def get_args():
                         required=False,
                         default=None,
                         help='mean vector')
+    parser.add_argument('--optimize',
+                        action='store_true',
+                        help='fold BatchNorm and strip training modules, '
+                        'see wespeaker/bin/optimize_model.py')
     args = parser.parse_args()
     return args
 
@@ -52,6 +57,12 @@ def main():
     model = get_speaker_model(configs['model'])(**configs['model_args'])
     load_checkpoint(model, args.checkpoint)
     model.eval()
+    if args.optimize:
+        # onnx constant folding only fuses Conv -> BN, this also covers
+        # Linear and BN -> Conv/Linear
+        model, num_folded = optimize_for_inference(
+            model, feat_dim=configs['model_args'].get('feat_dim', 80))
+        print('Folded {} BatchNorm layers'.format(num_folded))
 
     if args.mean_vec:
         mean_vec = torch.tensor(np.load(args.mean_vec), dtype=torch.float32)
@@ -107,6 +118,7 @@ def main():
     # --optShapes=feats:64x200x80 --maxShapes=feats:128x500x80 \
     # --fp16
     # If it is an model with QDQ nodes, please add --int8
+    # For int8 on CPU, see wespeaker/bin/quantize_model.py
 
 
 if __name__ == '__main__':
@@ -13,7 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
 import copy
+import inspect
 import os
 
 import fire
@@ -27,7 +29,10 @@ from wespeaker.dataset.dataset_utils import apply_cmvn, spec_aug
 from wespeaker.frontend import *
 from wespeaker.models.speaker_model import get_speaker_model
 from wespeaker.utils.checkpoint import load_checkpoint
-from wespeaker.utils.utils import parse_config_or_kwargs, validate_path
+from wespeaker.utils.embedding_store import EmbeddingStoreWriter
+from wespeaker.utils.long_audio import extract_windowed_embedding
+from wespeaker.utils.utils import compile_model, get_amp_dtype, \
+    parse_config_or_kwargs, validate_path
 
 
 def extract(config='conf/config.yaml', **kwargs):
@@ -38,6 +43,19 @@ def extract(config='conf/config.yaml', **kwargs):
     embed_ark = configs['embed_ark']
     batch_size = configs.get('batch_size', 1)
     num_workers = configs.get('num_workers', 1)
+    # whole utterances are batched by padding utterances of similar lengths
+    # together, otherwise batch_size > 1 extracts random num_frms chunks
+    whole_utt = configs.get('whole_utt', batch_size == 1)
+    sort_pad_batch = whole_utt and batch_size > 1
+    # whole utterances longer than long_audio_frames are extracted window by
+    # window (bounded memory), see wespeaker/utils/long_audio.py
+    long_audio_frames = configs.get('long_audio_frames', None)
+    long_audio_args = configs.get('long_audio_args', {})
+    # optional per-window embeddings of the long utterances
+    window_embed_ark = configs.get('window_embed_ark', None)
+    # optional memory-mapped embedding store written next to embed_ark,
+    # see wespeaker/utils/embedding_store.py
+    embed_store = configs.get('embed_store', None)
 
     # Since the input length is not fixed, we set the built-in cudnn
     # auto-tuner to False
@@ -58,6 +76,16 @@ def extract(config='conf/config.yaml', **kwargs):
     print('Finished !!! Start extracting ...')
     device = torch.device("cuda")
     model.to(device).eval()
+    # extraction-only switches, the training compile/amp keys in config.yaml
+    # are not inherited on purpose
+    extract_amp_dtype = configs.get('extract_amp_dtype', None)
+    if extract_amp_dtype is not None:
+        extract_amp_dtype = get_amp_dtype(extract_amp_dtype)
+    if configs.get('extract_compile', False):
+        # whole utterances have a variable number of frames
+        compile_args = {'dynamic': True}
+        compile_args.update(configs.get('extract_compile_args', {}))
+        compile_model(model, **compile_args)
 
     # test_configs
     # test_conf = copy.deepcopy(configs['dataset_args'])
@@ -68,56 +96,133 @@ def extract(config='conf/config.yaml', **kwargs):
     test_conf['shuffle'] = False
     test_conf['aug_prob'] = configs.get('aug_prob', 0.0)
     test_conf['filter'] = False
+    if sort_pad_batch:
+        assert 'lengths' in inspect.signature(model.forward).parameters, \
+            '{} does not support padded batches, use batch_size 1'.format(
+                configs['model'])
+        assert num_workers <= 1, \
+            'the utterance order is only restored with num_workers <= 1'
+        test_conf['sort_pad_batch'] = True
+        test_conf['sort_pad_batch_args'] = {
+            'sort_size': configs.get('sort_size', 2000),
+            'max_batch_size': batch_size,
+            'frames_per_batch': configs.get('frames_per_batch',
+                                            batch_size * 1000)
+        }
 
     dataset = Dataset(configs['data_type'],
                       configs['data_list'],
                       test_conf,
                       spk2id_dict={},
-                      whole_utt=(batch_size == 1),
+                      whole_utt=whole_utt,
                       reverb_lmdb_file=configs.get('reverb_data', None),
                       noise_lmdb_file=configs.get('noise_data', None),
                       repeat_dataset=False)
     dataloader = DataLoader(dataset,
                             shuffle=False,
-                            batch_size=batch_size,
+                            batch_size=None if sort_pad_batch else batch_size,
                             num_workers=num_workers,
                             prefetch_factor=4)
 
     validate_path(embed_ark)
     embed_ark = os.path.abspath(embed_ark)
     embed_scp = embed_ark[:-3] + "scp"
+    window_writer = contextlib.nullcontext()
+    if whole_utt and long_audio_frames is not None and window_embed_ark:
+        validate_path(window_embed_ark)
+        window_embed_ark = os.path.abspath(window_embed_ark)
+        window_writer = kaldiio.WriteHelper('ark,scp:' + window_embed_ark +
+                                            "," + window_embed_ark[:-3] +
+                                            "scp")
+    store_writer = contextlib.nullcontext()
+    if embed_store:
+        store_writer = EmbeddingStoreWriter(
+            embed_store, dtype=configs.get('embed_store_dtype', 'float32'))
 
     with torch.no_grad():
         with kaldiio.WriteHelper('ark,scp:' + embed_ark + "," +
-                                 embed_scp) as writer:
+                                 embed_scp) as ark_writer, \
+                window_writer as window_writer, \
+                store_writer as store_writer:
+
+            def writer(utt, embed):
+                ark_writer(utt, embed)
+                if store_writer is not None:
+                    store_writer(utt, embed)
+
+            # sorted batches are written back in the data list order
+            pending, next_index = {}, 0
             for _, batch in tqdm(enumerate(dataloader)):
                 utts = batch['key']
+                lengths = batch['lengths'].to(device) \
+                    if sort_pad_batch else None
                 if frontend_type == 'fbank':
                     features = batch['feat']
                     features = features.float().to(device)  # (B,T,F)
                 else:  # 's3prl'
                     wavs = batch['wav']  # (B,1,W)
                     wavs = wavs.squeeze(1).float().to(device)  # (B,W)
-                    wavs_len = torch.LongTensor([wavs.shape[1]]).repeat(
-                        wavs.shape[0]).to(device)  # (B)
+                    if lengths is None:
+                        wavs_len = torch.LongTensor([wavs.shape[1]]).repeat(
+                            wavs.shape[0]).to(device)  # (B)
+                    else:
+                        wavs_len = torch.round(lengths *
+                                               wavs.shape[1]).long()
                     features, _ = model.frontend(wavs, wavs_len)
 
                 # apply cmvn
                 if test_conf.get('cmvn', True):
                     features = apply_cmvn(features,
-                                          **test_conf.get('cmvn_args', {}))
+                                          **test_conf.get('cmvn_args', {}),
+                                          lengths=lengths)
                 # spec augmentation
                 if test_conf.get('spec_aug', False):
                     features = spec_aug(features, **test_conf['spec_aug_args'])
 
                 # Forward through model
-                outputs = model(features)  # embed or (embed_a, embed_b)
+                with torch.cuda.amp.autocast(
+                        enabled=extract_amp_dtype is not None,
+                        dtype=extract_amp_dtype or torch.float16):
+                    if whole_utt and long_audio_frames is not None and \
+                            features.size(1) > long_audio_frames:
+                        # one utterance at a time, window by window
+                        outputs = []
+                        for i, utt in enumerate(utts):
+                            num_frms = features.size(1) if lengths is None \
+                                else int(round(lengths[i].item() *
+                                               features.size(1)))
+                            embed, window_embeds, bounds = \
+                                extract_windowed_embedding(
+                                    model, features[i, :num_frms],
+                                    **long_audio_args)
+                            outputs.append(embed)
+                            if window_writer is None:
+                                continue
+                            window_embeds = window_embeds.cpu().numpy()
+                            for (begin, end), window_embed in zip(
+                                    bounds, window_embeds):
+                                window_writer(
+                                    '{}-{:08d}-{:08d}'.format(
+                                        utt, begin, end), window_embed)
+                        outputs = torch.stack(outputs)
+                    # embed or (embed_a, embed_b)
+                    elif lengths is None:
+                        outputs = model(features)
+                    else:
+                        outputs = model(features, lengths)
                 embeds = outputs[-1] if isinstance(outputs, tuple) else outputs
-                embeds = embeds.cpu().detach().numpy()  # (B,F)
-
-                for i, utt in enumerate(utts):
-                    embed = embeds[i]
-                    writer(utt, embed)
+                embeds = embeds.float().cpu().detach().numpy()  # (B,F)
+
+                if not sort_pad_batch:
+                    for i, utt in enumerate(utts):
+                        embed = embeds[i]
+                        writer(utt, embed)
+                    continue
+                for i, index in enumerate(batch['index'].tolist()):
+                    pending[index] = (utts[i], embeds[i])
+                while next_index in pending:
+                    writer(*pending.pop(next_index))
+                    next_index += 1
 
 
 if __name__ == '__main__':
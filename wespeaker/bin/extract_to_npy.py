@@ -13,11 +13,12 @@ import numpy as np
 import fire
 import torch
 import torchaudio
-import torchaudio.compliance.kaldi as kaldi
 from tqdm import tqdm
 
+from wespeaker.dataset.dataset_utils import chunked_fbank
 from wespeaker.models.speaker_model import get_speaker_model
 from wespeaker.utils.checkpoint import load_checkpoint
+from wespeaker.utils.long_audio import extract_windowed_embedding
 from wespeaker.utils.utils import parse_config_or_kwargs
 
 
@@ -37,7 +38,7 @@ def compute_fbank(wav_path, num_mel_bins=80, frame_length=25, frame_shift=10, di
     """
     waveform, sample_rate = torchaudio.load(wav_path)
     waveform = waveform * (1 << 15)
-    mat = kaldi.fbank(
+    mat = chunked_fbank(
         waveform,
         num_mel_bins=num_mel_bins,
         frame_length=frame_length,
@@ -56,6 +57,8 @@ def extract_to_npy(
     wav_scp=None,
     wav_dir=None,
     output_dir=None,
+    long_audio_frames=None,
+    save_windows=False,
     **kwargs
 ):
     """
@@ -67,6 +70,11 @@ def extract_to_npy(
         wav_scp: Path to wav.scp file (format: utt_id /path/to/wav) - Option 1
         wav_dir: Directory containing wav files (will scan recursively) - Option 2
         output_dir: Root directory to save embeddings
+        long_audio_frames: Utterances longer than it (frames) are extracted
+            window by window with a bounded memory, the windows are set by
+            long_audio_args in the config (see wespeaker/utils/long_audio.py)
+        save_windows: Also save the window embeddings and their
+            [begin, end) frames of the long utterances as <utt_id>.windows.npz
     
     Note: Provide either wav_scp OR wav_dir (not both)
     """
@@ -158,14 +166,6 @@ def extract_to_npy(
                     mean = feats.mean(dim=0, keepdim=True)
                     feats = feats - mean
                 
-                # Add batch dimension and move to device
-                feats = feats.unsqueeze(0).float().to(device)  # (1, T, F)
-                
-                # Forward pass
-                outputs = model(feats)
-                embeds = outputs[-1] if isinstance(outputs, tuple) else outputs
-                embedding = embeds.cpu().detach().numpy().squeeze()  # (embed_dim,)
-                
                 # Use utt_id as relative path, change extension to .npy
                 rel_path = utt_id + ".npy"
                 output_path = os.path.join(output_dir, rel_path)
@@ -173,6 +173,27 @@ def extract_to_npy(
                 # Create subdirectories if needed
                 os.makedirs(os.path.dirname(output_path), exist_ok=True)
                 
+                if long_audio_frames is not None and \
+                        feats.size(0) > long_audio_frames:
+                    # Windowed forward pass, bounded memory
+                    embeds, window_embeds, bounds = extract_windowed_embedding(
+                        model, feats.float().to(device),
+                        **configs.get('long_audio_args', {}))
+                    embedding = embeds.cpu().numpy()  # (embed_dim,)
+                    if save_windows:
+                        np.savez(os.path.join(output_dir,
+                                              utt_id + ".windows.npz"),
+                                 embeddings=window_embeds.cpu().numpy(),
+                                 bounds=np.array(bounds))
+                else:
+                    # Add batch dimension and move to device
+                    feats = feats.unsqueeze(0).float().to(device)  # (1, T, F)
+                    
+                    # Forward pass
+                    outputs = model(feats)
+                    embeds = outputs[-1] if isinstance(outputs, tuple) else outputs
+                    embedding = embeds.cpu().detach().numpy().squeeze()  # (embed_dim,)
+                
                 # Save embedding
                 np.save(output_path, embedding)
                 processed_count += 1
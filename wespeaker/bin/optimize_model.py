@@ -0,0 +1,116 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Optimize a trained speaker model for inference (see
+wespeaker/models/optimize.py): strip the training heads, fold BatchNorm,
+switch RepVGG blocks to deploy and optionally use channels_last. The
+optimized model is checked against the original one on random inputs and
+the CPU latency before/after is reported, it can be saved as a torchscript
+model. export_jit.py, export_onnx.py and the wespeaker CLI apply the same
+pass with --optimize.
+
+Example:
+    python wespeaker/bin/optimize_model.py \
+        --config exp/resnet/config.yaml \
+        --checkpoint exp/resnet/models/avg_model.pt \
+        --output_file exp/resnet/models/avg_model.opt.zip
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+
+import torch
+import yaml
+
+from wespeaker.models.optimize import check_equivalence, measure_latency, \
+    optimize_for_inference
+from wespeaker.models.speaker_model import get_speaker_model
+from wespeaker.utils.checkpoint import load_checkpoint
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='optimize a speaker model for inference')
+    parser.add_argument('--config', required=True, help='config file')
+    parser.add_argument('--checkpoint', required=True, help='checkpoint model')
+    parser.add_argument('--output_file',
+                        default=None,
+                        help='output torchscript model file')
+    parser.add_argument('--channels_last',
+                        action='store_true',
+                        help='channels_last memory format for Conv2d')
+    parser.add_argument('--num_frms',
+                        default=300,
+                        type=int,
+                        help='number of frames for the latency test')
+    parser.add_argument('--num_threads',
+                        default=1,
+                        type=int,
+                        help='cpu threads for the latency test')
+    parser.add_argument('--tolerance',
+                        default=1e-4,
+                        type=float,
+                        help='max embedding difference relative to the '
+                        'embedding scale')
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = get_args()
+    # No need gpu for model optimization
+    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+    torch.set_num_threads(args.num_threads)
+
+    with open(args.config, 'r') as fin:
+        configs = yaml.load(fin, Loader=yaml.FullLoader)
+    model = get_speaker_model(configs['model'])(**configs['model_args'])
+    load_checkpoint(model, args.checkpoint)
+    model.eval()
+    feat_dim = configs['model_args'].get('feat_dim', 80)
+
+    optimized_model, num_folded = optimize_for_inference(
+        model, feat_dim=feat_dim, channels_last=args.channels_last)
+    num_bn = sum(
+        isinstance(m, torch.nn.modules.batchnorm._BatchNorm)
+        for m in model.modules())
+    print('Folded {} of {} BatchNorm layers'.format(num_folded, num_bn))
+
+    max_diff, min_cos = check_equivalence(model, optimized_model, feat_dim)
+    print('Max relative embedding difference {:.2e}, min cosine '
+          'similarity {:.6f}'.format(max_diff, min_cos))
+    if max_diff > args.tolerance:
+        print('[error] the optimized model is not equivalent, tolerance '
+              '{:.2e}'.format(args.tolerance))
+        sys.exit(1)
+
+    latency = measure_latency(model, feat_dim, args.num_frms)
+    optimized_latency = measure_latency(optimized_model, feat_dim,
+                                        args.num_frms)
+    print('CPU latency ({} frames, {} threads): {:.2f} ms => {:.2f} ms '
+          '({:.2f}x)'.format(args.num_frms, args.num_threads, latency,
+                             optimized_latency,
+                             latency / optimized_latency))
+
+    if args.output_file:
+        script_model = torch.jit.script(optimized_model)
+        script_model.save(args.output_file)
+        print('Export optimized model successfully, see {}'.format(
+            args.output_file))
+
+
+if __name__ == '__main__':
+    main()
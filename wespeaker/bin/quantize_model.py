@@ -0,0 +1,280 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""CPU post-training int8 quantization with an accuracy gate.
+
+    backend torch, mode dynamic: int8 Linear layers (torch dynamic
+        quantization), saved as a torchscript model
+    backend onnx, mode dynamic: int8 MatMul/Gemm weights, activations
+        quantized on the fly (onnxruntime quantize_dynamic) of the fp32
+        model of export_onnx.py
+    backend onnx, mode static: int8 weights and activations (QDQ, per
+        channel), the activation ranges are calibrated on fbank chunks of
+        calib_data read by Dataset
+
+The quantized model is compared with the fp32 one on the first
+num_eval_utts utterances of eval_data: the cosine drift 1 - cos(e_fp32,
+e_int8) of each embedding and, if trials are given, the EER on the trials
+within these utterances. The model is only written to output_model if the
+mean cosine drift and the EER drift are below max_cos_drift and
+max_eer_drift, otherwise it is rejected (exit code 1).
+
+Example:
+    python wespeaker/bin/quantize_model.py \
+        --config exp/resnet/config.yaml \
+        --model_path exp/resnet/models/avg_model.pt \
+        --backend onnx --mode static \
+        --onnx_model exp/resnet/models/avg_model.onnx \
+        --output_model exp/resnet/models/avg_model.int8.onnx \
+        --calib_data data/vox2_dev/shard.list --calib_data_type shard \
+        --eval_data data/vox1/raw.list --eval_data_type raw \
+        --trials data/vox1/trials/vox1_O_cleaned.kaldi
+"""
+
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import fire
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from wespeaker.dataset.dataset import Dataset
+from wespeaker.dataset.dataset_utils import apply_cmvn
+from wespeaker.models.speaker_model import get_speaker_model
+from wespeaker.utils.checkpoint import load_checkpoint
+from wespeaker.utils.score_metrics import compute_eer, compute_pmiss_pfa_rbst
+from wespeaker.utils.utils import parse_config_or_kwargs
+
+
+def load_feats(configs, data_type, data_list, num_utts, whole_utt):
+    """ The first num_utts (key, fbank) of data_list, cmvn applied as in
+        extract.py. Chunks of num_frms frames if not whole_utt.
+    """
+    test_conf = copy.deepcopy(configs['dataset_args'])
+    assert test_conf.get('frontend', 'fbank') == 'fbank', \
+        'only fbank models can be quantized'
+    test_conf['speed_perturb'] = False
+    if 'fbank_args' in test_conf:
+        test_conf['fbank_args']['dither'] = 0.0
+    test_conf['spec_aug'] = False
+    test_conf['shuffle'] = False
+    test_conf['aug_prob'] = 0.0
+    test_conf['filter'] = False
+    dataset = Dataset(data_type,
+                      data_list,
+                      test_conf,
+                      spk2id_dict={},
+                      whole_utt=whole_utt,
+                      repeat_dataset=False)
+    dataloader = DataLoader(dataset, shuffle=False, batch_size=1)
+    keys, feats = [], []
+    for batch in dataloader:
+        feat = batch['feat'].float()
+        if test_conf.get('cmvn', True):
+            feat = apply_cmvn(feat, **test_conf.get('cmvn_args', {}))
+        keys.append(batch['key'][0])
+        feats.append(feat)
+        if len(feats) == num_utts:
+            break
+    return keys, feats
+
+
+class TorchRunner:
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, feat):
+        with torch.no_grad():
+            outputs = self.model(feat)
+        embeds = outputs[-1] if isinstance(outputs, tuple) else outputs
+        return embeds[0].numpy()
+
+
+class OnnxRunner:
+
+    def __init__(self, onnx_model, num_threads):
+        import onnxruntime as ort
+        so = ort.SessionOptions()
+        so.inter_op_num_threads = 1
+        so.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_model, sess_options=so)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[-1].name
+
+    def __call__(self, feat):
+        embeds = self.session.run(output_names=[self.output_name],
+                                  input_feed={self.input_name: feat.numpy()})
+        return embeds[0][0]
+
+
+class CalibrationReader:
+    """ onnxruntime CalibrationDataReader over the calibration chunks
+    """
+
+    def __init__(self, feats):
+        self.feats = iter(feats)
+
+    def get_next(self):
+        feat = next(self.feats, None)
+        return None if feat is None else {'feats': feat.numpy()}
+
+
+def extract_embeds(runner, feats):
+    start = time.perf_counter()
+    embeds = np.stack([runner(feat) for feat in feats])
+    latency = (time.perf_counter() - start) / len(feats) * 1000
+    return embeds, latency
+
+
+def trials_eer(trials, keys, embeds):
+    """ EER (%) on the trials whose two utterances are both in keys
+    """
+    key2idx = {key: i for i, key in enumerate(keys)}
+    embeds = embeds / np.linalg.norm(embeds, axis=1, keepdims=True)
+    enroll, test, labels = [], [], []
+    with open(trials, 'r') as fin:
+        for line in fin:
+            segs = line.strip().split()
+            if segs[0] in key2idx and segs[1] in key2idx:
+                enroll.append(key2idx[segs[0]])
+                test.append(key2idx[segs[1]])
+                labels.append(segs[2] == 'target')
+    labels = np.array(labels, dtype=int)
+    if labels.sum() == 0 or labels.sum() == len(labels):
+        return None, len(labels)
+    scores = np.sum(embeds[enroll] * embeds[test], axis=1)
+    fnr, fpr = compute_pmiss_pfa_rbst(scores, labels)
+    return compute_eer(fnr, fpr) * 100, len(labels)
+
+
+def quantize(config='conf/config.yaml', **kwargs):
+    configs = parse_config_or_kwargs(config, **kwargs)
+    backend = configs.get('backend', 'onnx')
+    mode = configs.get('mode', 'static')
+    output_model = configs['output_model']
+    num_threads = configs.get('num_threads', 1)
+    max_cos_drift = configs.get('max_cos_drift', 0.01)
+    max_eer_drift = configs.get('max_eer_drift', 0.2)
+    assert backend in ['torch', 'onnx']
+    assert mode in ['dynamic', 'static']
+    # the speaker models are not traceable by torch.fx (shape dependent
+    # control flow), static quantization is done on the onnx graph
+    assert backend == 'onnx' or mode == 'dynamic', \
+        'static quantization is only supported for the onnx backend'
+    torch.set_num_threads(num_threads)
+
+    eval_data_type = configs.get('eval_data_type', configs['data_type'])
+    keys, eval_feats = load_feats(configs, eval_data_type,
+                                  configs['eval_data'],
+                                  configs.get('num_eval_utts', 500), True)
+    print('{} utterances for the accuracy check'.format(len(keys)))
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        if backend == 'torch':
+            model = get_speaker_model(
+                configs['model'])(**configs['model_args'])
+            load_checkpoint(model, configs['model_path'])
+            model.eval()
+            quantized_model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8)
+            fp32_runner = TorchRunner(model)
+            int8_runner = TorchRunner(quantized_model)
+        else:
+            from onnxruntime.quantization import QuantFormat, QuantType, \
+                quantize_dynamic, quantize_static
+            from onnxruntime.quantization.shape_inference import \
+                quant_pre_process
+
+            onnx_model = configs['onnx_model']
+            pre_model = os.path.join(tmp_dir, 'pre.onnx')
+            quantized_model = os.path.join(tmp_dir, 'int8.onnx')
+            quant_pre_process(onnx_model, pre_model)
+            per_channel = configs.get('per_channel', True)
+            if mode == 'dynamic':
+                # ConvInteger of onnxruntime is much slower than the fp32
+                # Conv on CPU, only MatMul/Gemm by default like torch
+                quantize_dynamic(pre_model,
+                                 quantized_model,
+                                 op_types_to_quantize=configs.get(
+                                     'op_types', ['MatMul', 'Gemm']),
+                                 per_channel=per_channel,
+                                 weight_type=QuantType.QInt8)
+            else:
+                calib_data_type = configs.get('calib_data_type',
+                                              configs['data_type'])
+                _, calib_feats = load_feats(
+                    configs, calib_data_type, configs['calib_data'],
+                    configs.get('num_calib_utts', 200), False)
+                print('{} chunks for the calibration'.format(
+                    len(calib_feats)))
+                quantize_static(
+                    pre_model,
+                    quantized_model,
+                    CalibrationReader(calib_feats),
+                    quant_format=QuantFormat.QDQ,
+                    per_channel=per_channel,
+                    reduce_range=configs.get('reduce_range', False),
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8)
+            fp32_runner = OnnxRunner(onnx_model, num_threads)
+            int8_runner = OnnxRunner(quantized_model, num_threads)
+
+        fp32_embeds, fp32_latency = extract_embeds(fp32_runner, eval_feats)
+        int8_embeds, int8_latency = extract_embeds(int8_runner, eval_feats)
+        cos = np.sum(fp32_embeds * int8_embeds, axis=1) / (
+            np.linalg.norm(fp32_embeds, axis=1) *
+            np.linalg.norm(int8_embeds, axis=1))
+        cos_drift = 1.0 - cos
+        print('Cosine drift: mean {:.5f}, max {:.5f}'.format(
+            cos_drift.mean(), cos_drift.max()))
+        print('Latency per utterance ({} threads): fp32 {:.2f} ms, int8 '
+              '{:.2f} ms ({:.2f}x)'.format(num_threads, fp32_latency,
+                                           int8_latency,
+                                           fp32_latency / int8_latency))
+        accepted = cos_drift.mean() <= max_cos_drift
+        if configs.get('trials', None) is not None:
+            fp32_eer, num_trials = trials_eer(configs['trials'], keys,
+                                              fp32_embeds)
+            int8_eer, _ = trials_eer(configs['trials'], keys, int8_embeds)
+            if fp32_eer is None:
+                print('[warning] no target and nontarget trials within the '
+                      'utterances, the EER check is skipped')
+            else:
+                print('EER on {} trials: fp32 {:.3f}%, int8 {:.3f}%'.format(
+                    num_trials, fp32_eer, int8_eer))
+                accepted = accepted and \
+                    abs(int8_eer - fp32_eer) <= max_eer_drift
+
+        if not accepted:
+            print('[error] the int8 model is rejected, max_cos_drift {}, '
+                  'max_eer_drift {}'.format(max_cos_drift, max_eer_drift))
+            sys.exit(1)
+        if backend == 'torch':
+            torch.jit.script(quantized_model).save(output_model)
+        else:
+            shutil.move(quantized_model, output_model)
+        print('Export quantized model successfully, see {}'.format(
+            output_model))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    fire.Fire(quantize)
@@ -16,23 +16,16 @@ import os
 from pathlib import Path
 
 import fire
-import kaldiio
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from tqdm import tqdm
 
+from wespeaker.utils.embedding_store import load_embeddings
+from wespeaker.utils.scoring import CosineScorer
 
-def calculate_mean_from_kaldi_vec(scp_path):
-    vec_num = 0
-    mean_vec = None
-
-    for _, vec in kaldiio.load_scp_sequential(scp_path):
-        if mean_vec is None:
-            mean_vec = np.zeros_like(vec)
-        mean_vec += vec
-        vec_num += 1
 
-    return mean_vec / vec_num
+def calculate_mean_from_kaldi_vec(scp_path):
+    # kaldi scp or embedding store
+    _, embeds = load_embeddings(scp_path)
+    return embeds.mean(axis=0)
 
 
 def trials_cosine_score(eval_scp_path='',
@@ -40,36 +33,22 @@ def trials_cosine_score(eval_scp_path='',
                         mean_vec=None,
                         trials=()):
     if mean_vec is None or not os.path.exists(mean_vec):
-        mean_vec = 0.0
+        mean_vec = None
     else:
         mean_vec = np.load(mean_vec)
 
-    # each embedding may be accessed multiple times, here we pre-load them
-    # into the memory
-    emb_dict = {}
-    for utt, emb in kaldiio.load_scp_sequential(eval_scp_path):
-        emb = emb - mean_vec
-        emb_dict[utt] = emb
+    # the embeddings are mean subtracted and normalized once, then shared by
+    # all the trial lists
+    utts, embs = load_embeddings(eval_scp_path)
+    scorer = CosineScorer(utts, embs, mean_vec)
 
     for trial in trials:
         store_path = os.path.join(store_dir,
                                   os.path.basename(trial) + '.score')
-        with open(trial, 'r') as trial_r, open(store_path, 'w') as w_f:
-            lines = trial_r.readlines()
-            for line in tqdm(lines,
-                             desc='scoring trial {}'.format(
-                                 os.path.basename(trial))):
-                segs = line.strip().split()
-                emb1, emb2 = emb_dict[segs[0]], emb_dict[segs[1]]
-                cos_score = cosine_similarity(emb1.reshape(1, -1),
-                                              emb2.reshape(1, -1))[0][0]
-
-                if len(segs) == 3:  # enroll_name test_name target/nontarget
-                    w_f.write('{} {} {:.5f} {}\n'.format(
-                        segs[0], segs[1], cos_score, segs[2]))
-                else:  # enroll_name test_name
-                    w_f.write('{} {} {:.5f}\n'.format(segs[0], segs[1],
-                                                      cos_score))
+        # enroll_name test_name [target/nontarget]
+        num_trials, _ = scorer.score_file(trial, store_path)
+        print('scored {} trials of {}'.format(num_trials,
+                                              os.path.basename(trial)))
 
 
 def main(exp_dir, eval_scp_path, cal_mean, cal_mean_dir, *trials):
@@ -10,12 +10,8 @@
 import os
 import numpy as np
 import fire
-from tqdm import tqdm
 
-
-def cosine_similarity(a, b):
-    """Compute cosine similarity between two vectors"""
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+from wespeaker.utils.scoring import CosineScorer
 
 
 def load_embeddings_from_npy(embedding_dir):
@@ -97,15 +93,13 @@ def score_from_npy(
     if len(embeddings) == 0:
         raise ValueError(f"No embeddings found in {embedding_dir}")
     
-    # Compute and subtract mean if requested
+    # Compute mean if requested, subtracted by the scorer
     mean_emb = None
     if cal_mean:
         mean_emb = compute_mean_embedding(embeddings)
         if mean_emb is not None:
             print("Subtracting mean from embeddings...")
-            for utt_id in embeddings:
-                embeddings[utt_id] = embeddings[utt_id] - mean_emb
-    
+
     # Read trial file and compute scores
     print(f"\nProcessing trial file: {trial_file}")
     
@@ -115,49 +109,32 @@ def score_from_npy(
     # Create output directory
     os.makedirs(os.path.dirname(output_score_file), exist_ok=True)
     
-    scores_computed = 0
-    scores_failed = 0
-    missing_enrolls = set()
-    missing_tests = set()
-    
-    with open(trial_file, 'r') as f_in, open(output_score_file, 'w') as f_out:
-        lines = f_in.readlines()
-        
-        for line in tqdm(lines, desc="Computing scores"):
-            parts = line.strip().split()
-            
-            if len(parts) < 3:
-                print(f"Warning: Malformed line: {line.strip()}")
-                scores_failed += 1
-                continue
-            
-            enroll_id = parts[0]
-            test_id = parts[1]
-            label = parts[2]
-            
-            # Check if embeddings exist
-            if enroll_id not in embeddings:
-                missing_enrolls.add(enroll_id)
-                scores_failed += 1
-                continue
-            
-            if test_id not in embeddings:
-                missing_tests.add(test_id)
-                scores_failed += 1
-                continue
-            
-            # Compute cosine similarity
-            try:
-                score = cosine_similarity(embeddings[enroll_id], embeddings[test_id])
-                # Write in format: enroll_id test_id score label
-                f_out.write(f"{enroll_id} {test_id} {score:.6f} {label}\n")
-                scores_computed += 1
-            except Exception as e:
-                print(f"Error computing score for {enroll_id} vs {test_id}: {e}")
-                scores_failed += 1
+    # Embeddings are normalized once, the trials are scored in chunks
+    utt_ids = list(embeddings.keys())
+    scorer = CosineScorer(
+        utt_ids,
+        np.stack([embeddings[utt_id].reshape(-1) for utt_id in utt_ids]),
+        mean_emb)
+    num_trials, num_malformed = 0, 0
+    with open(trial_file, 'r') as f_in:
+        for line in f_in:
+            num_cols = len(line.split())
+            num_trials += num_cols > 0
+            num_malformed += 0 < num_cols < 3
+    if num_malformed > 0:
+        print(f"Warning: {num_malformed} malformed lines without label")
+    # Trials with a missing embedding are skipped
+    # Write in format: enroll_id test_id score label
+    scores_computed, missing = scorer.score_file(trial_file,
+                                                 output_score_file,
+                                                 precision=6,
+                                                 skip_missing=True,
+                                                 require_labels=True)
+    if missing:
+        print(f"Warning: {len(missing)} utterances without embedding")
     
     # Print summary
-    print(f"Scores computed: {scores_computed}/{scores_computed + scores_failed}")
+    print(f"Scores computed: {scores_computed}/{num_trials}")
 
 
 if __name__ == '__main__':
@@ -12,43 +12,85 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import logging
 import os
+from itertools import islice
 
 import fire
-import kaldiio
 import numpy as np
-from tqdm import tqdm
 
-from wespeaker.utils.file_utils import read_table
-
-
-def get_mean_std(emb, cohort, top_n):
-    emb = emb / np.sqrt(np.sum(emb**2, axis=1, keepdims=True))
-    cohort = cohort / np.sqrt(np.sum(cohort**2, axis=1, keepdims=True))
-    emb_cohort_score = np.matmul(emb, cohort.T)
-    emb_cohort_score = np.sort(emb_cohort_score, axis=1)[:, ::-1]
-    emb_cohort_score_topn = emb_cohort_score[:, :top_n]
-
-    emb_mean = np.mean(emb_cohort_score_topn, axis=1)
-    emb_std = np.std(emb_cohort_score_topn, axis=1)
-
-    return emb_mean, emb_std
+from wespeaker.utils.embedding_store import load_embeddings
+from wespeaker.utils.scoring import cohort_stats, num_tokens_per_line
 
 
 def split_embedding(utt_list, emb_scp, mean_vec):
-    embs = []
-    utt2idx = {}
-    utt2emb = {}
-    for utt, emb in kaldiio.load_scp_sequential(emb_scp):
-        emb = emb - mean_vec
-        utt2emb[utt] = emb
-
-    for utt in utt_list:
-        embs.append(utt2emb[utt])
-        utt2idx[utt] = len(embs) - 1
-
-    return np.array(embs), utt2idx
+    # kaldi scp or embedding store, batch lookup of utt_list
+    _, embs = load_embeddings(emb_scp, utt_list)
+    utt2idx = {utt: i for i, utt in enumerate(utt_list)}
+    return embs - mean_vec, utt2idx
+
+
+def read_score_chunks(score_file, chunk_size=1000000):
+    """ (enroll, test, score, label) columns of score_file, chunk_size
+        lines at a time
+    """
+    with open(score_file, 'r', encoding='utf-8') as fin:
+        while True:
+            lines = list(islice(fin, chunk_size))
+            if len(lines) == 0:
+                return
+            text = ''.join(lines)
+            tokens = text.split()
+            if len(tokens) != 4 * len(lines) or np.any(
+                    num_tokens_per_line(text, len(lines)) != 4):
+                tokens = [t for line in lines for t in line.split()[:4]]
+            yield (tokens[0::4], tokens[1::4],
+                   np.array(tokens[2::4], dtype=np.float64), tokens[3::4])
+
+
+def cohort_signature(cohort_emb, top_n):
+    """ Identifies the cohort (mean subtracted) and top_n of cached stats
+    """
+    md5 = hashlib.md5(np.ascontiguousarray(cohort_emb).tobytes())
+    return '{}-{}'.format(md5.hexdigest(), top_n)
+
+
+def embedding_digests(embeds):
+    """ md5 of each (mean subtracted) evaluation embedding, the cached
+        statistics of an utterance are only reused for the same embedding
+    """
+    embeds = np.ascontiguousarray(embeds, dtype=np.float32)
+    return [hashlib.md5(emb.tobytes()).hexdigest() for emb in embeds]
+
+
+def load_cohort_cache(cache_file, signature):
+    """ Cached utt => (digest, mean, std) of the cohort signature, empty if
+        the cache is missing or computed with another cohort or top_n
+    """
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    cache = np.load(cache_file)
+    if 'digests' not in cache or str(cache['signature']) != signature:
+        logging.warning('ignore {}, computed with another cohort or top_n'
+                        .format(cache_file))
+        return {}
+    return dict(
+        zip(cache['utts'].tolist(),
+            zip(cache['digests'].tolist(), cache['mean'].tolist(),
+                cache['std'].tolist())))
+
+
+def save_cohort_cache(cache_file, signature, utt2stats):
+    utts = list(utt2stats.keys())
+    digests, mean, std = zip(*utt2stats.values()) if utts else ((), (), ())
+    with open(cache_file, 'wb') as fout:
+        np.savez(fout,
+                 signature=np.array(signature),
+                 utts=np.array(utts, dtype=str),
+                 digests=np.array(digests, dtype=str),
+                 mean=np.array(mean, dtype=np.float64),
+                 std=np.array(std, dtype=np.float64))
 
 
 def main(score_norm_method,
@@ -57,7 +99,17 @@ def main(score_norm_method,
          score_norm_file,
          cohort_emb_scp,
          eval_emb_scp,
-         mean_vec_path=None):
+         mean_vec_path=None,
+         cohort_stats_cache=None,
+         chunk_size=1000):
+    """ Args:
+            cohort_stats_cache: optional npz of the cohort statistics of the
+                evaluation utterances, reused across the trial lists of the
+                same cohort and top_n as long as the evaluation embedding
+                of the utterance is unchanged
+            chunk_size: number of embeddings scored against the cohort at a
+                time
+    """
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s %(levelname)s %(message)s')
     # get embedding
@@ -73,15 +125,16 @@ def main(score_norm_method,
     # get embedding
     logging.info('get embedding ...')
 
-    enroll_list, test_list, _, _ = zip(*read_table(trial_score_file))
-    enroll_list = sorted(list(set(enroll_list)))  # remove overlap and sort
-    test_list = sorted(list(set(test_list)))
-    enroll_emb, enroll_utt2idx = split_embedding(enroll_list, eval_emb_scp,
-                                                 mean_vec)
-    test_emb, test_utt2idx = split_embedding(test_list, eval_emb_scp, mean_vec)
+    # enrollment and test utterances share the statistics
+    utt_set = set()
+    for enroll, test, _, _ in read_score_chunks(trial_score_file):
+        utt_set.update(enroll)
+        utt_set.update(test)
+    utt_list = sorted(utt_set)
+    eval_emb, utt2idx = split_embedding(utt_list, eval_emb_scp, mean_vec)
 
-    cohort_list, _ = zip(*read_table(cohort_emb_scp))
-    cohort_emb, _ = split_embedding(cohort_list, cohort_emb_scp, mean_vec)
+    _, cohort_emb = load_embeddings(cohort_emb_scp)
+    cohort_emb = cohort_emb - mean_vec
 
     logging.info("computing normed score ...")
     if score_norm_method == "asnorm":
@@ -90,29 +143,50 @@ def main(score_norm_method,
         top_n = cohort_emb.shape[0]
     else:
         raise ValueError(score_norm_method)
-    enroll_mean, enroll_std = get_mean_std(enroll_emb, cohort_emb, top_n)
-    test_mean, test_std = get_mean_std(test_emb, cohort_emb, top_n)
+    signature = cohort_signature(cohort_emb, top_n)
+    utt2stats = load_cohort_cache(cohort_stats_cache, signature)
+    # the statistics of re-extracted embeddings are computed again
+    digests = embedding_digests(eval_emb)
+    todo = [
+        i for i, utt in enumerate(utt_list)
+        if utt2stats.get(utt, (None, ))[0] != digests[i]
+    ]
+    if len(todo) > 0:
+        logging.info('cohort statistics of {} utterances ...'.format(
+            len(todo)))
+        todo_mean, todo_std = cohort_stats(eval_emb[todo],
+                                           cohort_emb,
+                                           top_n,
+                                           chunk_size=chunk_size)
+        for i, mean, std in zip(todo, todo_mean.tolist(), todo_std.tolist()):
+            utt2stats[utt_list[i]] = (digests[i], mean, std)
+        if cohort_stats_cache:
+            save_cohort_cache(cohort_stats_cache, signature, utt2stats)
+    eval_mean, eval_std = (np.array(x, dtype=np.float64) for x in zip(
+        *(utt2stats[utt][1:] for utt in utt_list)))
+    # magnitudes for score calibration
+    eval_mag = np.linalg.norm(eval_emb, axis=1)
 
     # score norm
-    with open(trial_score_file, 'r', encoding='utf-8') as fin:
-        with open(score_norm_file, 'w', encoding='utf-8') as fout:
-            lines = fin.readlines()
-            for line in tqdm(lines):
-                line = line.strip().split()
-                enroll_idx = enroll_utt2idx[line[0]]
-                test_idx = test_utt2idx[line[1]]
-                score = float(line[2])
-                normed_score = 0.5 * (
-                    (score - enroll_mean[enroll_idx]) / enroll_std[enroll_idx]
-                    + (score - test_mean[test_idx]) / test_std[test_idx])
-                # compute mag mean for score calibration
-                enroll_mag = np.linalg.norm(enroll_emb[enroll_idx])
-                test_mag = np.linalg.norm(test_emb[test_idx])
-                fout.write(
-                    '{} {} {:.5f} {} {:.4f} {:.4f} {:.4f} {:.4f}\n'.format(
-                        line[0], line[1], normed_score, line[3], enroll_mag,
-                        test_mag, enroll_mean[enroll_idx],
-                        test_mean[test_idx]))
+    fmt = '{} {} {:.5f} {} {:.4f} {:.4f} {:.4f} {:.4f}\n'
+    with open(score_norm_file, 'w', encoding='utf-8') as fout:
+        for enroll, test, score, label in read_score_chunks(trial_score_file):
+            enroll_idx = np.fromiter((utt2idx[utt] for utt in enroll),
+                                     dtype=np.int64,
+                                     count=len(enroll))
+            test_idx = np.fromiter((utt2idx[utt] for utt in test),
+                                   dtype=np.int64,
+                                   count=len(test))
+            enroll_mean = eval_mean[enroll_idx]
+            test_mean = eval_mean[test_idx]
+            normed_score = 0.5 * (
+                (score - enroll_mean) / eval_std[enroll_idx] +
+                (score - test_mean) / eval_std[test_idx])
+            fout.write(''.join(
+                map(fmt.format, enroll, test, normed_score.tolist(), label,
+                    eval_mag[enroll_idx].tolist(),
+                    eval_mag[test_idx].tolist(), enroll_mean.tolist(),
+                    test_mean.tolist())))
 
 
 if __name__ == "__main__":
@@ -25,15 +25,17 @@ import yaml
 from torch.utils.data import DataLoader
 
 import wespeaker.utils.schedulers as schedulers
-from wespeaker.dataset.dataset import Dataset
+from wespeaker.dataset.dataset import Dataset, bucket_batch_num
 from wespeaker.frontend import *
+from wespeaker.frontend.feature_cache import UpstreamFeatureCache
+from wespeaker.models.distillation import EmbeddingDistiller, Teacher
 from wespeaker.models.projections import get_projection
 from wespeaker.models.speaker_model import get_speaker_model
 from wespeaker.utils.checkpoint import load_checkpoint, save_checkpoint
 from wespeaker.utils.executor import run_epoch
 from wespeaker.utils.file_utils import read_table
-from wespeaker.utils.utils import get_logger, parse_config_or_kwargs, set_seed, \
-    spk2id
+from wespeaker.utils.utils import compile_model, get_amp_dtype, get_logger, \
+    parse_config_or_kwargs, set_seed, spk2id
 
 
 def train(config='conf/config.yaml', **kwargs):
@@ -94,17 +96,51 @@ def train(config='conf/config.yaml', **kwargs):
                             spk2id_dict,
                             reverb_lmdb_file=configs.get('reverb_data', None),
                             noise_lmdb_file=configs.get('noise_data', None))
-    train_dataloader = DataLoader(train_dataset, **configs['dataloader_args'])
+    dataloader_args = configs['dataloader_args']
+    if configs['dataset_args'].get('bucket', False):
+        # the length-bucketed batches are built by the dataset itself, each
+        # of them holds as many frames as a batch_size * num_frms batch
+        dataloader_args = dict(dataloader_args,
+                               batch_size=None,
+                               drop_last=False)
+    train_dataloader = DataLoader(train_dataset, **dataloader_args)
     batch_size = configs['dataloader_args']['batch_size']
     if configs['dataset_args'].get('sample_num_per_epoch', 0) > 0:
         sample_num_per_epoch = configs['dataset_args']['sample_num_per_epoch']
     else:
         sample_num_per_epoch = len(train_utt_spk_list)
-    epoch_iter = sample_num_per_epoch // world_size // batch_size
+    # gradient accumulation over accum_grad micro-batches, epoch_iter is
+    # rounded so that every epoch ends with an optimizer step
+    accum_grad = configs.get('accum_grad', 1)
+    configs['accum_grad'] = accum_grad
+    if configs['dataset_args'].get('bucket', False):
+        # the number of length-bucketed batches depends on the durations,
+        # the ranks agree on the smallest count so that none of them waits
+        # in an all-reduce the others never join
+        bucket_conf = configs['dataset_args']['bucket_args']
+        assert 'utt2dur' in bucket_conf, \
+            'bucket needs bucket_args.utt2dur (see tools/wav2dur.py)'
+        durations = [
+            float(tokens[1]) for tokens in read_table(bucket_conf['utt2dur'])
+        ]
+        num_workers = max(1, dataloader_args.get('num_workers', 0))
+        epoch_iter = num_workers * bucket_batch_num(
+            durations, configs['dataset_args'], world_size * num_workers,
+            sample_num_per_epoch)
+        epoch_iter = torch.tensor(epoch_iter, device='cuda')
+        dist.all_reduce(epoch_iter, op=dist.ReduceOp.MIN)
+        epoch_iter = int(epoch_iter.item())
+    else:
+        epoch_iter = sample_num_per_epoch // world_size // batch_size
+    epoch_iter = epoch_iter // accum_grad * accum_grad
+    optim_epoch_iter = epoch_iter // accum_grad
     if rank == 0:
         logger.info("<== Dataloaders ==>")
         logger.info("train dataloaders created")
         logger.info('epoch iteration number: {}'.format(epoch_iter))
+        if accum_grad > 1:
+            logger.info('gradient accumulation steps: {}, optimizer steps '
+                        'per epoch: {}'.format(accum_grad, optim_epoch_iter))
 
     # model: frontend (optional) => speaker model => projection layer
     logger.info("<== Model ==>")
@@ -119,6 +155,19 @@ def train(config='conf/config.yaml', **kwargs):
         model.add_module("frontend", frontend)
     else:
         model = get_speaker_model(configs['model'])(**configs['model_args'])
+    # cache of the frozen upstream hidden states, shared by all the ranks
+    feature_cache = None
+    if configs['dataset_args'].get('feature_cache', False):
+        assert frontend_type != 'fbank' and frontend.frozen, \
+            'feature_cache needs a frozen s3prl or whisper_encoder frontend'
+        cache_args = configs['dataset_args']['feature_cache_args']
+        feature_cache = UpstreamFeatureCache(
+            cache_args['cache_dir'],
+            dtype=cache_args.get('dtype', 'float16'),
+            map_size=cache_args.get('map_size', 2**42))
+        if rank == 0:
+            logger.info('frozen upstream feature cache: {} ({})'.format(
+                cache_args['cache_dir'], feature_cache.dtype))
     if rank == 0:
         num_params = sum(param.numel() for param in model.parameters())
         logger.info('speaker_model size: {}'.format(num_params))
@@ -143,6 +192,29 @@ def train(config='conf/config.yaml', **kwargs):
             configs['dataset_args']['speed_perturb'] = False
     projection = get_projection(configs['projection_args'])
     model.add_module("projection", projection)
+    # knowledge distillation (optional) from a frozen teacher, a trained
+    # model fed with the student's fbank features or cached embeddings,
+    # see wespeaker/models/distillation.py
+    teacher = None
+    if configs.get('teacher_embed_scp', None) is not None:
+        teacher = Teacher(embed_scp=configs['teacher_embed_scp'])
+        teacher_embed_dim = teacher.embed_dim
+        logger.info('Load teacher embeddings from {}'.format(
+            configs['teacher_embed_scp']))
+    elif configs.get('teacher', None) is not None:
+        assert frontend_type == 'fbank', 'distillation supports fbank only'
+        teacher_model = get_speaker_model(configs['teacher'])(
+            **configs['teacher_args'])
+        load_checkpoint(teacher_model, configs['teacher_model'])
+        teacher = Teacher(model=teacher_model)
+        teacher_embed_dim = configs['teacher_args']['embed_dim']
+        logger.info('Load teacher {} from {}'.format(
+            configs['teacher'], configs['teacher_model']))
+    if teacher is not None:
+        distiller = EmbeddingDistiller(configs['model_args']['embed_dim'],
+                                       teacher_embed_dim,
+                                       **configs.get('distill_args', {}))
+        model.add_module("distiller", distiller)
     if rank == 0:
         # print model
         for line in pformat(model).split('\n'):
@@ -155,8 +227,8 @@ def train(config='conf/config.yaml', **kwargs):
             script_model.save(os.path.join(model_dir, 'init.zip'))
 
     # If specify checkpoint, load some info from checkpoint.
-    # For checkpoint, frontend, speaker model, and projection layer
-    # are all needed !!!
+    # For checkpoint, frontend, speaker model, projection layer (and
+    # distiller) are all needed !!!
     if checkpoint is not None:
         load_checkpoint(model, checkpoint)
         start_epoch = int(re.findall(r"(?<=model_)\d*(?=.pt)",
@@ -168,6 +240,14 @@ def train(config='conf/config.yaml', **kwargs):
 
     # ddp_model
     model.cuda()
+    if teacher is not None:
+        teacher.cuda()
+    # compile after the jit export above, in place so that the checkpoint
+    # keys and model.module.projection stay unchanged
+    if configs.get('compile', False):
+        logger.info('Compile speaker model with args: {}'.format(
+            configs.get('compile_args', {})))
+        compile_model(model, **configs.get('compile_args', {}))
     ddp_model = torch.nn.parallel.DistributedDataParallel(model)
     device = torch.device("cuda")
 
@@ -186,11 +266,12 @@ def train(config='conf/config.yaml', **kwargs):
 
     # scheduler
     configs['scheduler_args']['num_epochs'] = configs['num_epochs']
-    configs['scheduler_args']['epoch_iter'] = epoch_iter
+    configs['scheduler_args']['epoch_iter'] = optim_epoch_iter
     # here, we consider the batch_size 64 as the base, the learning rate will be
-    # adjusted according to the batchsize and world_size used in different setup
+    # adjusted according to the effective batchsize (batch_size * accum_grad)
+    # and world_size used in different setup
     configs['scheduler_args']['scale_ratio'] = 1.0 * world_size * configs[
-        'dataloader_args']['batch_size'] / 64
+        'dataloader_args']['batch_size'] * accum_grad / 64
     scheduler = getattr(schedulers,
                         configs['scheduler'])(optimizer,
                                               **configs['scheduler_args'])
@@ -199,7 +280,7 @@ def train(config='conf/config.yaml', **kwargs):
         logger.info("scheduler is: " + configs['scheduler'])
 
     # margin scheduler
-    configs['margin_update']['epoch_iter'] = epoch_iter
+    configs['margin_update']['epoch_iter'] = optim_epoch_iter
     margin_scheduler = getattr(schedulers, configs['margin_scheduler'])(
         model=model, **configs['margin_update'])
     if rank == 0:
@@ -221,7 +302,11 @@ def train(config='conf/config.yaml', **kwargs):
             logger.info(line)
     dist.barrier(device_ids=[gpu])  # synchronize here
 
-    scaler = torch.cuda.amp.GradScaler(enabled=configs['enable_amp'])
+    # bfloat16 autocast has the fp32 dynamic range, no loss scaling needed
+    configs['amp_dtype'] = configs.get('amp_dtype', 'float16')
+    amp_dtype = get_amp_dtype(configs['amp_dtype'])
+    scaler = torch.cuda.amp.GradScaler(
+        enabled=configs['enable_amp'] and amp_dtype == torch.float16)
     for epoch in range(start_epoch, configs['num_epochs'] + 1):
         train_dataset.set_epoch(epoch)
 
@@ -236,7 +321,9 @@ def train(config='conf/config.yaml', **kwargs):
                   logger,
                   scaler,
                   device=device,
-                  configs=configs)
+                  configs=configs,
+                  feature_cache=feature_cache,
+                  teacher=teacher)
 
         if rank == 0:
             if epoch % configs['save_epoch_interval'] == 0 or epoch > configs[
@@ -37,12 +37,18 @@ if __name__ == '__main__':
                         help='the dimension of input embeddings')
     parser.add_argument('--exp_dir', type=str)
     parser.add_argument('--iter', type=int, default=5)
+    parser.add_argument('--num_shards',
+                        type=int,
+                        default=1,
+                        help='number of processes accumulating the '
+                        'plda stats')
     args = parser.parse_args()
 
     if args.type == '2cov':
         plda = TwoCovPLDA(scp_file=args.scp_path,
                           utt2spk_file=args.utt2spk,
-                          embed_dim=args.indim)
+                          embed_dim=args.indim,
+                          num_shards=args.num_shards)
         plda.train(args.iter)
         model_path = os.path.join(args.exp_dir, 'plda')
         plda.save_model(model_path)
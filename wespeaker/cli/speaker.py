@@ -17,23 +17,24 @@ import os
 import sys
 
 import numpy as np
-from silero_vad import load_silero_vad, read_audio, get_speech_timestamps
 import torch
 import torchaudio
-import torchaudio.compliance.kaldi as kaldi
 import yaml
-import kaldiio
 from tqdm import tqdm
 
 from wespeaker.cli.hub import Hub
 from wespeaker.cli.utils import get_args
+from wespeaker.dataset.dataset_utils import chunked_fbank
+from wespeaker.models.optimize import optimize_for_inference
 from wespeaker.models.speaker_model import get_speaker_model
 from wespeaker.utils.checkpoint import load_checkpoint
-from wespeaker.diar.umap_clusterer import cluster
-from wespeaker.diar.extract_emb import subsegment
-from wespeaker.diar.make_rttm import merge_segments
+from wespeaker.utils.long_audio import extract_windowed_embedding
 from wespeaker.utils.utils import set_seed
 
+# NOTE: silero_vad, kaldiio and the diarization modules (umap, hdbscan,
+# onnxruntime) are imported by the tasks that use them, which keeps the
+# cold start of embedding/similarity short.
+
 
 class Speaker:
 
@@ -48,12 +49,14 @@ class Speaker:
             configs['model'])(**configs['model_args'])
         load_checkpoint(self.model, model_path)
         self.model.eval()
-        self.vad = load_silero_vad()
+        self.feat_dim = configs['model_args'].get('feat_dim', 80)
+        self._vad = None
         self.table = {}
         self.resample_rate = 16000
         self.apply_vad = False
         self.device = torch.device('cpu')
         self.wavform_norm = False
+        self.frame_shift = 10  # ms, the fbank of compute_fbank
 
         # diarization parmas
         self.diar_min_duration = 0.255
@@ -63,6 +66,21 @@ class Speaker:
         self.diar_batch_size = 32
         self.diar_subseg_cmn = True
 
+        # long audio params, longer utterances are extracted window by window
+        self.long_audio_secs = None
+        self.long_audio_window_secs = 10.0
+        self.long_audio_shift_secs = 5.0
+        self.long_audio_batch_size = 16
+        self.long_audio_aggregation = 'embedding'
+
+    @property
+    def vad(self):
+        # loaded on first use, only vad and diarization need it
+        if self._vad is None:
+            from silero_vad import load_silero_vad
+            self._vad = load_silero_vad()
+        return self._vad
+
     def set_wavform_norm(self, wavform_norm: bool):
         self.wavform_norm = wavform_norm
 
@@ -76,6 +94,13 @@ class Speaker:
         self.device = torch.device(device)
         self.model = self.model.to(self.device)
 
+    def optimize(self, channels_last: bool = False):
+        # fold BatchNorm etc., call it before set_device
+        self.model, _ = optimize_for_inference(self.model,
+                                               feat_dim=self.feat_dim,
+                                               channels_last=channels_last,
+                                               do_copy=False)
+
     def set_diarization_params(self,
                                min_duration: float = 0.255,
                                window_secs: float = 1.5,
@@ -90,6 +115,18 @@ class Speaker:
         self.diar_batch_size = batch_size
         self.diar_subseg_cmn = subseg_cmn
 
+    def set_long_audio_params(self,
+                              max_secs: float = None,
+                              window_secs: float = 10.0,
+                              shift_secs: float = 5.0,
+                              batch_size: int = 16,
+                              aggregation: str = 'embedding'):
+        self.long_audio_secs = max_secs
+        self.long_audio_window_secs = window_secs
+        self.long_audio_shift_secs = shift_secs
+        self.long_audio_batch_size = batch_size
+        self.long_audio_aggregation = aggregation
+
     def compute_fbank(self,
                       wavform,
                       sample_rate=16000,
@@ -97,12 +134,12 @@ class Speaker:
                       frame_length=25,
                       frame_shift=10,
                       cmn=True):
-        feat = kaldi.fbank(wavform,
-                           num_mel_bins=num_mel_bins,
-                           frame_length=frame_length,
-                           frame_shift=frame_shift,
-                           sample_frequency=sample_rate,
-                           window_type='hamming')
+        feat = chunked_fbank(wavform,
+                             num_mel_bins=num_mel_bins,
+                             frame_length=frame_length,
+                             frame_shift=frame_shift,
+                             sample_frequency=sample_rate,
+                             window_type='hamming')
         if cmn:
             feat = feat - torch.mean(feat, 0)
         return feat
@@ -130,7 +167,53 @@ class Speaker:
         return self.extract_embedding_from_pcm(pcm, sample_rate)
 
     def extract_embedding_from_pcm(self, pcm: torch.Tensor, sample_rate: int):
+        feats = self._pcm_to_feats(pcm, sample_rate)
+        if feats is None:
+            return None
+        duration_ms = feats.size(0) * self.frame_shift
+        if self.long_audio_secs is not None and \
+                duration_ms > self.long_audio_secs * 1000:
+            embedding = self._extract_windows(feats)[0]
+            return embedding.to(torch.device('cpu'))
+        feats = feats.unsqueeze(0)
+
+        with torch.no_grad():
+            outputs = self.model(feats)
+            outputs = outputs[-1] if isinstance(outputs, tuple) else outputs
+        embedding = outputs[0].to(torch.device('cpu'))
+        return embedding
+
+    def extract_window_embeddings(self, audio_path: str):
+        """ Embeddings of the windows of set_long_audio_params
+
+            Returns:
+                [(begin, end)] in seconds and the embeddings (N, D), None if
+                there is no speech
+        """
+        pcm, sample_rate = torchaudio.load(audio_path,
+                                           normalize=self.wavform_norm)
+        feats = self._pcm_to_feats(pcm, sample_rate)
+        if feats is None:
+            return None
+        _, window_embeds, bounds = self._extract_windows(feats)
+        segments = [(begin * self.frame_shift / 1000.0,
+                     end * self.frame_shift / 1000.0) for begin, end in bounds]
+        return segments, window_embeds.cpu().numpy()
+
+    def _extract_windows(self, feats):
+        return extract_windowed_embedding(
+            self.model,
+            feats,
+            window_frames=int(self.long_audio_window_secs * 1000) //
+            self.frame_shift,
+            shift_frames=int(self.long_audio_shift_secs * 1000) //
+            self.frame_shift,
+            batch_size=self.long_audio_batch_size,
+            aggregation=self.long_audio_aggregation)
+
+    def _pcm_to_feats(self, pcm: torch.Tensor, sample_rate: int):
         if self.apply_vad:
+            from silero_vad import get_speech_timestamps
             # TODO(Binbin Zhang): Refine the segments logic, here we just
             # suppose there is only silence at the start/end of the speech
             vad_sample_rate = 16000
@@ -162,14 +245,7 @@ class Speaker:
         feats = self.compute_fbank(pcm,
                                    sample_rate=self.resample_rate,
                                    cmn=True)
-        feats = feats.unsqueeze(0)
-        feats = feats.to(self.device)
-
-        with torch.no_grad():
-            outputs = self.model(feats)
-            outputs = outputs[-1] if isinstance(outputs, tuple) else outputs
-        embedding = outputs[0].to(torch.device('cpu'))
-        return embedding
+        return feats.to(self.device)
 
     def extract_embedding_list(self, scp_path: str):
         names = []
@@ -216,6 +292,11 @@ class Speaker:
         return result
 
     def diarize(self, audio_path: str, utt: str = "unk"):
+        from silero_vad import get_speech_timestamps, read_audio
+
+        from wespeaker.diar.extract_emb import subsegment
+        from wespeaker.diar.make_rttm import merge_segments
+        from wespeaker.diar.umap_clusterer import cluster
 
         pcm, sample_rate = torchaudio.load(audio_path, normalize=False)
         # 1. vad
@@ -318,6 +399,8 @@ def main():
             model = load_model(args.language)
     else:
         model = load_model_local(args.pretrain)
+    if args.optimize:
+        model.optimize()
     model.set_resample_rate(args.resample_rate)
     model.set_vad(args.vad)
     model.set_device(args.device)
@@ -327,6 +410,11 @@ def main():
                                  frame_shift=args.diar_frame_shift,
                                  batch_size=args.diar_emb_bs,
                                  subseg_cmn=args.diar_subseg_cmn)
+    model.set_long_audio_params(max_secs=args.long_audio_secs,
+                                window_secs=args.long_audio_window_secs,
+                                shift_secs=args.long_audio_shift_secs,
+                                batch_size=args.long_audio_batch_size,
+                                aggregation=args.long_audio_aggregation)
     if args.task == 'embedding':
         embedding = model.extract_embedding(args.audio_file)
         if embedding is not None:
@@ -335,6 +423,7 @@ def main():
         else:
             print('Fails to extract embedding')
     elif args.task == 'embedding_kaldi':
+        import kaldiio
         names, embeddings = model.extract_embedding_list(args.wav_scp)
         embed_ark = args.output_file + ".ark"
         embed_scp = args.output_file + ".scp"
@@ -69,6 +69,10 @@ def get_args():
                         help="device type (most commonly cpu or cuda,"
                              "but also potentially mps, xpu, xla or meta)"
                              "and optional device ordinal for the device type.")
+    parser.add_argument('--optimize',
+                        action='store_true',
+                        help='fold BatchNorm of the model for faster '
+                        'inference')
     parser.add_argument('--audio_file', help='audio file')
     parser.add_argument('--audio_file2',
                         help='audio file2, specifically for similarity task')
@@ -111,5 +115,28 @@ def get_args():
                         type=bool,
                         default=True,
                         help='do cmn after or before fbank sub-segmentation')
+    # long audio params
+    parser.add_argument('--long_audio_secs',
+                        type=float,
+                        default=None,
+                        help='extract the utterances longer than it (s) '
+                        'window by window, with a bounded memory')
+    parser.add_argument('--long_audio_window_secs',
+                        type=float,
+                        default=10.0,
+                        help='the window seconds of long audio')
+    parser.add_argument('--long_audio_shift_secs',
+                        type=float,
+                        default=5.0,
+                        help='the shift seconds of long audio')
+    parser.add_argument('--long_audio_batch_size',
+                        type=int,
+                        default=16,
+                        help='number of windows per batch of long audio')
+    parser.add_argument('--long_audio_aggregation',
+                        choices=['embedding', 'stats'],
+                        default='embedding',
+                        help='average the window embeddings or merge the '
+                        'pooling statistics (TAP/TSTP models) of long audio')
     args = parser.parse_args()
     return args
@@ -17,6 +17,7 @@
 
 import random
 
+import numpy as np
 import torch
 import torch.distributed as dist
 from torch.utils.data import IterableDataset
@@ -133,6 +134,43 @@ class DataList(IterableDataset):
                 yield data
 
 
+def get_bucket_batch_size(bucket_conf):
+    """ Batch size of each bucket, frames_per_batch frames per batch
+    """
+    return {
+        num_frms: max(1, bucket_conf['frames_per_batch'] // num_frms)
+        for num_frms in bucket_conf['bucket_num_frms']
+    }
+
+
+def bucket_batch_num(durations, configs, num_parts=1, num_samples=None):
+    """ Number of length-bucketed batches that each of num_parts readers
+        (ranks x dataloader workers) yields in one pass over the utterances,
+        every reader flushes its own partial batches. Speed perturbation and
+        the length filter are not taken into account.
+
+        Args:
+            durations: durations (seconds) of the utterances, e.g. utt2dur
+            configs: dataset configs, with bucket_args
+            num_parts: number of readers the utterances are split into
+            num_samples: number of samples of a pass, len(durations) if None
+    """
+    frontend_args = configs.get('frontend', 'fbank') + '_args'
+    frame_shift = configs.get(frontend_args, {}).get('frame_shift', 10)
+    frame_length = configs.get(frontend_args, {}).get('frame_length', 25)
+    bucket_batch_size = get_bucket_batch_size(configs['bucket_args'])
+    buckets = np.array(sorted(bucket_batch_size))
+    num_frms = (np.asarray(durations, dtype=np.float64) * 1000 -
+                frame_length) // frame_shift + 1
+    # the longest bucket each utterance fills, the smallest one otherwise
+    idx = np.maximum(np.searchsorted(buckets, num_frms, side='right') - 1, 0)
+    counts = np.bincount(idx, minlength=len(buckets)).astype(np.float64)
+    if num_samples is not None and len(durations) > 0:
+        counts *= num_samples / len(durations)
+    batch_sizes = np.array([bucket_batch_size[b] for b in buckets])
+    return int(np.ceil(counts / num_parts / batch_sizes).sum())
+
+
 def Dataset(data_type,
             data_list_file,
             configs,
@@ -191,8 +229,21 @@ def Dataset(data_type,
     # spk2id
     dataset = Processor(dataset, processor.spk_to_id, spk2id_dict)
 
+    # length bucketing: each sample is chunked to one of a few lengths and
+    # batched with samples of the same length, the batch size of a bucket
+    # keeps the number of frames per batch constant
+    bucket_flag = configs.get('bucket', False) and not whole_utt
+    if bucket_flag:
+        bucket_num_frms = configs['bucket_args']['bucket_num_frms']
+        bucket_batch_size = get_bucket_batch_size(configs['bucket_args'])
+        frame_shift = configs[frontend_args].get('frame_shift', 10)
+        frame_length = configs[frontend_args].get('frame_length', 25)
+
     if data_type == 'feat':
-        if not whole_utt:
+        if bucket_flag:
+            dataset = Processor(dataset, processor.bucket_random_chunk,
+                                bucket_num_frms, 'feat')
+        elif not whole_utt:
             # random chunk
             chunk_len = num_frms = configs.get('num_frms', 200)
             dataset = Processor(dataset, processor.random_chunk, chunk_len,
@@ -206,7 +257,31 @@ def Dataset(data_type,
         if speed_perturb_flag:
             dataset = Processor(dataset, processor.speed_perturb,
                                 len(spk2id_dict))
-        if not whole_utt:
+        # the frozen upstream feature cache needs clean chunks which
+        # come back across epochs
+        feature_cache_flag = configs.get('feature_cache', False) \
+            and not whole_utt
+        if feature_cache_flag:
+            assert not speed_perturb_flag and not bucket_flag, \
+                'feature_cache does not support speed_perturb or bucket'
+            assert not (reverb_lmdb_file and noise_lmdb_file) or \
+                configs.get('aug_prob', 0.6) == 0.0, \
+                'feature_cache needs aug_prob: 0.0'
+            num_frms = configs.get('num_frms', 200)
+            frame_shift = configs[frontend_args].get('frame_shift', 10)
+            frame_length = configs[frontend_args].get('frame_length', 25)
+            chunk_len = ((num_frms - 1) * frame_shift +
+                         frame_length) * resample_rate // 1000
+            num_chunks = configs['feature_cache_args'].get(
+                'chunks_per_utt', 4)
+            dataset = Processor(dataset, processor.grid_random_chunk,
+                                chunk_len, num_chunks,
+                                frame_shift * resample_rate // 1000)
+        elif bucket_flag:
+            dataset = Processor(dataset, processor.bucket_random_chunk,
+                                bucket_num_frms, data_type, frame_shift,
+                                frame_length)
+        elif not whole_utt:
             # random chunk
             num_frms = configs.get('num_frms', 200)
             frame_shift = configs[frontend_args].get('frame_shift', 10)
@@ -228,6 +303,16 @@ def Dataset(data_type,
             dataset = Processor(dataset, processor.compute_fbank,
                                 **configs['fbank_args'])
 
+    if bucket_flag:
+        # batches are built here, use DataLoader(batch_size=None)
+        dataset = Processor(dataset, processor.bucket_batch, bucket_batch_size,
+                            frame_shift, frame_length)
+    elif whole_utt and configs.get('sort_pad_batch', False):
+        # padded batches of whole utterances (extraction), built here,
+        # use DataLoader(batch_size=None)
+        dataset = Processor(dataset, processor.sort_pad_batch,
+                            **configs.get('sort_pad_batch_args', {}))
+
     # !!!IMPORTANT NOTICE!!!
     # To support different frontends (including ssl pretrained models),
     # we have to move apply_cmvn and spec_aug out of the dataset pipeline
@@ -12,12 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import random
 import torch
+import torchaudio.compliance.kaldi as kaldi
 
 
-def apply_cmvn(feats, norm_mean=True, norm_var=False):
+def apply_cmvn(feats, norm_mean=True, norm_var=False, lengths=None):
     # feats batch: (B,T,F)
+    if lengths is not None:
+        return _apply_masked_cmvn(feats, norm_mean, norm_var, lengths)
     if norm_mean:
         feats = feats - torch.mean(feats, dim=1, keepdim=True)
     if norm_var:
@@ -26,28 +28,80 @@ def apply_cmvn(feats, norm_mean=True, norm_var=False):
     return feats
 
 
+def _apply_masked_cmvn(feats, norm_mean, norm_var, lengths):
+    """ cmvn over the valid frames of a padded batch, lengths (B,) relative
+        lengths in (0, 1], the padded frames stay zero
+    """
+    num_frms = torch.round(lengths * feats.size(1)).clamp(min=1)
+    mask = (torch.arange(feats.size(1), device=feats.device).unsqueeze(0) <
+            num_frms.unsqueeze(1)).unsqueeze(2).to(feats.dtype)
+    num_frms = num_frms.view(-1, 1, 1).to(feats.dtype)
+    if norm_mean:
+        mean = (feats * mask).sum(dim=1, keepdim=True) / num_frms
+        feats = feats - mean
+    if norm_var:
+        mean = (feats * mask).sum(dim=1, keepdim=True) / num_frms
+        var = ((feats - mean)**2 * mask).sum(dim=1, keepdim=True) / \
+            (num_frms - 1).clamp(min=1)
+        feats = feats / torch.sqrt(var + 1e-7)
+    return feats * mask
+
+
+def _random_span_mask(batch_size, num_mask, max_len, dim_size, device):
+    """ Sample num_mask spans of width [1, max_len] for each sample and
+        return the union of them as a (B, dim_size) boolean mask
+    """
+    starts = torch.randint(0, dim_size, (batch_size, num_mask, 1),
+                           device=device)
+    lengths = torch.randint(1, max_len + 1, (batch_size, num_mask, 1),
+                            device=device)
+    index = torch.arange(dim_size, device=device)
+    mask = (index >= starts) & (index < starts + lengths)
+    return mask.any(dim=1)
+
+
 def spec_aug(feats, num_t_mask=1, num_f_mask=1, max_t=10, max_f=8, prob=0.6):
     # feats batch: (B,T,F)
-    # do spec_aug on all batch samples using a same group of params randomly
-    # TODO (hongji): do spec_aug on each sample separately
-    if random.random() < prob:
-        x = feats
-        assert isinstance(x, torch.Tensor)
-        # y = x.clone().detach()
-        y = x.detach()  # inplace operation
-        _, max_frames, max_freq = y.shape
-        # time mask
-        for i in range(num_t_mask):
-            start = random.randint(0, max_frames - 1)
-            length = random.randint(1, max_t)
-            end = min(max_frames, start + length)
-            y[:, start:end, :] = 0
-        # freq mask
-        for i in range(num_f_mask):
-            start = random.randint(0, max_freq - 1)
-            length = random.randint(1, max_f)
-            end = min(max_freq, start + length)
-            y[:, :, start:end] = 0
-        feats = y
+    # do spec_aug on each sample separately, all the masks of the batch are
+    # built as boolean tensors on the device and applied in one op
+    assert isinstance(feats, torch.Tensor)
+    batch_size, max_frames, max_freq = feats.shape
+    device = feats.device
+    t_mask = _random_span_mask(batch_size, num_t_mask, max_t, max_frames,
+                               device)  # (B,T)
+    f_mask = _random_span_mask(batch_size, num_f_mask, max_f, max_freq,
+                               device)  # (B,F)
+    do_aug = torch.rand(batch_size, device=device) < prob  # (B)
+    mask = (t_mask.unsqueeze(2) | f_mask.unsqueeze(1)) & do_aug.view(-1, 1, 1)
+    return feats.masked_fill(mask, 0.0)
 
-    return feats
+
+def chunked_fbank(wavform,
+                  chunk_frames=6000,
+                  frame_length=25,
+                  frame_shift=10,
+                  sample_frequency=16000,
+                  **fbank_args):
+    """ kaldi.fbank of wavform (1, N), computed chunk_frames frames at a
+        time. The frames are computed independently of each other, the
+        result equals the one of a single kaldi.fbank call (without dither)
+        while the framing buffers stay bounded.
+    """
+    assert fbank_args.get('snip_edges', True), 'snip_edges is required'
+    shift = int(sample_frequency * frame_shift * 0.001)
+    length = int(sample_frequency * frame_length * 0.001)
+    num_frames = 1 + (wavform.size(-1) - length) // shift
+    ranges = [(0, wavform.size(-1))]
+    if num_frames > chunk_frames:
+        ranges = []
+        for begin in range(0, num_frames, chunk_frames):
+            end = min(begin + chunk_frames, num_frames)
+            ranges.append((begin * shift, (end - 1) * shift + length))
+    feats = [
+        kaldi.fbank(wavform[:, begin:end],
+                    frame_length=frame_length,
+                    frame_shift=frame_shift,
+                    sample_frequency=sample_frequency,
+                    **fbank_args) for begin, end in ranges
+    ]
+    return feats[0] if len(feats) == 1 else torch.cat(feats)
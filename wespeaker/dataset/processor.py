@@ -29,7 +29,9 @@ from scipy import signal
 from scipy.io import wavfile
 import torch
 import torchaudio
-import torchaudio.compliance.kaldi as kaldi
+
+from wespeaker.dataset.dataset_utils import chunked_fbank
+from wespeaker.dataset.dataset_utils import spec_aug as batch_spec_aug
 
 AUDIO_FORMAT_SETS = set(['flac', 'mp3', 'm4a', 'ogg', 'opus', 'wav', 'wma'])
 
@@ -394,6 +396,229 @@ def random_chunk(data, chunk_len, data_type='shard/raw/feat'):
         yield sample
 
 
+def cache_chunk_offsets(wav_len, chunk_len, num_chunks, step):
+    """ The chunk offsets (samples) of a waveform for the upstream feature
+        cache: num_chunks offsets spread evenly over the waveform and snapped
+        to step samples, [0] if the waveform is not longer than chunk_len.
+
+        Args:
+            wav_len: waveform length (samples)
+            chunk_len: chunk length (samples)
+            num_chunks: number of distinct chunks of an utterance
+            step: the offsets are multiples of step (samples)
+
+        Returns:
+            List[int], sorted
+    """
+    if wav_len <= chunk_len:
+        return [0]
+    max_offset = (wav_len - chunk_len) // step
+    return sorted(
+        set((2 * i + 1) * max_offset // (2 * num_chunks) * step
+            for i in range(num_chunks)))
+
+
+def grid_random_chunk(data, chunk_len, num_chunks, step):
+    """ Random chunk the waveform among its cache_chunk_offsets() and record
+        the offset as sample['chunk_offset'], so that the same few chunks
+        come back in every epoch, which is what the frozen upstream feature
+        cache needs. Short utterances are repeat-padded as in random_chunk,
+        with chunk_offset 0.
+
+        Args:
+            data: Iterable[{key, wav, label}]
+            chunk_len: chunk length for each sample (samples)
+            num_chunks: number of distinct chunks of an utterance
+            step: the offsets are multiples of step (samples)
+
+        Returns:
+            Iterable[{key, wav, label, chunk_offset}]
+    """
+    for sample in data:
+        assert 'key' in sample
+        assert 'wav' in sample
+        wav = sample['wav'][0]
+        offset = 0
+        if len(wav) > chunk_len:
+            offset = random.choice(
+                cache_chunk_offsets(len(wav), chunk_len, num_chunks, step))
+            # re-clone the data to avoid memory leakage
+            wav = wav[offset:offset + chunk_len].clone()
+        else:
+            wav = get_random_chunk(wav, chunk_len)
+        sample['wav'] = wav.unsqueeze(0)
+        sample['chunk_offset'] = offset
+        yield sample
+
+
+def bucket_random_chunk(data,
+                        bucket_num_frms,
+                        data_type='shard/raw/feat',
+                        frame_shift=10,
+                        frame_length=25):
+    """ Random chunk each sample to the longest bucket length that it can
+        fill, utterances shorter than the smallest bucket are repeat-padded
+        to it. This replaces random_chunk when length bucketing is on.
+
+        Args:
+            data: Iterable[{key, wav/feat, label, sample_rate}]
+            bucket_num_frms: list of chunk lengths (number of frames)
+            frame_shift: the frame shift of the acoustic features (ms)
+            frame_length: the frame length of the acoustic features (ms)
+
+        Returns:
+            Iterable[{key, wav/feat, label, sample_rate}]
+    """
+    bucket_num_frms = sorted(bucket_num_frms)
+    for sample in data:
+        assert 'key' in sample
+
+        if data_type == 'feat':
+            assert 'feat' in sample
+            num_frms = len(sample['feat'])
+        else:
+            assert 'wav' in sample
+            assert 'sample_rate' in sample
+            sample_rate = sample['sample_rate']
+            num_frms = (sample['wav'].size(1) * 1000 // sample_rate -
+                        frame_length) // frame_shift + 1
+        chunk_frms = bucket_num_frms[0]
+        for bucket in bucket_num_frms:
+            if bucket <= num_frms:
+                chunk_frms = bucket
+
+        if data_type == 'feat':
+            sample['feat'] = get_random_chunk(sample['feat'], chunk_frms)
+        else:
+            chunk_len = ((chunk_frms - 1) * frame_shift +
+                         frame_length) * sample_rate // 1000
+            wav = get_random_chunk(sample['wav'][0], chunk_len)
+            sample['wav'] = wav.unsqueeze(0)
+        yield sample
+
+
+def bucket_batch(data, bucket_batch_size, frame_shift=10, frame_length=25):
+    """ Batch the samples of the same bucket (chunk length) together, so
+        that every batch has a uniform length and no padding is needed.
+        Should be placed after bucket_random_chunk and compute_fbank, and
+        the DataLoader should be built with batch_size=None.
+
+        Args:
+            data: Iterable[{key, wav/feat, label}]
+            bucket_batch_size: Dict[int, int], number of frames of a bucket
+                to its batch size
+            frame_shift: the frame shift of the acoustic features (ms)
+            frame_length: the frame length of the acoustic features (ms)
+
+        Returns:
+            Iterable[{key: List[str], label: (B), wav/feat: (B,1,W)/(B,T,F)}]
+    """
+
+    def _collate(samples):
+        batch = dict(key=[x['key'] for x in samples],
+                     label=torch.tensor([x['label'] for x in samples],
+                                        dtype=torch.int64))
+        if 'feat' in samples[0]:
+            batch['feat'] = torch.stack([x['feat'] for x in samples])
+        else:
+            batch['wav'] = torch.stack([x['wav'] for x in samples])
+        return batch
+
+    buckets = {}
+    for sample in data:
+        if 'feat' in sample:
+            num_frms = len(sample['feat'])
+        else:
+            num_frms = (sample['wav'].size(1) * 1000 //
+                        sample['sample_rate'] - frame_length) // \
+                frame_shift + 1
+        buf = buckets.setdefault(num_frms, [])
+        buf.append(sample)
+        if len(buf) >= bucket_batch_size[num_frms]:
+            yield _collate(buf)
+            buckets[num_frms] = []
+    # The samples left over
+    for buf in buckets.values():
+        if len(buf) > 0:
+            yield _collate(buf)
+
+
+def sort_pad_batch(data,
+                   sort_size=2000,
+                   max_batch_size=64,
+                   frames_per_batch=64000):
+    """ Batch whole utterances of similar lengths: sort_size samples are
+        sorted by length and cut into batches of at most max_batch_size
+        samples and frames_per_batch padded frames (or samples of the
+        waveform), padded at the end with zeros. Each sample gets its
+        position in the data list as index, so that the original order can
+        be restored. Should be placed last, the DataLoader should be built
+        with batch_size=None.
+
+        Args:
+            data: Iterable[{key, wav/feat, label}]
+            sort_size: number of samples sorted together
+            max_batch_size: max number of samples in a batch
+            frames_per_batch: max number of padded frames (feat) or
+                samples (wav) in a batch
+
+        Returns:
+            Iterable[{key: List[str], index: (B), label: (B),
+                      wav/feat: (B,1,W)/(B,T,F), lengths: (B)}], lengths
+                are relative to the padded length, in (0, 1]
+    """
+
+    def _length(sample):
+        return len(sample['feat']) if 'feat' in sample else \
+            sample['wav'].size(1)
+
+    def _collate(samples):
+        lengths = [_length(x) for x in samples]
+        max_len = max(lengths)
+        batch = dict(key=[x['key'] for x in samples],
+                     index=torch.tensor([x['index'] for x in samples],
+                                        dtype=torch.int64),
+                     label=torch.tensor([x['label'] for x in samples],
+                                        dtype=torch.int64),
+                     lengths=torch.tensor(lengths,
+                                          dtype=torch.float32) / max_len)
+        if 'feat' in samples[0]:
+            feat = samples[0]['feat']
+            batch['feat'] = feat.new_zeros(len(samples), max_len,
+                                           feat.size(1))
+            for i, x in enumerate(samples):
+                batch['feat'][i, :lengths[i]] = x['feat']
+        else:
+            wav = samples[0]['wav']
+            batch['wav'] = wav.new_zeros(len(samples), wav.size(0), max_len)
+            for i, x in enumerate(samples):
+                batch['wav'][i, :, :lengths[i]] = x['wav']
+        return batch
+
+    def _batches(buf):
+        buf.sort(key=_length)
+        batch = []
+        for sample in buf:
+            # sorted, the new sample is the longest one
+            if len(batch) == max_batch_size or (len(batch) > 0 and (
+                    len(batch) + 1) * _length(sample) > frames_per_batch):
+                yield _collate(batch)
+                batch = []
+            batch.append(sample)
+        if len(batch) > 0:
+            yield _collate(batch)
+
+    buf = []
+    for index, sample in enumerate(data):
+        sample['index'] = index
+        buf.append(sample)
+        if len(buf) >= sort_size:
+            yield from _batches(buf)
+            buf = []
+    # The samples left over
+    yield from _batches(buf)
+
+
 def add_reverb_noise(data,
                      reverb_source,
                      noise_source,
@@ -491,14 +716,15 @@ def compute_fbank(data,
         waveform = sample['wav']
         waveform = waveform * (1 << 15)
         # Only keep key, feat, label
-        mat = kaldi.fbank(waveform,
-                          num_mel_bins=num_mel_bins,
-                          frame_length=frame_length,
-                          frame_shift=frame_shift,
-                          dither=dither,
-                          sample_frequency=sample_rate,
-                          window_type='hamming',
-                          use_energy=False)
+        # chunk by chunk, bounded buffers for long whole utterances
+        mat = chunked_fbank(waveform,
+                            num_mel_bins=num_mel_bins,
+                            frame_length=frame_length,
+                            frame_shift=frame_shift,
+                            dither=dither,
+                            sample_frequency=sample_rate,
+                            window_type='hamming',
+                            use_energy=False)
         yield dict(key=sample['key'], label=sample['label'], feat=mat)
 
 
@@ -525,7 +751,6 @@ def apply_cmvn(data, norm_mean=True, norm_var=False):
 
 def spec_aug(data, num_t_mask=1, num_f_mask=1, max_t=10, max_f=8, prob=0.6):
     """ Do spec augmentation
-        Inplace operation
 
         Args:
             data: Iterable[{key, feat, label}]
@@ -539,25 +764,12 @@ def spec_aug(data, num_t_mask=1, num_f_mask=1, max_t=10, max_f=8, prob=0.6):
             Iterable[{key, feat, label}]
     """
     for sample in data:
-        if random.random() < prob:
-            assert 'feat' in sample
-            x = sample['feat']
-            assert isinstance(x, torch.Tensor)
-            # y = x.clone().detach()
-            y = x.detach()  # inplace operation
-            max_frames = y.size(0)
-            max_freq = y.size(1)
-            # time mask
-            for i in range(num_t_mask):
-                start = random.randint(0, max_frames - 1)
-                length = random.randint(1, max_t)
-                end = min(max_frames, start + length)
-                y[start:end, :] = 0
-            # freq mask
-            for i in range(num_f_mask):
-                start = random.randint(0, max_freq - 1)
-                length = random.randint(1, max_f)
-                end = min(max_freq, start + length)
-                y[:, start:end] = 0
-            sample['feat'] = y
+        assert 'feat' in sample
+        x = sample['feat']
+        sample['feat'] = batch_spec_aug(x.unsqueeze(0),
+                                        num_t_mask=num_t_mask,
+                                        num_f_mask=num_f_mask,
+                                        max_t=max_t,
+                                        max_f=max_f,
+                                        prob=prob).squeeze(0)
         yield sample
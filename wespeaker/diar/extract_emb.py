@@ -22,12 +22,13 @@ from collections import OrderedDict
 import numpy as np
 from tqdm import tqdm
 
-import onnxruntime as ort
 from wespeaker.utils.utils import validate_path
 
 
 def init_session(source, device):
     # Initialize ONNX session
+    import onnxruntime as ort
+
     if device == "cpu":
         providers = ["CPUExecutionProvider"]
     elif device == "cuda":
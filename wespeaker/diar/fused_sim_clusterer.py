@@ -56,7 +56,6 @@ import functools
 import re
 from collections import OrderedDict
 
-import kaldiio
 import numpy as np
 import scipy.linalg
 from scipy.cluster.hierarchy import fcluster, linkage
@@ -64,6 +63,7 @@ from scipy.spatial.distance import squareform
 from sklearn.cluster._kmeans import k_means
 
 from wespeaker.diar.ahc_clusterer import _absorb_small_clusters
+from wespeaker.utils.embedding_store import load_embeddings
 from wespeaker.utils.utils import validate_path
 
 # Diarization embedding keys end with "-{8-digit}-{8-digit}" (frame indices
@@ -111,7 +111,7 @@ def _mismatch_window_hint(
 
 def read_emb_by_utt(scp):
     emb_dict = OrderedDict()
-    for sub_seg_id, emb in kaldiio.load_scp_sequential(scp):
+    for sub_seg_id, emb in zip(*load_embeddings(scp)):
         utt = sub_seg_id.split("-")[0]
         if utt not in emb_dict:
             emb_dict[utt] = {"sub_seg": [], "embs": []}
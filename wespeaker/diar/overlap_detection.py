@@ -99,10 +99,10 @@ def read_rttm(path):
 
 def compute_speaker_centroids(emb_scp, rttm_dict):
     """Compute per-utterance speaker centroids from embeddings and RTTM."""
-    import kaldiio
+    from wespeaker.utils.embedding_store import load_embeddings
 
     utt_embs = defaultdict(list)
-    for subseg_id, emb in kaldiio.load_scp_sequential(emb_scp):
+    for subseg_id, emb in zip(*load_embeddings(emb_scp)):
         parts = subseg_id.split("-")
         utt = parts[0]
         begin_ms = int(parts[1])
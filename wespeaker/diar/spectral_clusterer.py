@@ -22,11 +22,11 @@ os.environ["NUMEXPR_NUM_THREADS"] = "1"
 import argparse
 from collections import OrderedDict
 import concurrent.futures as cf
-import kaldiio
 
 import numpy as np
 import scipy.linalg
 from sklearn.cluster._kmeans import k_means
+from wespeaker.utils.embedding_store import load_embeddings
 from wespeaker.utils.utils import validate_path
 
 
@@ -88,20 +88,16 @@ def cluster(embeddings, p=.01, num_spks=None, min_num_spks=1, max_num_spks=20):
 
 
 def read_emb(scp):
-    emb_dict = OrderedDict()
-    for sub_seg_id, emb in kaldiio.load_scp_sequential(scp):
-        utt = sub_seg_id.split('-')[0]
-        if utt not in emb_dict:
-            emb_dict[utt] = {}
-            emb_dict[utt]['sub_seg'] = []
-            emb_dict[utt]['embs'] = []
-        emb_dict[utt]['sub_seg'].append(sub_seg_id)
-        emb_dict[utt]['embs'].append(emb)
+    # kaldi scp or embedding store, the rows of each utt are gathered
+    sub_seg_ids, embs = load_embeddings(scp)
+    utt2rows = OrderedDict()
+    for i, sub_seg_id in enumerate(sub_seg_ids):
+        utt2rows.setdefault(sub_seg_id.split('-')[0], []).append(i)
     subsegs_list = []
     embeddings_list = []
-    for utt, utt_emb_dict in emb_dict.items():
-        subsegs_list.append(utt_emb_dict['sub_seg'])
-        embeddings_list.append(np.stack(utt_emb_dict['embs']))
+    for rows in utt2rows.values():
+        subsegs_list.append([sub_seg_ids[i] for i in rows])
+        embeddings_list.append(embs[rows])
     return subsegs_list, embeddings_list
 
 
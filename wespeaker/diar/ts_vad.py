@@ -50,7 +50,8 @@ import sys
 from collections import OrderedDict, defaultdict
 
 import numpy as np
-import kaldiio
+
+from wespeaker.utils.embedding_store import load_embeddings
 
 
 # ---------------------------------------------------------------------------
@@ -73,7 +74,7 @@ def _read_rttm(path):
 def _read_emb_by_utt(scp):
     """Return {utt: [(subseg_id, begin_sec, end_sec, emb), ...]}."""
     utt_embs = OrderedDict()
-    for subseg_id, emb in kaldiio.load_scp_sequential(scp):
+    for subseg_id, emb in zip(*load_embeddings(scp)):
         parts = subseg_id.split("-")
         utt = parts[0]
         # Sub-segment id: utt-beginMS-endMS-beginFrame-endFrame
@@ -46,11 +46,12 @@ import sys
 from collections import OrderedDict
 
 import numpy as np
-import kaldiio
 from scipy.special import logsumexp
 from scipy.cluster.hierarchy import fcluster, linkage
 from scipy.spatial.distance import squareform
 
+from wespeaker.utils.embedding_store import load_embeddings
+
 
 # ---------------------------------------------------------------------------
 # AHC initialization (lightweight, no extra imports)
@@ -239,18 +240,16 @@ def cluster(embeddings, Fa=0.4, Fb=17.0, loopP=0.95,
 # ---------------------------------------------------------------------------
 
 def read_emb(scp):
-    emb_dict = OrderedDict()
-    for sub_seg_id, emb in kaldiio.load_scp_sequential(scp):
-        utt = sub_seg_id.split("-")[0]
-        if utt not in emb_dict:
-            emb_dict[utt] = {"sub_seg": [], "embs": []}
-        emb_dict[utt]["sub_seg"].append(sub_seg_id)
-        emb_dict[utt]["embs"].append(emb)
+    # kaldi scp or embedding store, the rows of each utt are gathered
+    sub_seg_ids, embs = load_embeddings(scp)
+    utt2rows = OrderedDict()
+    for i, sub_seg_id in enumerate(sub_seg_ids):
+        utt2rows.setdefault(sub_seg_id.split("-")[0], []).append(i)
     subsegs_list = []
     embeddings_list = []
-    for utt, d in emb_dict.items():
-        subsegs_list.append(d["sub_seg"])
-        embeddings_list.append(np.stack(d["embs"]))
+    for rows in utt2rows.values():
+        subsegs_list.append([sub_seg_ids[i] for i in rows])
+        embeddings_list.append(embs[rows])
     return subsegs_list, embeddings_list
 
 
@@ -0,0 +1,165 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Disk cache of the hidden states of a frozen upstream frontend.
+
+With a frozen s3prl upstream or whisper encoder, the upstream output of a
+waveform chunk never changes, only the featurizer and the speaker model are
+trained. The cache stores the upstream output of each training chunk in an
+lmdb database, keyed by (utt, chunk offset, chunk length), quantized to
+float16 or to int8 with one float16 scale per frame and layer. It is filled
+during the first epoch (or offline by wespeaker/bin/cache_upstream_feats.py)
+and read back in the following epochs.
+
+Each utterance only has chunks_per_utt distinct chunks
+(processor.cache_chunk_offsets), the chunks of an epoch are drawn among
+them, so that the cache is hit once they are stored and its size is bounded
+by num_utts * chunks_per_utt entries. The waveform augmentations have to be
+disabled since the cached hidden states are those of the clean chunk.
+
+An entry holds every layer the featurizer weights, e.g. 25 x 1024 float16
+per frame (50 KB) for WavLM-large, about 7.7 MB for a 3 s chunk: select
+fewer layers (s3prl_args.layer_selections) and/or use int8 to reduce it.
+When the database reaches map_size, the new chunks are no longer cached
+(a warning is printed once) and their upstream runs every epoch.
+"""
+
+import io
+
+import lmdb
+import numpy as np
+import torch
+
+
+class UpstreamFeatureCache:
+
+    def __init__(self, cache_dir, dtype='float16', map_size=2**42):
+        """
+        cache_dir: the lmdb directory, shared by all the ranks
+        dtype: float16 or int8
+        map_size: the maximum size of the database (bytes), it is only
+            reserved as virtual memory
+        """
+        assert dtype in ['float16', 'int8']
+        self.cache_dir = cache_dir
+        self.dtype = dtype
+        self.map_size = map_size
+        self.db = None
+        self.num_hits = 0
+        self.num_misses = 0
+        self.full = False
+
+    def _open(self):
+        # opened lazily, an lmdb environment must not cross a fork
+        if self.db is None:
+            self.db = lmdb.open(self.cache_dir,
+                                map_size=self.map_size,
+                                readahead=False,
+                                meminit=False)
+        return self.db
+
+    @staticmethod
+    def make_key(utt, offset, length):
+        return '{}/{}/{}'.format(utt, offset, length).encode()
+
+    def encode(self, feat):
+        """ feat: torch.Tensor (..., D) of one chunk => bytes
+        """
+        feat = feat.float().cpu().numpy()
+        buf = io.BytesIO()
+        if self.dtype == 'float16':
+            np.save(buf, feat.astype(np.float16))
+        else:
+            scale = np.abs(feat).max(axis=-1, keepdims=True) / 127.0
+            scale = np.maximum(scale, 1e-8).astype(np.float16)
+            quant = np.round(feat / scale.astype(np.float32))
+            np.save(buf, quant.clip(-127, 127).astype(np.int8))
+            np.save(buf, scale)
+        return buf.getvalue()
+
+    @staticmethod
+    def decode(value):
+        buf = io.BytesIO(value)
+        feat = np.load(buf)
+        if feat.dtype == np.int8:
+            feat = feat.astype(np.float32) * np.load(buf).astype(np.float32)
+        return torch.from_numpy(feat.astype(np.float32))
+
+    def __contains__(self, key):
+        with self._open().begin(write=False) as txn:
+            return txn.get(key) is not None
+
+    def get(self, keys):
+        """ Returns the decoded features, None for the missing keys
+        """
+        feats = []
+        with self._open().begin(write=False) as txn:
+            for key in keys:
+                value = txn.get(key)
+                feats.append(None if value is None else self.decode(value))
+        return feats
+
+    def put(self, keys, values):
+        """ values: the encoded features, returns the number of new entries
+            (0 once the database is full)
+        """
+        if self.full:
+            return 0
+        try:
+            with self._open().begin(write=True) as txn:
+                num_put = sum(
+                    txn.put(key, value, overwrite=False)
+                    for key, value in zip(keys, values))
+        except lmdb.MapFullError:
+            # the transaction is aborted, the cached entries stay readable
+            self.full = True
+            print('Warning: the feature cache {} reached its map_size {}, '
+                  'the new chunks are not cached'.format(
+                      self.cache_dir, self.map_size))
+            return 0
+        return num_put
+
+
+def cached_frontend_forward(frontend, cache, utts, offsets, wavs, wavs_len):
+    """ Frontend forward with the upstream output read from the cache, the
+        upstream is only run for the chunks that are not cached yet.
+
+    Args:
+        frontend: a frozen frontend with forward_upstream/forward_downstream
+        cache: UpstreamFeatureCache
+        utts: list of utterance keys
+        offsets: (B,) chunk offsets in samples
+        wavs: (B, W) waveform chunks
+        wavs_len: (B,)
+    Returns:
+        the frontend output, (B, T, D) features and their lengths
+    """
+    keys = [
+        cache.make_key(utt, int(offset), wavs.shape[1])
+        for utt, offset in zip(utts, offsets)
+    ]
+    feats = cache.get(keys)
+    miss = [i for i, feat in enumerate(feats) if feat is None]
+    cache.num_hits += len(keys) - len(miss)
+    cache.num_misses += len(miss)
+    if len(miss) > 0:
+        with torch.no_grad():
+            miss_feats = frontend.forward_upstream(wavs[miss], wavs_len[miss])
+        # the new chunks go through the same quantization as the cached
+        # ones, so that a chunk looks the same in every epoch
+        values = [cache.encode(feat) for feat in miss_feats]
+        cache.put([keys[i] for i in miss], values)
+        for i, value in zip(miss, values):
+            feats[i] = cache.decode(value)
+    feats = torch.stack(feats).to(wavs.device)
+    return frontend.forward_downstream(feats)
@@ -28,6 +28,7 @@ class S3prlFrontend(nn.Module):
                  download_dir: str = "./s3prl_hub",
                  multilayer_feature: bool = True,
                  layer: int = -1,
+                 layer_selections: list = None,
                  frozen: bool = False,
                  frame_shift: int = 20,
                  frame_length: int = 20,
@@ -59,8 +60,7 @@ class S3prlFrontend(nn.Module):
             layer_selections = [layer]
             assert not multilayer_feature, \
                 "multilayer_feature must be False if layer is specified"
-        else:
-            layer_selections = None
+        # the layers weighted by the featurizer, all of them by default
         self.featurizer = Featurizer(self.upstream,
                                      layer_selections=layer_selections)
 
@@ -91,3 +91,38 @@ class S3prlFrontend(nn.Module):
             feats, feats_lens = self.featurizer(feats[-1:], feats_lens[-1:])
 
         return feats, feats_lens
+
+    def forward_upstream(self, input: torch.Tensor,
+                         input_lengths: torch.LongTensor):
+        """The upstream part of forward, used by the feature cache.
+
+        Returns the hidden states of the layers used by forward_downstream,
+        stacked as (B, L, T, D).
+        """
+        with torch.no_grad() if self.frozen else contextlib.nullcontext():
+            feats, _ = self.upstream(input, input_lengths)
+        if self.layer != -1:
+            feats = [feats[self.layer]]
+        elif not self.multilayer_feature:
+            feats = feats[-1:]
+        else:
+            # only the selected layers, that is what the cache stores
+            feats = [feats[i] for i in self.featurizer.layer_selections]
+        return torch.stack(feats, dim=1)
+
+    def forward_downstream(self, feats: torch.Tensor):
+        """The featurizer part of forward on the (B, L, T, D) hidden states
+        of forward_upstream, the chunks are not padded.
+        """
+        feats_lens = torch.full((feats.size(0), ),
+                                feats.size(2),
+                                dtype=torch.long,
+                                device=feats.device)
+        if self.layer != -1 or not self.multilayer_feature:
+            return feats[:, 0], feats_lens
+        # back to the positions of the selected layers among all of them,
+        # the featurizer picks them by index
+        layers = [None] * self.upstream.num_layers
+        for i, feat in zip(self.featurizer.layer_selections, feats.unbind(1)):
+            layers[i] = feat
+        return self.featurizer(layers, [feats_lens] * len(layers))
@@ -19,6 +19,7 @@ import torch.nn.functional as F
 import torch.distributed as dist
 from torch import Tensor
 from torch import nn
+from torch.utils.checkpoint import checkpoint
 
 from typing import Iterable, Optional
 
@@ -159,8 +160,11 @@ class AudioEncoder(nn.Module):
             n_head: int,
             n_layer: int,
             layer_st: int,
-            layer_ed: int):
+            layer_ed: int,
+            gradient_checkpointing: bool = False):
         super().__init__()
+        # recompute the attention blocks in backward to save memory
+        self.gradient_checkpointing = gradient_checkpointing
         self.conv1 = Conv1d(n_mels, n_state, kernel_size=3, padding=1)
         self.conv2 = Conv1d(
             n_state,
@@ -209,7 +213,11 @@ class AudioEncoder(nn.Module):
         # ----------Change: Concat block outputs------
         out = []
         for i, block in enumerate(self.blocks):
-            x = block(x)
+            if self.gradient_checkpointing and self.training and \
+                    torch.is_grad_enabled():
+                x = checkpoint(block, x, use_reentrant=False)
+            else:
+                x = block(x)
             if self.layer_st <= i <= self.layer_ed:
                 out.append(x)
 
@@ -219,6 +227,57 @@ class AudioEncoder(nn.Module):
         return xs
 
 
+class LogMelSpectrogram(nn.Module):
+    """Batched version of whisper.log_mel_spectrogram.
+
+    One STFT over the (B, W) waveforms and one matmul with the mel
+    filterbank, the max clamping is done per utterance as in whisper, so
+    the output equals stacking whisper.log_mel_spectrogram of each row.
+    The window and filters are non-persistent buffers, the state_dict is
+    unchanged.
+
+    On CPU the batch is cut into groups of about cpu_chunk_samples samples,
+    a whole batch of STFTs does not fit in the cache and is slower than the
+    per utterance loop there.
+    """
+
+    def __init__(self, n_mels=80, cpu_chunk_samples=384000):
+        super(LogMelSpectrogram, self).__init__()
+        self.cpu_chunk_samples = cpu_chunk_samples
+        self.n_fft = whisper.audio.N_FFT
+        self.hop_length = whisper.audio.HOP_LENGTH
+        self.register_buffer('window',
+                             torch.hann_window(self.n_fft),
+                             persistent=False)
+        self.register_buffer('filters',
+                             whisper.audio.mel_filters('cpu', n_mels).clone(),
+                             persistent=False)
+
+    def forward(self, wavs: Tensor):
+        """
+        wavs: (B, W) => (B, n_mels, T)
+        """
+        if wavs.is_cuda:
+            return self._log_mel(wavs)
+        rows = max(1, self.cpu_chunk_samples // wavs.size(1))
+        return torch.cat([self._log_mel(x) for x in wavs.split(rows)])
+
+    def _log_mel(self, wavs: Tensor):
+        stft = torch.stft(wavs,
+                          self.n_fft,
+                          self.hop_length,
+                          window=self.window,
+                          return_complex=True)
+        magnitudes = stft[..., :-1].abs()**2
+        mel_spec = self.filters @ magnitudes
+        log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+        log_spec = torch.maximum(
+            log_spec,
+            log_spec.amax(dim=(1, 2), keepdim=True) - 8.0)
+        log_spec = (log_spec + 4.0) / 4.0
+        return log_spec
+
+
 class whisper_encoder(torch.nn.Module):
     def __init__(self,
                  frozen=False,
@@ -229,7 +288,8 @@ class whisper_encoder(torch.nn.Module):
                  layer_st=16,
                  layer_ed=23,
                  model_path=None,
-                 sample_rate=16000
+                 sample_rate=16000,
+                 gradient_checkpointing=False
                  ):
         super(whisper_encoder, self).__init__()
         self.encoder = AudioEncoder(
@@ -239,12 +299,14 @@ class whisper_encoder(torch.nn.Module):
             n_ctx=1500,
             n_head=n_head,
             layer_st=layer_st,
-            layer_ed=layer_ed)
+            layer_ed=layer_ed,
+            gradient_checkpointing=gradient_checkpointing)
         # 0 for freeze finetune, 1 for all parameters finetune
         self.frozen = frozen
         self.single_output_size = output_size
         self.concat_layer = layer_ed - layer_st + 1
         self.n_mels = n_mels
+        self.log_mel = LogMelSpectrogram(n_mels)
 
         # load model
         if model_path:
@@ -306,16 +368,19 @@ class whisper_encoder(torch.nn.Module):
 
     def forward(self, wavs, wavs_len):
         with torch.no_grad():
-            processed_feats = []
-            for i in range(wavs.size(0)):
-                tf_tensor = wavs[i].unsqueeze(0).to(wavs.device)
-                mat = whisper.log_mel_spectrogram(
-                    tf_tensor.squeeze(), n_mels=self.n_mels)
-                processed_feats.append(mat)
-
-            feat = torch.stack(processed_feats, dim=0).to(wavs.device)
+            feat = self.log_mel(wavs)
 
         feat = feat.transpose(1, 2)
         # (B,T,F)
         x = self.encoder(feat)
         return x, None
+
+    def forward_upstream(self, wavs, wavs_len):
+        """The frozen part of forward for the feature cache, which is the
+        whole encoder output (B, T, D).
+        """
+        assert self.frozen
+        return self.forward(wavs, wavs_len)[0]
+
+    def forward_downstream(self, feats):
+        return feats, None
@@ -0,0 +1,55 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Activation (gradient) checkpointing helpers for the large backbones.
+
+The activations inside a checkpointed block are not kept for backward but
+recomputed, trading about one extra forward pass for memory that no longer
+grows with the depth of the network.
+"""
+
+import torch
+import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
+
+
+class CheckpointSequential(nn.Sequential):
+    """Drop-in nn.Sequential that recomputes each child in backward.
+
+    The children and their state_dict keys are the same as nn.Sequential,
+    so checkpoints trained with or without recomputation are exchangeable.
+    Recomputation only happens in training mode with autograd enabled, and
+    the module stays exportable with torch.jit.script. Note that BatchNorm
+    running statistics are updated once more by the recomputation, which
+    acts like a slightly larger BN momentum.
+    """
+
+    def forward(self, x):
+        if not torch.jit.is_scripting() and self.training and \
+                torch.is_grad_enabled():
+            return self._checkpoint_forward(x)
+        for module in self:
+            x = module(x)
+        return x
+
+    @torch.jit.unused
+    def _checkpoint_forward(self, x):
+        for module in self:
+            # non-reentrant mode also works when x.requires_grad is False,
+            # e.g. the first block fed directly with fbank features
+            x = checkpoint(module, x, use_reentrant=False)
+        return x
+
+
+def get_sequential(gradient_checkpointing=False):
+    return CheckpointSequential if gradient_checkpointing else nn.Sequential
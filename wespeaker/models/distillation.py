@@ -0,0 +1,121 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Teacher-student knowledge distillation of speaker embeddings.
+
+The student is trained with its usual margin loss plus
+    embedding loss: 1 - cos(W * e_student, e_teacher), where W is a linear
+        map to the teacher embedding space (identity if the dims match)
+    similarity loss: MSE between the cosine similarity matrices of the
+        student and of the teacher embeddings within a batch, which only
+        constrains the geometry and is independent of the dims
+"""
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from wespeaker.utils.embedding_store import (EmbeddingStore,
+                                             is_embedding_store,
+                                             load_embeddings)
+
+
+class EmbeddingDistiller(nn.Module):
+    """ The distillation losses, the linear map W is the only trainable
+        part. It is added to the student as `distiller` and ignored by the
+        export scripts like the projection head.
+    """
+
+    def __init__(self,
+                 embed_dim,
+                 teacher_embed_dim,
+                 embed_weight=1.0,
+                 sim_weight=1.0):
+        super(EmbeddingDistiller, self).__init__()
+        self.embed_weight = embed_weight
+        self.sim_weight = sim_weight
+        if embed_dim == teacher_embed_dim:
+            self.proj = nn.Identity()
+        else:
+            self.proj = nn.Linear(embed_dim, teacher_embed_dim, bias=False)
+
+    def forward(self, embeds, teacher_embeds):
+        """
+        embeds: (B, D) student embeddings
+        teacher_embeds: (B, D') teacher embeddings
+        """
+        embeds = embeds.float()
+        teacher_embeds = F.normalize(teacher_embeds.float(), dim=1)
+        loss = 0.0
+        if self.embed_weight > 0:
+            proj_embeds = F.normalize(self.proj(embeds), dim=1)
+            embed_loss = 1.0 - (proj_embeds * teacher_embeds).sum(dim=1)
+            loss = loss + self.embed_weight * embed_loss.mean()
+        if self.sim_weight > 0:
+            embeds = F.normalize(embeds, dim=1)
+            sim = embeds @ embeds.t()
+            teacher_sim = teacher_embeds @ teacher_embeds.t()
+            loss = loss + self.sim_weight * F.mse_loss(sim, teacher_sim)
+        return loss
+
+
+class Teacher(nn.Module):
+    """ A frozen teacher model, or the teacher embeddings cached in an
+        embedding store or a kaldi scp (e.g. extracted by
+        wespeaker/bin/extract.py on whole utterances) which removes the
+        teacher forward from training.
+    """
+
+    def __init__(self, model=None, embed_scp=None):
+        super(Teacher, self).__init__()
+        assert (model is None) != (embed_scp is None), \
+            'either a teacher model or teacher embeddings is needed'
+        self.model = model
+        self.store = None
+        if model is not None:
+            self.model.eval()
+            for param in self.model.parameters():
+                param.requires_grad_(False)
+        elif is_embedding_store(embed_scp):
+            # memory-mapped, a batch is read by one lookup
+            self.store = EmbeddingStore(embed_scp)
+            self.embed_dim = self.store.dim
+        else:
+            keys, self.matrix = load_embeddings(embed_scp)
+            self.key2row = {key: i for i, key in enumerate(keys)}
+            self.embed_dim = self.matrix.shape[1]
+
+    def embeddings(self, utts):
+        """ (len(utts), D) float32 cached embeddings of a batch
+        """
+        if self.store is not None:
+            return self.store.get(utts)
+        return self.matrix[np.array([self.key2row[utt] for utt in utts],
+                                    dtype=np.int64)]
+
+    def train(self, mode=True):
+        # the teacher always stays in eval mode (BN, dropout)
+        return super(Teacher, self).train(False)
+
+    @torch.no_grad()
+    def forward(self, features, utts):
+        """
+        features: (B, T, F), the same input as the student
+        utts: list of utterance keys
+        """
+        if self.model is None:
+            embeds = torch.from_numpy(self.embeddings(list(utts)))
+            return embeds.to(features.device)
+        outputs = self.model(features)
+        return outputs[-1] if isinstance(outputs, tuple) else outputs
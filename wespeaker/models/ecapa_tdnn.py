@@ -18,6 +18,8 @@
     https://github.com/lawlict/ECAPA-TDNN.
 '''
 
+from typing import Optional
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -224,10 +226,14 @@ class ECAPA_TDNN(nn.Module):
         out = self._get_frame_level_feat(x)[0].permute(0, 2, 1)
         return out  # (B, T, D)
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
+        """
+        x: (B, T, F), lengths: optional relative lengths (B,) in (0, 1]
+            of the zero padded samples, used for masked pooling
+        """
         out, out4 = self._get_frame_level_feat(x)
         out = F.relu(out)
-        out = self.bn(self.pool(out))
+        out = self.bn(self.pool(out, lengths))
         out = self.linear(out)
         if self.emb_bn:
             out = self.bn2(out)
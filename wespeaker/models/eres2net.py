@@ -34,11 +34,14 @@ Reference:
     Verification". arXiv preprint arXiv:2305.12838 (2023).
 '''
 
+from typing import Optional
+
 import torch
 import math
 import torch.nn as nn
 import torch.nn.functional as F
 import wespeaker.models.pooling_layers as pooling_layers
+from wespeaker.models.activation_checkpoint import get_sequential
 
 
 class ReLU(nn.Hardtanh):
@@ -253,9 +256,12 @@ class ERes2Net(nn.Module):
                  feat_dim=80,
                  embed_dim=192,
                  pooling_func='TSTP',
-                 two_emb_layer=False):
+                 two_emb_layer=False,
+                 gradient_checkpointing=False):
         super(ERes2Net, self).__init__()
         self.in_planes = m_channels
+        # recompute the residual blocks in backward to save memory
+        self.gradient_checkpointing = gradient_checkpointing
         self.feat_dim = feat_dim
         self.embed_dim = embed_dim
         self.stats_dim = int(feat_dim / 8) * m_channels * 8
@@ -349,7 +355,7 @@ class ERes2Net(nn.Module):
                 block(self.in_planes, planes, stride, baseWidth, scale,
                       expansion))
             self.in_planes = planes * self.expansion
-        return nn.Sequential(*layers)
+        return get_sequential(self.gradient_checkpointing)(*layers)
 
     def _get_frame_level_feat(self, x):
         # for inner class usage
@@ -377,9 +383,9 @@ class ERes2Net(nn.Module):
 
         return out  # (B, T, D)
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
         fuse_out1234 = self._get_frame_level_feat(x)
-        stats = self.pool(fuse_out1234)
+        stats = self.pool(fuse_out1234, lengths)
 
         embed_a = self.seg_1(stats)
         if self.two_emb_layer:
@@ -394,23 +400,27 @@ class ERes2Net(nn.Module):
 def ERes2Net34_Base(feat_dim,
                     embed_dim,
                     pooling_func='TSTP',
-                    two_emb_layer=False):
+                    two_emb_layer=False,
+                    gradient_checkpointing=False):
     return ERes2Net(32, [3, 4, 6, 3],
                     feat_dim=feat_dim,
                     embed_dim=embed_dim,
                     pooling_func=pooling_func,
-                    two_emb_layer=two_emb_layer)
+                    two_emb_layer=two_emb_layer,
+                    gradient_checkpointing=gradient_checkpointing)
 
 
 def ERes2Net34_Large(feat_dim,
                      embed_dim,
                      pooling_func='TSTP',
-                     two_emb_layer=False):
+                     two_emb_layer=False,
+                     gradient_checkpointing=False):
     return ERes2Net(64, [3, 4, 6, 3],
                     feat_dim=feat_dim,
                     embed_dim=embed_dim,
                     pooling_func=pooling_func,
-                    two_emb_layer=two_emb_layer)
+                    two_emb_layer=two_emb_layer,
+                    gradient_checkpointing=gradient_checkpointing)
 
 
 def ERes2Net34_aug(feat_dim,
@@ -419,7 +429,8 @@ def ERes2Net34_aug(feat_dim,
                    two_emb_layer=False,
                    expansion=4,
                    baseWidth=24,
-                   scale=3):
+                   scale=3,
+                   gradient_checkpointing=False):
     return ERes2Net(64, [3, 4, 6, 3],
                     expansion=expansion,
                     baseWidth=baseWidth,
@@ -427,7 +438,8 @@ def ERes2Net34_aug(feat_dim,
                     feat_dim=feat_dim,
                     embed_dim=embed_dim,
                     pooling_func=pooling_func,
-                    two_emb_layer=two_emb_layer)
+                    two_emb_layer=two_emb_layer,
+                    gradient_checkpointing=gradient_checkpointing)
 
 
 if __name__ == '__main__':
@@ -21,6 +21,8 @@ Reference:
 [2] Liu, Bei, et al. "DF-ResNet: Boosting Speaker Verification Performance 
     with Depth-First Design." INTERSPEECH. 2022. 
 '''
+from typing import Optional
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -126,10 +128,10 @@ class Gemini_DF_ResNet(nn.Module):
 
         return out  # (B, T, D)
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
 
         out = self._get_frame_level_feat(x)
-        stats = self.pool(out)
+        stats = self.pool(out, lengths)
 
         embed_a = self.seg_1(stats)
         if self.two_emb_layer:
@@ -0,0 +1,275 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Model-agnostic inference optimization of the speaker models.
+
+In eval mode a BatchNorm is a per-channel affine map, which is folded into
+the adjacent Conv/Linear:
+    Conv/Linear -> BN: into the weight rows and bias of the Conv/Linear
+    BN -> Conv/Linear: into the weight columns and bias, only for Linear
+        and Conv without padding (zero padding is applied after the BN)
+The pairs are found from the autograd graph of one forward pass, so that
+nothing depends on the model definition: a pair is folded only if the
+output of the first module is consumed by the second module only (e.g. not
+by a residual connection too) and both modules are called once. The BN is
+then replaced by nn.Identity.
+"""
+
+import copy
+import time
+
+import torch
+import torch.nn as nn
+
+_CONV_TYPES = (nn.Conv1d, nn.Conv2d, nn.Conv3d)
+_BN_TYPES = (nn.BatchNorm1d, nn.BatchNorm2d, nn.BatchNorm3d)
+
+
+def _bn_scale_shift(bn):
+    """ BN(x) = x * scale + shift per channel in eval mode
+    """
+    std = torch.sqrt(bn.running_var + bn.eps)
+    if bn.affine:
+        scale = bn.weight / std
+        shift = bn.bias - bn.running_mean * scale
+    else:
+        scale = 1.0 / std
+        shift = -bn.running_mean * scale
+    return scale.detach(), shift.detach()
+
+
+def _set_bias(module, bias):
+    if module.bias is None:
+        module.bias = nn.Parameter(bias)
+    else:
+        module.bias.data.copy_(bias)
+
+
+def _fold_bn_after(module, bn):
+    """ module -> bn  =>  module'
+    """
+    scale, shift = _bn_scale_shift(bn)
+    weight = module.weight.data
+    view = [-1] + [1] * (weight.dim() - 1)
+    bias = module.bias.data if module.bias is not None else \
+        torch.zeros_like(scale)
+    module.weight.data = weight * scale.view(view)
+    _set_bias(module, bias * scale + shift)
+
+
+def _fold_bn_before(bn, module):
+    """ bn -> module  =>  module', for Linear and Conv without padding
+    """
+    scale, shift = _bn_scale_shift(bn)
+    weight = module.weight.data
+    view = [1, -1] + [1] * (weight.dim() - 2)
+    bias = module.bias.data if module.bias is not None else \
+        weight.new_zeros(weight.shape[0])
+    # W * shift summed over the input channels (and the kernel positions)
+    bias = bias + (weight * shift.view(view)).flatten(1).sum(dim=1)
+    module.weight.data = weight * scale.view(view)
+    _set_bias(module, bias)
+
+
+def _can_fold_before(bn, module):
+    if isinstance(module, nn.Linear):
+        return True
+    padding = module.padding
+    if isinstance(padding, str):
+        padding = (0, ) if padding == 'valid' else (1, )
+    return module.groups == 1 and all(p == 0 for p in padding)
+
+
+def _grad_fn_users(outputs):
+    """ The number of times each autograd node is used as an input
+    """
+    users = {}
+    stack = [t.grad_fn for t in outputs if t.grad_fn is not None]
+    visited = set(stack)
+    while stack:
+        node = stack.pop()
+        for next_node, _ in node.next_functions:
+            if next_node is None:
+                continue
+            users[next_node] = users.get(next_node, 0) + 1
+            if next_node not in visited:
+                visited.add(next_node)
+                stack.append(next_node)
+    return users
+
+
+def _flatten_tensors(outputs):
+    if isinstance(outputs, torch.Tensor):
+        return [outputs]
+    tensors = []
+    if isinstance(outputs, (tuple, list)):
+        for output in outputs:
+            tensors.extend(_flatten_tensors(output))
+    return tensors
+
+
+def find_bn_pairs(model, example_input):
+    """ Find the foldable (module, bn, bn_after) triples, bn_after is True
+        for Conv/Linear -> BN and False for BN -> Conv/Linear
+    """
+    calls = {}  # module => [(input grad_fn, output grad_fn, output dim)]
+    handles = []
+
+    def hook(module, inputs, output):
+        calls.setdefault(module, []).append(
+            (inputs[0].grad_fn if len(inputs) > 0 and
+             isinstance(inputs[0], torch.Tensor) else None, output.grad_fn,
+             output.dim()))
+
+    for module in model.modules():
+        if isinstance(module, _CONV_TYPES + (nn.Linear, ) + _BN_TYPES):
+            handles.append(module.register_forward_hook(hook))
+    # a non-leaf input so that every activation has a grad_fn, and in-place
+    # ops on the input (e.g. unsqueeze_) are still allowed
+    feats = example_input.detach().requires_grad_(True)
+    try:
+        with torch.enable_grad():
+            outputs = model(feats.clone())
+    finally:
+        for handle in handles:
+            handle.remove()
+    users = _grad_fn_users(_flatten_tensors(outputs))
+
+    # output grad_fn => the module called once that produced it
+    producers = {
+        outs[0][1]: module
+        for module, outs in calls.items()
+        if len(outs) == 1 and outs[0][1] is not None
+    }
+    pairs, used = [], set()
+    for bn, bn_calls in calls.items():
+        if not isinstance(bn, _BN_TYPES) or len(bn_calls) != 1:
+            continue
+        bn_input, bn_output, bn_dim = bn_calls[0]
+        # the channels of BN are the features of Linear for 2D input only
+        module = producers.get(bn_input)
+        if module is not None and not isinstance(module, _BN_TYPES) and \
+                users.get(bn_input, 0) == 1 and module not in used and \
+                (bn_dim == 2 or not isinstance(module, nn.Linear)):
+            pairs.append((module, bn, True))
+            used.update([module, bn])
+            continue
+        if users.get(bn_output, 0) != 1:
+            continue
+        for module, outs in calls.items():
+            if len(outs) == 1 and outs[0][0] is bn_output and \
+                    not isinstance(module, _BN_TYPES) and \
+                    module not in used and _can_fold_before(bn, module) and \
+                    (bn_dim == 2 or not isinstance(module, nn.Linear)):
+                pairs.append((module, bn, False))
+                used.update([module, bn])
+                break
+    return pairs
+
+
+def _replace_module(model, target, new_module):
+    for parent in model.modules():
+        for name, child in parent.named_children():
+            if child is target:
+                setattr(parent, name, new_module)
+
+
+def fold_batchnorm(model, example_input):
+    """ Fold the BatchNorm layers of an eval mode model in place
+
+    :param model: torch.nn.Module in eval mode
+    :param example_input: a model input for the autograd graph, e.g.
+                          torch.randn(2, 200, 80) for the fbank models
+    :return: the number of folded BatchNorm layers
+    """
+    assert not model.training, 'BatchNorm can only be folded in eval mode'
+    pairs = find_bn_pairs(model, example_input)
+    with torch.no_grad():
+        for module, bn, bn_after in pairs:
+            if bn_after:
+                _fold_bn_after(module, bn)
+            else:
+                _fold_bn_before(bn, module)
+            _replace_module(model, bn, nn.Identity())
+    return len(pairs)
+
+
+def optimize_for_inference(model,
+                           feat_dim=80,
+                           num_frms=200,
+                           channels_last=False,
+                           do_copy=True):
+    """ Speaker model => inference-only speaker model
+
+    The training-only heads (projection, distiller) are removed, the model is
+    set to eval mode without gradients, the re-parameterizable blocks (e.g.
+    RepVGG) are switched to deploy and the BatchNorm layers are folded.
+
+    :param model: the speaker model, whose forward takes (B, T, feat_dim)
+    :param channels_last: use the channels_last memory format for the 4D
+                          (Conv2d) weights, which can be faster on CPU
+    :param do_copy: optimize a copy and keep the given model unchanged
+    :return: (optimized model, number of folded BatchNorm layers)
+    """
+    if do_copy:
+        model = copy.deepcopy(model)
+    for name in ['projection', 'distiller']:
+        if hasattr(model, name):
+            delattr(model, name)
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    for module in model.modules():
+        if hasattr(module, 'switch_to_deploy'):
+            module.switch_to_deploy()
+    num_folded = fold_batchnorm(model, torch.randn(2, num_frms, feat_dim))
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    return model, num_folded
+
+
+def _embeds(model, feats):
+    outputs = model(feats)
+    return outputs[-1] if isinstance(outputs, tuple) else outputs
+
+
+@torch.no_grad()
+def check_equivalence(model, optimized_model, feat_dim=80,
+                      test_frms=(200, 500), batch_size=4):
+    """ Max abs difference (relative to the embedding scale) and min cosine
+        similarity of the embeddings on random inputs
+    """
+    max_diff, min_cos = 0.0, 1.0
+    for num_frms in test_frms:
+        feats = torch.randn(batch_size, num_frms, feat_dim)
+        ref = _embeds(model, feats)
+        out = _embeds(optimized_model, feats)
+        diff = (ref - out).abs().max() / ref.abs().max().clamp(min=1e-12)
+        cos = torch.nn.functional.cosine_similarity(ref, out, dim=1).min()
+        max_diff = max(max_diff, diff.item())
+        min_cos = min(min_cos, cos.item())
+    return max_diff, min_cos
+
+
+@torch.no_grad()
+def measure_latency(model, feat_dim=80, num_frms=300, batch_size=1,
+                    warmup=3, repeats=20):
+    """ Average CPU latency (ms) of one forward
+    """
+    feats = torch.randn(batch_size, num_frms, feat_dim)
+    for _ in range(warmup):
+        _embeds(model, feats)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        _embeds(model, feats)
+    return (time.perf_counter() - start) / repeats * 1000
@@ -19,11 +19,42 @@ High-order statistics are surprisingly effective, TSDP acts similarly as TSTP,
 even though we remove the mean statistic, on Voxceleb.
 """
 
+from typing import Optional
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
 
+def get_length_mask(x, lengths):
+    """ Build the mask of the valid frames for a padded batch
+
+    Args:
+        x: (B, ..., T), the last dim is the temporal axis
+        lengths: (B,), the relative length of each sample in (0, 1]
+    Returns:
+        a 0/1 mask of x.dtype, (B, 1, ..., T) broadcastable to x
+    """
+    num_frames = x.shape[-1]
+    valid = torch.round(lengths.float() * num_frames).clamp(min=1)
+    mask = torch.arange(num_frames, device=x.device).unsqueeze(0) < \
+        valid.unsqueeze(1)
+    mask = mask.to(x.dtype)
+    while mask.dim() < x.dim():
+        mask = mask.unsqueeze(1)
+    return mask
+
+
+def masked_mean_std(x, mask):
+    """ Mean and (unbiased) std over the valid frames of the last dim
+    """
+    num = mask.sum(dim=-1)
+    mean = (x * mask).sum(dim=-1) / num
+    var = ((x - mean.unsqueeze(-1))**2 * mask).sum(dim=-1) / \
+        (num - 1).clamp(min=1)
+    return mean, torch.sqrt(var + 1e-7)
+
+
 class TAP(nn.Module):
     """
     Temporal average pooling, only first-order mean is considered
@@ -33,8 +64,15 @@ class TAP(nn.Module):
         super(TAP, self).__init__()
         self.in_dim = in_dim
 
-    def forward(self, x):
-        pooling_mean = x.mean(dim=-1)
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
+        """
+        lengths: optional relative lengths (B,) of the padded samples
+        """
+        if lengths is None:
+            pooling_mean = x.mean(dim=-1)
+        else:
+            mask = get_length_mask(x, lengths)
+            pooling_mean = (x * mask).sum(dim=-1) / mask.sum(dim=-1)
         # To be compatable with 2D input
         pooling_mean = pooling_mean.flatten(start_dim=1)
         return pooling_mean
@@ -53,9 +91,12 @@ class TSDP(nn.Module):
         super(TSDP, self).__init__()
         self.in_dim = in_dim
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
         # The last dimension is the temporal axis
-        pooling_std = torch.sqrt(torch.var(x, dim=-1) + 1e-7)
+        if lengths is None:
+            pooling_std = torch.sqrt(torch.var(x, dim=-1) + 1e-7)
+        else:
+            pooling_std = masked_mean_std(x, get_length_mask(x, lengths))[1]
         pooling_std = pooling_std.flatten(start_dim=1)
         return pooling_std
 
@@ -75,10 +116,18 @@ class TSTP(nn.Module):
         super(TSTP, self).__init__()
         self.in_dim = in_dim
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
+        """
+        lengths: optional relative lengths (B,) of the padded samples,
+            the statistics are then computed over the valid frames only
+        """
         # The last dimension is the temporal axis
-        pooling_mean = x.mean(dim=-1)
-        pooling_std = torch.sqrt(torch.var(x, dim=-1) + 1e-7)
+        if lengths is None:
+            pooling_mean = x.mean(dim=-1)
+            pooling_std = torch.sqrt(torch.var(x, dim=-1) + 1e-7)
+        else:
+            pooling_mean, pooling_std = masked_mean_std(
+                x, get_length_mask(x, lengths))
         pooling_mean = pooling_mean.flatten(start_dim=1)
         pooling_std = pooling_std.flatten(start_dim=1)
         stats = torch.cat((pooling_mean, pooling_std), 1)
@@ -116,28 +165,44 @@ class ASTP(nn.Module):
         self.linear2 = nn.Conv1d(bottleneck_dim, in_dim,
                                  kernel_size=1)  # equals V and k in the paper
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
         """
         x: a 3-dimensional tensor in tdnn-based architecture (B,F,T)
             or a 4-dimensional tensor in resnet architecture (B,C,F,T)
             0-dim: batch-dimension, last-dim: time-dimension (frame-dimension)
+        lengths: optional relative lengths (B,) of the padded samples,
+            the padded frames then get zero attention weights
         """
         if len(x.shape) == 4:
             x = x.reshape(x.shape[0], x.shape[1] * x.shape[2], x.shape[3])
         assert len(x.shape) == 3
 
+        mask: Optional[torch.Tensor] = None
+        if lengths is not None:
+            mask = get_length_mask(x, lengths)
+
         if self.global_context_att:
-            context_mean = torch.mean(x, dim=-1, keepdim=True).expand_as(x)
-            context_std = torch.sqrt(
-                torch.var(x, dim=-1, keepdim=True) + 1e-7).expand_as(x)
-            x_in = torch.cat((x, context_mean, context_std), dim=1)
+            if mask is None:
+                context_mean = torch.mean(x, dim=-1, keepdim=True)
+                context_std = torch.sqrt(
+                    torch.var(x, dim=-1, keepdim=True) + 1e-7)
+            else:
+                context_mean, context_std = masked_mean_std(x, mask)
+                context_mean = context_mean.unsqueeze(-1)
+                context_std = context_std.unsqueeze(-1)
+            x_in = torch.cat((x, context_mean.expand_as(x),
+                              context_std.expand_as(x)),
+                             dim=1)
         else:
             x_in = x
 
         # DON'T use ReLU here! ReLU may be hard to converge.
         alpha = torch.tanh(
             self.linear1(x_in))  # alpha = F.relu(self.linear1(x_in))
-        alpha = torch.softmax(self.linear2(alpha), dim=2)
+        alpha = self.linear2(alpha)
+        if mask is not None:
+            alpha = alpha.masked_fill(mask == 0, float('-inf'))
+        alpha = torch.softmax(alpha, dim=2)
         mean = torch.sum(alpha * x, dim=2)
         var = torch.sum(alpha * (x**2), dim=2) - mean**2
         std = torch.sqrt(var.clamp(min=1e-7))
@@ -215,11 +280,13 @@ class MHASTP(torch.nn.Module):
             heads_att_trans.append(att_trans)
         self.heads_att_trans = nn.ModuleList(heads_att_trans)
 
-    def forward(self, input):
+    def forward(self, input, lengths: Optional[torch.Tensor] = None):
         """
         input: a 3-dimensional tensor in xvector architecture
             or a 4-dimensional tensor in resnet architecture
             0-dim: batch-dimension, last-dim: time-dimension (frame-dimension)
+        lengths: optional relative lengths (B,) of the padded samples,
+            the padded frames then get zero attention weights
         """
         if len(input.shape) == 4:  # B x F x T
             input = input.reshape(input.shape[0],
@@ -227,6 +294,9 @@ class MHASTP(torch.nn.Module):
                                   input.shape[3])
         assert len(input.shape) == 3
         bs, f_dim, t_dim = input.shape
+        mask: Optional[torch.Tensor] = None
+        if lengths is not None:
+            mask = get_length_mask(input, lengths)
         chunks = torch.chunk(input, self.head_num, 1)
         # split
         chunks_out = []
@@ -234,6 +304,8 @@ class MHASTP(torch.nn.Module):
         #     att_score = self.heads_att_trans[i](chunks[i])
         for i, layer in enumerate(self.heads_att_trans):
             att_score = layer(chunks[i])
+            if mask is not None:
+                att_score = att_score.masked_fill(mask == 0, float('-inf'))
             alpha = F.softmax(att_score, dim=-1)
             mean = torch.sum(alpha * chunks[i], dim=2)
             var = torch.sum(alpha * chunks[i]**2, dim=2) - mean**2
@@ -288,11 +360,12 @@ class MQMHASTP(torch.nn.Module):
         self.query_num = query_num
         self.in_dim = in_dim
 
-    def forward(self, input):
+    def forward(self, input, lengths: Optional[torch.Tensor] = None):
         """
         input: a 3-dimensional tensor in xvector architecture
             or a 4-dimensional tensor in resnet architecture
             0-dim: batch-dimension, last-dim: time-dimension (frame-dimension)
+        lengths: optional relative lengths (B,) of the padded samples
         """
         if len(input.shape) == 4:  # B x F x T
             input = input.reshape(input.shape[0],
@@ -301,7 +374,7 @@ class MQMHASTP(torch.nn.Module):
         assert len(input.shape) == 3
         res = []
         for i, layer in enumerate(self.n_query):
-            res.append(layer(input))
+            res.append(layer(input, lengths))
         out = torch.cat(res, dim=-1)
         return out
 
@@ -336,11 +409,12 @@ class XI(torch.nn.Module):
                               stride=1, bias=True)
         self.softplus2 = torch.nn.Softplus(beta=1, threshold=20)
 
-    def forward(self, inputs):
+    def forward(self, inputs, lengths: Optional[torch.Tensor] = None):
         """
         @inputs: a 3-dimensional tensor (a batch),
         including [samples-index, frames-dim-index, frames-index]
         """
+        assert lengths is None, 'padded input is not supported yet'
         assert len(inputs.shape) == 3
         assert inputs.shape[1] == self.input_dim
         feat = inputs
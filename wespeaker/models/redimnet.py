@@ -38,6 +38,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import wespeaker.models.pooling_layers as pooling_layers
+from wespeaker.models.activation_checkpoint import get_sequential
 
 MaxPoolNd = {1: nn.MaxPool1d, 2: nn.MaxPool2d}
 ConvNd = {1: nn.Conv1d, 2: nn.Conv2d}
@@ -639,10 +640,13 @@ class ReDimNetBone(nn.Module):
         ),
         group_divisor=1,
         out_channels=512,
+        gradient_checkpointing=False,
     ):
         super().__init__()
         self.F = F
         self.C = C
+        # recompute the stage blocks in backward to save memory
+        self.gradient_checkpointing = gradient_checkpointing
 
         self.block_1d_type = block_1d_type
         self.block_2d_type = block_2d_type
@@ -741,7 +745,8 @@ class ReDimNetBone(nn.Module):
                     Block1d(self.C * self.F,
                             hC=(self.C * self.F) // att_block_red))
 
-            setattr(self, f"stage{stage_ind}", nn.Sequential(*layers))
+            setattr(self, f"stage{stage_ind}",
+                    get_sequential(self.gradient_checkpointing)(*layers))
 
         if out_channels is not None:
             self.mfa = nn.Sequential(
@@ -814,6 +819,7 @@ class ReDimNet(nn.Module):
         pooling_func="ASTP",
         global_context_att=True,
         two_emb_layer=False,
+        gradient_checkpointing=False,
     ):
 
         super().__init__()
@@ -826,6 +832,7 @@ class ReDimNet(nn.Module):
             stages_setup,
             group_divisor,
             out_channels,
+            gradient_checkpointing,
         )
 
         if out_channels is None:
@@ -874,7 +881,8 @@ class ReDimNet(nn.Module):
 def ReDimNetB0(feat_dim=60,
                embed_dim=192,
                pooling_func="ASTP",
-               two_emb_layer=False):
+               two_emb_layer=False,
+               gradient_checkpointing=False):
     return ReDimNet(
         feat_dim=feat_dim,
         C=10,
@@ -893,13 +901,15 @@ def ReDimNetB0(feat_dim=60,
         pooling_func=pooling_func,
         global_context_att=True,
         two_emb_layer=two_emb_layer,
+        gradient_checkpointing=gradient_checkpointing,
     )
 
 
 def ReDimNetB1(feat_dim=72,
                embed_dim=192,
                pooling_func="ASTP",
-               two_emb_layer=False):
+               two_emb_layer=False,
+               gradient_checkpointing=False):
     return ReDimNet(
         feat_dim=feat_dim,
         C=12,
@@ -918,13 +928,15 @@ def ReDimNetB1(feat_dim=72,
         pooling_func=pooling_func,
         global_context_att=True,
         two_emb_layer=two_emb_layer,
+        gradient_checkpointing=gradient_checkpointing,
     )
 
 
 def ReDimNetB2(feat_dim=72,
                embed_dim=192,
                pooling_func="ASTP",
-               two_emb_layer=False):
+               two_emb_layer=False,
+               gradient_checkpointing=False):
     return ReDimNet(
         feat_dim=feat_dim,
         C=16,
@@ -944,13 +956,15 @@ def ReDimNetB2(feat_dim=72,
         pooling_func=pooling_func,
         global_context_att=True,
         two_emb_layer=two_emb_layer,
+        gradient_checkpointing=gradient_checkpointing,
     )
 
 
 def ReDimNetB3(feat_dim=72,
                embed_dim=192,
                pooling_func="ASTP",
-               two_emb_layer=False):
+               two_emb_layer=False,
+               gradient_checkpointing=False):
     return ReDimNet(
         feat_dim=feat_dim,
         C=16,
@@ -970,13 +984,15 @@ def ReDimNetB3(feat_dim=72,
         pooling_func=pooling_func,
         global_context_att=True,
         two_emb_layer=two_emb_layer,
+        gradient_checkpointing=gradient_checkpointing,
     )
 
 
 def ReDimNetB4(feat_dim=72,
                embed_dim=192,
                pooling_func="ASTP",
-               two_emb_layer=False):
+               two_emb_layer=False,
+               gradient_checkpointing=False):
     return ReDimNet(
         feat_dim=feat_dim,
         C=32,
@@ -996,13 +1012,15 @@ def ReDimNetB4(feat_dim=72,
         pooling_func=pooling_func,
         global_context_att=True,
         two_emb_layer=two_emb_layer,
+        gradient_checkpointing=gradient_checkpointing,
     )
 
 
 def ReDimNetB5(feat_dim=72,
                embed_dim=192,
                pooling_func="ASTP",
-               two_emb_layer=False):
+               two_emb_layer=False,
+               gradient_checkpointing=False):
     return ReDimNet(
         feat_dim=feat_dim,
         C=32,
@@ -1022,13 +1040,15 @@ def ReDimNetB5(feat_dim=72,
         pooling_func=pooling_func,
         global_context_att=True,
         two_emb_layer=two_emb_layer,
+        gradient_checkpointing=gradient_checkpointing,
     )
 
 
 def ReDimNetB6(feat_dim=72,
                embed_dim=192,
                pooling_func="ASTP",
-               two_emb_layer=False):
+               two_emb_layer=False,
+               gradient_checkpointing=False):
     return ReDimNet(
         feat_dim=feat_dim,
         C=32,
@@ -1048,6 +1068,7 @@ def ReDimNetB6(feat_dim=72,
         pooling_func=pooling_func,
         global_context_att=True,
         two_emb_layer=two_emb_layer,
+        gradient_checkpointing=gradient_checkpointing,
     )
 
 
@@ -26,6 +26,8 @@ Ref:
    https://github.com/Snowdar/asv-subtools/blob/master/pytorch/libs/nnet/repvgg.py
 """
 
+from typing import Optional
+
 import torch.nn as nn
 import numpy as np
 import torch
@@ -579,9 +581,9 @@ class RepVGG(nn.Module):
 
         return out  # (B, T, D)
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
         x = self._get_frame_level_feat(x)
-        stats = self.pool(x)
+        stats = self.pool(x, lengths)
         embed = self.seg(stats)
 
         return embed
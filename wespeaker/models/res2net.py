@@ -23,6 +23,8 @@ Some modifications:
 
 '''
 
+from typing import Optional
+
 import torch
 import math
 import torch.nn as nn
@@ -175,9 +177,9 @@ class Res2Net(nn.Module):
 
         return out  # (B, T, D)
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
         out = self._get_frame_level_feat(x)
-        stats = self.pool(out)
+        stats = self.pool(out, lengths)
 
         embed_a = self.seg_1(stats)
         if self.two_emb_layer:
@@ -26,10 +26,13 @@ Reference:
     Deep Residual Learning for Image Recognition. arXiv:1512.03385
 '''
 
+from typing import Optional
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import wespeaker.models.pooling_layers as pooling_layers
+from wespeaker.models.activation_checkpoint import get_sequential
 
 
 class BasicBlock(nn.Module):
@@ -116,9 +119,12 @@ class ResNet(nn.Module):
                  feat_dim=40,
                  embed_dim=128,
                  pooling_func='TSTP',
-                 two_emb_layer=False):
+                 two_emb_layer=False,
+                 gradient_checkpointing=False):
         super(ResNet, self).__init__()
         self.in_planes = m_channels
+        # recompute the residual blocks in backward to save memory
+        self.gradient_checkpointing = gradient_checkpointing
         self.feat_dim = feat_dim
         self.embed_dim = embed_dim
         self.stats_dim = int(feat_dim / 8) * m_channels * 8
@@ -166,13 +172,13 @@ class ResNet(nn.Module):
         for stride in strides:
             layers.append(block(self.in_planes, planes, stride))
             self.in_planes = planes * block.expansion
-        return nn.Sequential(*layers)
+        return get_sequential(self.gradient_checkpointing)(*layers)
 
     def _get_frame_level_feat(self, x):
         # for inner class usage
         x = x.permute(0, 2, 1)  # (B,T,F) => (B,F,T)
 
-        x = x.unsqueeze_(1)
+        x = x.unsqueeze(1)
         out = F.relu(self.bn1(self.conv1(x)))
         out = self.layer1(out)
         out = self.layer2(out)
@@ -189,10 +195,14 @@ class ResNet(nn.Module):
 
         return out  # (B, T, D)
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
+        """
+        x: (B, T, F), lengths: optional relative lengths (B,) in (0, 1]
+            of the zero padded samples, used for masked pooling
+        """
         out = self._get_frame_level_feat(x)
 
-        stats = self.pool(out)
+        stats = self.pool(out, lengths)
 
         embed_a = self.seg_1(stats)
         if self.two_emb_layer:
@@ -204,60 +214,95 @@ class ResNet(nn.Module):
             return torch.tensor(0.0), embed_a
 
 
-def ResNet18(feat_dim, embed_dim, pooling_func='TSTP', two_emb_layer=False):
+def ResNet18(feat_dim,
+             embed_dim,
+             pooling_func='TSTP',
+             two_emb_layer=False,
+             gradient_checkpointing=False):
     return ResNet(BasicBlock, [2, 2, 2, 2],
                   feat_dim=feat_dim,
                   embed_dim=embed_dim,
                   pooling_func=pooling_func,
-                  two_emb_layer=two_emb_layer)
+                  two_emb_layer=two_emb_layer,
+                  gradient_checkpointing=gradient_checkpointing)
 
 
-def ResNet34(feat_dim, embed_dim, pooling_func='TSTP', two_emb_layer=False):
+def ResNet34(feat_dim,
+             embed_dim,
+             pooling_func='TSTP',
+             two_emb_layer=False,
+             gradient_checkpointing=False):
     return ResNet(BasicBlock, [3, 4, 6, 3],
                   feat_dim=feat_dim,
                   embed_dim=embed_dim,
                   pooling_func=pooling_func,
-                  two_emb_layer=two_emb_layer)
+                  two_emb_layer=two_emb_layer,
+                  gradient_checkpointing=gradient_checkpointing)
 
 
-def ResNet50(feat_dim, embed_dim, pooling_func='TSTP', two_emb_layer=False):
+def ResNet50(feat_dim,
+             embed_dim,
+             pooling_func='TSTP',
+             two_emb_layer=False,
+             gradient_checkpointing=False):
     return ResNet(Bottleneck, [3, 4, 6, 3],
                   feat_dim=feat_dim,
                   embed_dim=embed_dim,
                   pooling_func=pooling_func,
-                  two_emb_layer=two_emb_layer)
+                  two_emb_layer=two_emb_layer,
+                  gradient_checkpointing=gradient_checkpointing)
 
 
-def ResNet101(feat_dim, embed_dim, pooling_func='TSTP', two_emb_layer=False):
+def ResNet101(feat_dim,
+              embed_dim,
+              pooling_func='TSTP',
+              two_emb_layer=False,
+              gradient_checkpointing=False):
     return ResNet(Bottleneck, [3, 4, 23, 3],
                   feat_dim=feat_dim,
                   embed_dim=embed_dim,
                   pooling_func=pooling_func,
-                  two_emb_layer=two_emb_layer)
+                  two_emb_layer=two_emb_layer,
+                  gradient_checkpointing=gradient_checkpointing)
 
 
-def ResNet152(feat_dim, embed_dim, pooling_func='TSTP', two_emb_layer=False):
+def ResNet152(feat_dim,
+              embed_dim,
+              pooling_func='TSTP',
+              two_emb_layer=False,
+              gradient_checkpointing=False):
     return ResNet(Bottleneck, [3, 8, 36, 3],
                   feat_dim=feat_dim,
                   embed_dim=embed_dim,
                   pooling_func=pooling_func,
-                  two_emb_layer=two_emb_layer)
+                  two_emb_layer=two_emb_layer,
+                  gradient_checkpointing=gradient_checkpointing)
 
 
-def ResNet221(feat_dim, embed_dim, pooling_func='TSTP', two_emb_layer=False):
+def ResNet221(feat_dim,
+              embed_dim,
+              pooling_func='TSTP',
+              two_emb_layer=False,
+              gradient_checkpointing=False):
     return ResNet(Bottleneck, [6, 16, 48, 3],
                   feat_dim=feat_dim,
                   embed_dim=embed_dim,
                   pooling_func=pooling_func,
-                  two_emb_layer=two_emb_layer)
+                  two_emb_layer=two_emb_layer,
+                  gradient_checkpointing=gradient_checkpointing)
 
 
-def ResNet293(feat_dim, embed_dim, pooling_func='TSTP', two_emb_layer=False):
+def ResNet293(feat_dim,
+              embed_dim,
+              pooling_func='TSTP',
+              two_emb_layer=False,
+              gradient_checkpointing=False):
     return ResNet(Bottleneck, [10, 20, 64, 3],
                   feat_dim=feat_dim,
                   embed_dim=embed_dim,
                   pooling_func=pooling_func,
-                  two_emb_layer=two_emb_layer)
+                  two_emb_layer=two_emb_layer,
+                  gradient_checkpointing=gradient_checkpointing)
 
 
 if __name__ == '__main__':
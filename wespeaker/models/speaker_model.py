@@ -12,46 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import wespeaker.models.tdnn as tdnn
-import wespeaker.models.ecapa_tdnn as ecapa_tdnn
-import wespeaker.models.resnet as resnet
-import wespeaker.models.repvgg as repvgg
-import wespeaker.models.campplus as campplus
-import wespeaker.models.eres2net as eres2net
-import wespeaker.models.gemini_dfresnet as gemini
-import wespeaker.models.res2net as res2net
-import wespeaker.models.whisper_PMFA as whisper_PMFA
-import wespeaker.models.redimnet as redimnet
-import wespeaker.models.samresnet as samresnet
-import wespeaker.models.xi_vector as xi_vector
+import importlib
 
+# model name prefix => module, the module is only imported when one of its
+# models is built, so that e.g. the whisper/s3prl dependencies of some
+# models are not paid by all the others. The order matters for prefixes.
+_MODEL_MODULES = [
+    ("XVEC", "wespeaker.models.tdnn"),
+    ("ECAPA_TDNN", "wespeaker.models.ecapa_tdnn"),
+    ("ResNet", "wespeaker.models.resnet"),
+    ("REPVGG", "wespeaker.models.repvgg"),
+    ("CAMPPlus", "wespeaker.models.campplus"),
+    ("ERes2Net", "wespeaker.models.eres2net"),
+    ("Res2Net", "wespeaker.models.res2net"),
+    ("Gemini", "wespeaker.models.gemini_dfresnet"),
+    ("whisper_PMFA", "wespeaker.models.whisper_PMFA"),
+    ("ReDimNet", "wespeaker.models.redimnet"),
+    ("SimAM_ResNet", "wespeaker.models.samresnet"),
+    ("XI_VEC", "wespeaker.models.xi_vector"),
+]
 
 
 def get_speaker_model(model_name: str):
-    if model_name.startswith("XVEC"):
-        return getattr(tdnn, model_name)
-    elif model_name.startswith("ECAPA_TDNN"):
-        return getattr(ecapa_tdnn, model_name)
-    elif model_name.startswith("ResNet"):
-        return getattr(resnet, model_name)
-    elif model_name.startswith("REPVGG"):
-        return getattr(repvgg, model_name)
-    elif model_name.startswith("CAMPPlus"):
-        return getattr(campplus, model_name)
-    elif model_name.startswith("ERes2Net"):
-        return getattr(eres2net, model_name)
-    elif model_name.startswith("Res2Net"):
-        return getattr(res2net, model_name)
-    elif model_name.startswith("Gemini"):
-        return getattr(gemini, model_name)
-    elif model_name.startswith("whisper_PMFA"):
-        return getattr(whisper_PMFA, model_name)
-    elif model_name.startswith("ReDimNet"):
-        return getattr(redimnet, model_name)
-    elif model_name.startswith("SimAM_ResNet"):
-        return getattr(samresnet, model_name)
-    elif model_name.startswith("XI_VEC"):
-        return getattr(xi_vector, model_name)
-    else:  # model_name error !!!
-        print(model_name + " not found !!!")
-        exit(1)
+    for prefix, module_name in _MODEL_MODULES:
+        if model_name.startswith(prefix):
+            return getattr(importlib.import_module(module_name), model_name)
+    # model_name error !!!
+    print(model_name + " not found !!!")
+    exit(1)
@@ -14,6 +14,8 @@
 # limitations under the License.
 """TDNN model for x-vector learning"""
 
+from typing import Optional
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -104,9 +106,9 @@ class XVEC(nn.Module):
 
         return out  # (B, T, D)
 
-    def forward(self, x):
+    def forward(self, x, lengths: Optional[torch.Tensor] = None):
         out = self._get_frame_level_feat(x)
-        stats = self.pool(out)
+        stats = self.pool(out, lengths)
         embed_a = self.seg_1(stats)
         out = F.relu(embed_a)
         out = self.seg_bn_1(out)
@@ -0,0 +1,127 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compare the DINO student training step with separate global/local
+forwards and with the fused (padded) forward, i.e. `fuse_crops`.
+
+The chunk settings default to the voxceleb v3 DINO recipe.
+
+Example:
+    python wespeaker/ssl/bin/benchmark_dino_forward.py \
+        --models ResNet34,ECAPA_TDNN_GLOB_c512 --batch_size 32
+"""
+
+import argparse
+import time
+
+import torch
+
+from wespeaker.models.speaker_model import get_speaker_model
+from wespeaker.ssl.models.dino_wrapper import DINO
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='benchmark the fused DINO student forward')
+    parser.add_argument('--models',
+                        default='ResNet34,ECAPA_TDNN_GLOB_c512',
+                        help='comma separated model names')
+    parser.add_argument('--feat_dim', default=80, type=int)
+    parser.add_argument('--embed_dim', default=256, type=int)
+    parser.add_argument('--out_dim', default=4096, type=int)
+    parser.add_argument('--batch_size', default=16, type=int)
+    parser.add_argument('--global_chunk_len', default=300, type=int)
+    parser.add_argument('--global_chunk_num', default=2, type=int)
+    parser.add_argument('--local_chunk_len', default=200, type=int)
+    parser.add_argument('--local_chunk_num', default=4, type=int)
+    parser.add_argument('--warmup', default=2, type=int)
+    parser.add_argument('--steps', default=5, type=int)
+    parser.add_argument('--device',
+                        default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+    return args
+
+
+def build_dino(model_name, args, fuse_crops):
+    base_model = get_speaker_model(model_name)(feat_dim=args.feat_dim,
+                                               embed_dim=args.embed_dim)
+    n_crops = args.global_chunk_num + args.local_chunk_num
+    model = DINO(base_model,
+                 dino_head_args=dict(in_dim=args.embed_dim,
+                                     out_dim=args.out_dim,
+                                     use_bn=True),
+                 dino_loss_args=dict(out_dim=args.out_dim,
+                                     n_scrops=n_crops,
+                                     n_tcrops=args.global_chunk_num,
+                                     warmup_teacher_temp=0.04,
+                                     teacher_temp=0.07,
+                                     nepochs=1),
+                 sync_bn=False,
+                 fuse_crops=fuse_crops)
+    return model
+
+
+def sync(device):
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def bench(model, args, device):
+    model.to(device).train()
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.01, momentum=0.9)
+    local_feats = torch.randn(args.local_chunk_num * args.batch_size,
+                              args.local_chunk_len, args.feat_dim).to(device)
+    global_feats = torch.randn(args.global_chunk_num * args.batch_size,
+                               args.global_chunk_len,
+                               args.feat_dim).to(device)
+    for i in range(args.warmup + args.steps):
+        if i == args.warmup:
+            sync(device)
+            start = time.time()
+        loss = model(local_feats, global_feats)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        model.ema_update(0.996)
+    sync(device)
+    return args.steps / (time.time() - start)
+
+
+def main():
+    args = get_args()
+    device = torch.device(args.device)
+    # DINOLoss.update_center all-reduces the teacher center
+    if not torch.distributed.is_initialized():
+        backend = 'nccl' if device.type == 'cuda' else 'gloo'
+        torch.distributed.init_process_group(backend,
+                                             init_method='tcp://127.0.0.1:'
+                                             '23457',
+                                             rank=0,
+                                             world_size=1)
+
+    print('| model | device | separate steps/s | fused steps/s | speedup |')
+    print('| --- | --- | --- | --- | --- |')
+    for model_name in args.models.split(','):
+        results = []
+        for fuse_crops in [False, True]:
+            torch.manual_seed(0)
+            model = build_dino(model_name, args, fuse_crops)
+            results.append(bench(model, args, device))
+            del model
+        print('| {} | {} | {:.2f} | {:.2f} | {:.2f}x |'.format(
+            model_name, device.type, results[0], results[1],
+            results[1] / results[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Cluster SSL (e.g. DINO) embeddings into speaker pseudo labels for the
+iterative "pseudo label + supervised finetuning" training.
+
+The embeddings are mean normalized and length normalized, then clustered
+with mini-batch spherical k-means. All the similarities are computed as
+chunked matrix products against the centroids, so the memory besides the
+embedding matrix itself is bounded by chunk_size * num_clusters. The
+centroids can optionally be merged with AHC, which is cheap since it only
+works on num_clusters points.
+
+Outputs in --output_dir:
+    utt2spk: utt pseudo_speaker_id, the input of the supervised recipes
+    utt2conf: utt confidence, the cosine similarity to the assigned
+        centroid or its margin over the second closest centroid
+
+Example:
+    python wespeaker/ssl/bin/pseudo_label.py \
+        --xvector_scp exp/dino/embeddings/vox2_dev/xvector.scp \
+        --output_dir exp/dino/pseudo_label \
+        --num_clusters 10000 --ahc_threshold 0.5
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.cluster.hierarchy import fcluster, linkage
+
+from wespeaker.utils.embedding_store import load_embeddings
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description='pseudo labels by spherical k-means clustering')
+    parser.add_argument('--xvector_scp',
+                        required=True,
+                        help='embedding scp or embedding store')
+    parser.add_argument('--output_dir', required=True, help='output dir')
+    parser.add_argument('--num_clusters', default=10000, type=int)
+    parser.add_argument('--batch_size',
+                        default=65536,
+                        type=int,
+                        help='mini-batch size of k-means updates')
+    parser.add_argument('--num_iters',
+                        default=300,
+                        type=int,
+                        help='number of mini-batch updates')
+    parser.add_argument('--chunk_size',
+                        default=4096,
+                        type=int,
+                        help='rows per chunked similarity product')
+    parser.add_argument('--ahc_threshold',
+                        default=None,
+                        type=float,
+                        help='merge the centroids with average linkage AHC '
+                        'up to this cosine distance, disabled by default')
+    parser.add_argument('--min_cluster_size',
+                        default=1,
+                        type=int,
+                        help='utterances of smaller clusters are dropped')
+    parser.add_argument('--confidence',
+                        default='cosine',
+                        choices=['cosine', 'margin'],
+                        help='confidence written to utt2conf')
+    parser.add_argument('--no_mean_norm',
+                        action='store_true',
+                        help='do not subtract the global mean embedding')
+    parser.add_argument('--seed', default=42, type=int)
+    args = parser.parse_args()
+    print(args)
+    return args
+
+
+def l2_normalize(x):
+    x /= np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-10)
+    return x
+
+
+def assign(embs, centroids, chunk_size, need_second=False):
+    """ Nearest centroid of each embedding by chunked cosine similarity
+
+    Returns:
+        labels, top1 similarities and, if need_second, top2 similarities
+    """
+    num = len(embs)
+    labels = np.empty(num, dtype=np.int64)
+    top1 = np.empty(num, dtype=np.float32)
+    top2 = np.empty(num, dtype=np.float32) if need_second else None
+    for start in range(0, num, chunk_size):
+        end = min(start + chunk_size, num)
+        sims = embs[start:end] @ centroids.T
+        rows = np.arange(end - start)
+        labels[start:end] = sims.argmax(axis=1)
+        top1[start:end] = sims[rows, labels[start:end]]
+        if need_second:
+            if sims.shape[1] > 1:
+                sims[rows, labels[start:end]] = -np.inf
+                top2[start:end] = sims.max(axis=1)
+            else:
+                top2[start:end] = -1.0
+    return labels, top1, top2
+
+
+def cluster_sums(embs, labels, num_clusters):
+    """ Per cluster sums and counts with one sparse matrix product
+    """
+    num = len(labels)
+    onehot = sparse.csr_matrix(
+        (np.ones(num, dtype=np.float32), (labels, np.arange(num))),
+        shape=(num_clusters, num))
+    sums = np.asarray(onehot @ embs, dtype=np.float32)
+    counts = np.bincount(labels, minlength=num_clusters)
+    return sums, counts
+
+
+def minibatch_spherical_kmeans(embs, num_clusters, batch_size, num_iters,
+                               chunk_size, rng):
+    """ Mini-batch k-means (Sculley, 2010) on the unit sphere: each centroid
+        moves towards the mean of its assigned batch points with a per
+        centroid learning rate 1 / count, and is projected back to the
+        sphere. Centroids that never win are re-seeded from the batch.
+    """
+    num = len(embs)
+    centroids = embs[rng.choice(num, num_clusters, replace=False)].copy()
+    counts = np.zeros(num_clusters, dtype=np.int64)
+    for it in range(num_iters):
+        batch = embs[rng.choice(num, min(batch_size, num), replace=False)]
+        labels, _, _ = assign(batch, centroids, chunk_size)
+        sums, batch_counts = cluster_sums(batch, labels, num_clusters)
+        counts += batch_counts
+        hit = batch_counts > 0
+        centroids[hit] += (sums[hit] - batch_counts[hit, None] *
+                           centroids[hit]) / counts[hit, None]
+        l2_normalize(centroids)
+
+        # re-seed the dead centroids after one pass over the data
+        if (it + 1) * batch_size >= num and (it + 1) % 10 == 0:
+            dead = np.where(counts == 0)[0]
+            if len(dead) > 0:
+                centroids[dead] = batch[rng.choice(len(batch),
+                                                   len(dead),
+                                                   replace=False)]
+        if (it + 1) % 50 == 0:
+            print('iter {}/{}, mean cos {:.4f}, {} dead centroids'.format(
+                it + 1, num_iters,
+                np.mean(np.sum(batch * centroids[labels], axis=1)),
+                np.sum(counts == 0)))
+    return centroids, counts
+
+
+def ahc_merge(centroids, counts, threshold):
+    """ Merge the centroids by average linkage AHC on cosine distance,
+        the merged centroid is the count weighted mean.
+
+    Returns:
+        merged centroids, (num_clusters,) index of the merged cluster
+    """
+    alive = np.where(counts > 0)[0]
+    merge_map = np.zeros(len(centroids), dtype=np.int64)
+    if len(alive) > 1:
+        tree = linkage(centroids[alive], method='average', metric='cosine')
+        merge_map[alive] = fcluster(tree, t=threshold,
+                                    criterion='distance') - 1
+    num_merged = merge_map.max() + 1
+    merged, _ = cluster_sums(centroids * counts[:, None], merge_map,
+                             num_merged)
+    return l2_normalize(merged), merge_map
+
+
+def main():
+    args = get_args()
+    rng = np.random.default_rng(args.seed)
+
+    start = time.time()
+    keys, embs = load_embeddings(args.xvector_scp)
+    # normalized in place, a float32 store is mapped read-only
+    embs = np.require(embs, requirements='W')
+    print('loaded {} embeddings of dim {} in {:.1f}s'.format(
+        len(keys), embs.shape[1],
+        time.time() - start))
+    if not args.no_mean_norm:
+        embs -= embs.mean(axis=0, dtype=np.float64).astype(np.float32)
+    l2_normalize(embs)
+
+    num_clusters = min(args.num_clusters, len(embs))
+    start = time.time()
+    centroids, counts = minibatch_spherical_kmeans(embs, num_clusters,
+                                                   args.batch_size,
+                                                   args.num_iters,
+                                                   args.chunk_size, rng)
+    print('k-means done in {:.1f}s'.format(time.time() - start))
+
+    if args.ahc_threshold is not None:
+        # refresh the counts with a full pass before merging
+        labels, _, _ = assign(embs, centroids, args.chunk_size)
+        counts = np.bincount(labels, minlength=len(centroids))
+        centroids, _ = ahc_merge(centroids, counts, args.ahc_threshold)
+        print('AHC merged {} centroids into {}'.format(
+            np.sum(counts > 0), len(centroids)))
+
+    labels, top1, top2 = assign(embs,
+                                centroids,
+                                args.chunk_size,
+                                need_second=args.confidence == 'margin')
+    conf = top1 if args.confidence == 'cosine' else top1 - top2
+
+    # relabel the kept clusters by decreasing size
+    sizes = np.bincount(labels, minlength=len(centroids))
+    order = np.argsort(-sizes, kind='stable')
+    new_id = np.empty_like(order)
+    new_id[order] = np.arange(len(order))
+    keep = sizes[labels] >= args.min_cluster_size
+    print('{} clusters, {} of {} utterances kept'.format(
+        np.sum(sizes >= args.min_cluster_size), np.sum(keep), len(keys)))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, 'utt2spk'), 'w') as f_spk, \
+            open(os.path.join(args.output_dir, 'utt2conf'), 'w') as f_conf:
+        for i in np.where(keep)[0]:
+            f_spk.write('{} pseudo_spk{:06d}\n'.format(keys[i],
+                                                       new_id[labels[i]]))
+            f_conf.write('{} {:.5f}\n'.format(keys[i], conf[i]))
+
+
+if __name__ == '__main__':
+    main()
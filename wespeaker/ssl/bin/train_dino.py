@@ -144,6 +144,7 @@ def train(config='conf/config.yaml', **kwargs):
         dino_head_args=configs['dino_head_args'],
         dino_loss_args=configs['dino_loss_args'],
         sync_bn=configs.get('sync_bn', True),
+        fuse_crops=configs.get('fuse_crops', False),
     )
 
     if rank == 0:
@@ -31,16 +31,17 @@ def dino_collate_fn(batch):
     for sample_dict in batch:
         key_list.append(sample_dict['key'])
         label_list.append(sample_dict['label'])
-        local_chunks_list.append(
-            torch.stack(sample_dict['feat']['local_chunks']))
-        global_chunks_list.append(
-            torch.stack(sample_dict['feat']['global_chunks']))
+        # (chunk_num, T, F) for each sample
+        local_chunks_list.append(sample_dict['feat']['local_chunks'])
+        global_chunks_list.append(sample_dict['feat']['global_chunks'])
 
     return dict(
         key=key_list,
         label=label_list,
-        local_chunks=torch.stack(local_chunks_list),
-        global_chunks=torch.stack(global_chunks_list),
+        # stack as (chunk_num, B, T, F), so that the chunk-major layout
+        # needed by the DINO loss is a free view in the trainer
+        local_chunks=torch.stack(local_chunks_list, dim=1),
+        global_chunks=torch.stack(global_chunks_list, dim=1),
     )
 
 
@@ -48,10 +49,9 @@ def contrastive_collate_fn(batch):
     local_chunks_list, global_chunks_list = [], []
 
     for sample_dict in batch:
-        local_chunks_list.append(
-            torch.stack(sample_dict['feat']['local_chunks']))
-        global_chunks_list.append(
-            torch.stack(sample_dict['feat']['global_chunks']))
+        # (chunk_num, T, F) for each sample
+        local_chunks_list.append(sample_dict['feat']['local_chunks'])
+        global_chunks_list.append(sample_dict['feat']['global_chunks'])
 
     return dict(
         keys=torch.stack(local_chunks_list),
@@ -128,7 +128,17 @@ def SSLDataset(data_type,
         if speed_perturb_flag:
             spk_num = len(spk2id_dict) if spk2id_dict is not None else 0
             dataset = Processor(dataset, processor.speed_perturb, spk_num)
-        if not whole_utt:
+        fbank_once = configs.get('fbank_once', False)
+        if not whole_utt and fbank_once:
+            # random crops in frames, fbank is computed once per utterance
+            chunk_info_args = dict(configs['chunk_info_args'])
+            chunk_info_args['frame_shift'] = configs['fbank_args'].get(
+                'frame_shift', 10)
+            chunk_info_args['frame_length'] = configs['fbank_args'].get(
+                'frame_length', 25)
+            dataset = Processor(dataset, ssl_processor.random_crop_for_dino,
+                                **chunk_info_args)
+        elif not whole_utt:
             # random chunk
             frame_shift = configs['fbank_args'].get('frame_shift', 10)
             frame_length = configs['fbank_args'].get('frame_length', 25)
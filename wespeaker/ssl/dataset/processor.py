@@ -23,6 +23,7 @@ from scipy import signal
 from scipy.io import wavfile
 import torch
 import torchaudio.compliance.kaldi as kaldi
+from wespeaker.dataset.dataset_utils import spec_aug as batch_spec_aug
 from wespeaker.dataset.processor import (
     get_random_chunk, )
 
@@ -72,13 +73,18 @@ def random_chunk_for_dino(data,
         if data_type == 'feat':
             assert 'feat' in sample
             feat = sample['feat']
-            sample['feat'] = {'local_chunks': [], 'global_chunks': []}
-            for i in range(local_chunk_num):
-                sample['feat']['local_chunks'].append(
-                    get_random_chunk(feat, local_chunk_len))
-            for i in range(global_chunk_num):
-                sample['feat']['global_chunks'].append(
-                    get_random_chunk(feat, global_chunk_len))
+            sample['feat'] = {
+                'local_chunks':
+                torch.stack([
+                    get_random_chunk(feat, local_chunk_len)
+                    for _ in range(local_chunk_num)
+                ]),
+                'global_chunks':
+                torch.stack([
+                    get_random_chunk(feat, global_chunk_len)
+                    for _ in range(global_chunk_num)
+                ])
+            }
         else:
             assert 'wav' in sample
             wav = sample['wav'][0]
@@ -92,6 +98,74 @@ def random_chunk_for_dino(data,
         yield sample
 
 
+def random_crop_for_dino(data,
+                         global_chunk_len,
+                         global_chunk_num,
+                         local_chunk_len,
+                         local_chunk_num,
+                         frame_shift=10,
+                         frame_length=25):
+    """ Same crops as random_chunk_for_dino, but the crops are only
+        recorded as frame offsets and the waveform is cut to the union span
+        of them. compute_fbank then runs kaldi.fbank once over that span and
+        slices the frame window of each crop, which is exact because the
+        crops are aligned to the frame shift.
+
+        Note that the reverb & noise augmentation is then applied once on
+        the span and shared by all the crops of an utterance.
+
+        Args:
+            data: Iterable[{key, wav, label, sample_rate}]
+            global_chunk_len: chunk length for global chunk (frames)
+            global_chunk_num: chunk number for global chunk
+            local_chunk_len: chunk length for local chunk (frames)
+            local_chunk_num: chunk number for local chunk
+            frame_shift: the frame shift of the acoustic features (ms)
+            frame_length: the frame length of the acoustic features (ms)
+
+        Returns:
+            Iterable[{key, wav, label, sample_rate, crops}]
+    """
+    chunk_info = {
+        'local_chunks': (local_chunk_len, local_chunk_num),
+        'global_chunks': (global_chunk_len, global_chunk_num)
+    }
+    for sample in data:
+        assert 'wav' in sample
+        assert 'sample_rate' in sample
+        sample_rate = sample['sample_rate']
+        shift_len = sample_rate * frame_shift // 1000
+        win_len = sample_rate * frame_length // 1000
+        wav = sample['wav']
+        if wav.size(1) == 0:
+            continue
+        if wav.size(1) < win_len:
+            # shorter than one frame window, repeat padded to it as
+            # get_random_chunk does for the per-crop path
+            wav = wav.repeat(1, win_len // wav.size(1) + 1)[:, :win_len]
+        num_frms = (wav.size(1) - win_len) // shift_len + 1
+
+        starts = {}
+        for key, (chunk_len, chunk_num) in chunk_info.items():
+            max_start = max(0, num_frms - chunk_len)
+            starts[key] = [
+                random.randint(0, max_start) for _ in range(chunk_num)
+            ]
+        span_start = min(min(x) for x in starts.values())
+        span_end = max(
+            min(max(x) + chunk_info[key][0], num_frms)
+            for key, x in starts.items())
+        wav_start = span_start * shift_len
+        wav_end = (span_end - 1) * shift_len + win_len
+        # re-clone the data to avoid memory leakage
+        sample['wav'] = wav[:, wav_start:wav_end].clone()
+        sample['crops'] = {
+            key: ([x - span_start for x in starts[key]], chunk_info[key][0])
+            for key in chunk_info
+        }
+        yield sample
+
+
 def add_reverb(audio, reverb_source, resample_rate=16000):
     """ Add reverb
 
@@ -250,15 +324,31 @@ def compute_fbank(data,
         assert 'key' in sample
         assert 'label' in sample
         sample_rate = sample['sample_rate']
-        if isinstance(sample['wav'], dict):
+        if 'crops' in sample:
+            # single pass: fbank of the union span, then slice the crops
+            # sample['crops'] = {'chunk_type': (start_frames, chunk_len)}
+            # the crops of each type are stacked into a (N,T,F) tensor
+            mat = compute_fbank_for_an_audio(sample['wav'])
+            feat_dict = {}
+            for key, (starts, chunk_len) in sample['crops'].items():
+                if len(mat) < chunk_len:
+                    # the same repeat padding as get_random_chunk
+                    mat = get_random_chunk(mat, chunk_len)
+                index = torch.tensor(starts).unsqueeze(1) + torch.arange(
+                    chunk_len)
+                feat_dict[key] = mat[index]
+            mat = feat_dict
+        elif isinstance(sample['wav'], dict):
             # for self supervised training, many chunks are sampled
             # from each utterance.
             # sample['wav'] = {'chunk_type':[chunk1, chunk2, ...], ...}
+            # the chunks of each type are stacked into a (N,T,F) tensor
             feat_dict = {}
             for key in sample['wav']:
-                feat_dict[key] = []
-                for waveform in sample['wav'][key]:
-                    feat_dict[key].append(compute_fbank_for_an_audio(waveform))
+                feat_dict[key] = torch.stack([
+                    compute_fbank_for_an_audio(waveform)
+                    for waveform in sample['wav'][key]
+                ])
             mat = feat_dict
         else:
             waveform = sample['wav']
@@ -277,10 +367,12 @@ def apply_cmvn(data, norm_mean=True, norm_var=False):
     """
 
     def apply_cmvn_for_a_feat(mat):
+        # mat: (T,F) or stacked chunks (N,T,F)
         if norm_mean:
-            mat = mat - torch.mean(mat, dim=0)
+            mat = mat - torch.mean(mat, dim=-2, keepdim=True)
         if norm_var:
-            mat = mat / torch.sqrt(torch.var(mat, dim=0) + 1e-8)
+            mat = mat / torch.sqrt(
+                torch.var(mat, dim=-2, keepdim=True) + 1e-8)
         return mat
 
     for sample in data:
@@ -290,10 +382,10 @@ def apply_cmvn(data, norm_mean=True, norm_var=False):
         if isinstance(sample['feat'], dict):
             # for self supervised training, many chunks are sampled
             # from each utterance.
-            # sample['feat'] = {'chunk_type':[chunk1, chunk2, ...], ...}
+            # sample['feat'] = {'chunk_type': (N,T,F) chunks, ...}
             for key in sample['feat']:
-                for i, mat in enumerate(sample['feat'][key]):
-                    sample['feat'][key][i] = apply_cmvn_for_a_feat(mat)
+                sample['feat'][key] = apply_cmvn_for_a_feat(
+                    sample['feat'][key])
             mat = sample['feat']
         else:
             mat = sample['feat']
@@ -303,7 +395,8 @@ def apply_cmvn(data, norm_mean=True, norm_var=False):
 
 def spec_aug(data, num_t_mask=1, num_f_mask=1, max_t=10, max_f=8, prob=0.6):
     """ Do spec augmentation
-        Inplace operation
+        The stacked chunks of one utterance are masked together in a
+        vectorized way, each chunk with its own random masks
 
         Args:
             data: Iterable[{key, feat, label}]
@@ -316,40 +409,22 @@ def spec_aug(data, num_t_mask=1, num_f_mask=1, max_t=10, max_f=8, prob=0.6):
         Returns
             Iterable[{key, feat, label}]
     """
-
-    def spec_aug_for_a_feat(x):
-        if random.random() < prob:
-            assert isinstance(x, torch.Tensor)
-            # y = x.clone().detach()
-            y = x.detach()  # inplace operation
-            max_frames = y.size(0)
-            max_freq = y.size(1)
-            # time mask
-            for i in range(num_t_mask):
-                start = random.randint(0, max_frames - 1)
-                length = random.randint(1, max_t)
-                end = min(max_frames, start + length)
-                y[start:end, :] = 0
-            # freq mask
-            for i in range(num_f_mask):
-                start = random.randint(0, max_freq - 1)
-                length = random.randint(1, max_f)
-                end = min(max_freq, start + length)
-                y[:, start:end] = 0
-            return y
-        else:
-            return x
-
+    spec_aug_args = dict(num_t_mask=num_t_mask,
+                         num_f_mask=num_f_mask,
+                         max_t=max_t,
+                         max_f=max_f,
+                         prob=prob)
     for sample in data:
         assert 'feat' in sample
         if isinstance(sample['feat'], dict):
             # for self supervised training, many chunks are sampled
             # from each utterance.
-            # sample['feat'] = {'chunk_type':[chunk1, chunk2, ...], ...}
+            # sample['feat'] = {'chunk_type': (N,T,F) chunks, ...}
             for key in sample['feat']:
-                for i, x in enumerate(sample['feat'][key]):
-                    sample['feat'][key][i] = spec_aug_for_a_feat(x)
+                sample['feat'][key] = batch_spec_aug(sample['feat'][key],
+                                                     **spec_aug_args)
         else:
             x = sample['feat']
-            sample['feat'] = spec_aug_for_a_feat(x)
+            sample['feat'] = batch_spec_aug(x.unsqueeze(0),
+                                            **spec_aug_args).squeeze(0)
         yield sample
@@ -239,11 +239,16 @@ class DINO(nn.Module):
                  base_model,
                  dino_head_args,
                  dino_loss_args,
-                 sync_bn=True):
+                 sync_bn=True,
+                 fuse_crops=False):
         """
         model: the student and teacher base model
+        fuse_crops: feed the global and local crops into the student model
+            in one batch, the shorter crops are zero padded and the base
+            model should support masked pooling via `lengths`
         """
         super(DINO, self).__init__()
+        self.fuse_crops = fuse_crops
 
         # get the student and teacher model
         self.s_model = base_model
@@ -273,6 +278,34 @@ class DINO(nn.Module):
                                     self.t_model.parameters()):
             param_k.data.mul_(m).add_((1 - m) * param_q.detach().data)
 
+    def fused_student_forward(self, local_feats, global_feats):
+        """
+        Run the student model once on the global and local crops.
+        Different from two separate forwards, BatchNorm sees the statistics
+        of both crop sets together, and the convolutions near the end of a
+        padded local crop also see the zero padding.
+        Input:
+            local_feats: (chunk_num * B, T, F)
+            global_feats: (chunk_num' * B, T', F)
+        Output:
+            embeddings of the global crops followed by the local crops
+        """
+        num_global, global_T, feat_dim = global_feats.shape
+        num_local, local_T = local_feats.shape[:2]
+        max_T = max(global_T, local_T)
+        feats = global_feats.new_zeros(num_global + num_local, max_T,
+                                       feat_dim)
+        feats[:num_global, :global_T] = global_feats
+        feats[num_global:, :local_T] = local_feats
+        if global_T == local_T:
+            outputs = self.s_model(feats)
+        else:
+            lengths = feats.new_empty(num_global + num_local)
+            lengths[:num_global] = global_T / max_T
+            lengths[num_global:] = local_T / max_T
+            outputs = self.s_model(feats, lengths)
+        return outputs[-1] if isinstance(outputs, tuple) else outputs
+
     def forward(self, local_feats, global_feats, epoch=0):
         """
         Input:
@@ -282,11 +315,16 @@ class DINO(nn.Module):
             loss: a scalar value
         """
         # feed global and local features into student model
-        g_outputs = self.s_model(global_feats)
-        l_outputs = self.s_model(local_feats)
-        g_output = g_outputs[-1] if isinstance(g_outputs, tuple) else g_outputs
-        l_output = l_outputs[-1] if isinstance(l_outputs, tuple) else l_outputs
-        s_output = torch.cat([g_output, l_output])
+        if self.fuse_crops:
+            s_output = self.fused_student_forward(local_feats, global_feats)
+        else:
+            g_outputs = self.s_model(global_feats)
+            l_outputs = self.s_model(local_feats)
+            g_output = g_outputs[-1] if isinstance(g_outputs,
+                                                   tuple) else g_outputs
+            l_output = l_outputs[-1] if isinstance(l_outputs,
+                                                   tuple) else l_outputs
+            s_output = torch.cat([g_output, l_output])
         s_output = self.s_model.projection_head(s_output)
         # feed global features into teacher model
         with torch.no_grad():
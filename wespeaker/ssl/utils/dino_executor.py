@@ -54,19 +54,14 @@ def run_epoch(dataloader,
                 param_group['weight_decay'] = wd_schedule[cur_iter]
         # --------------- Update dynamic hyper-parameter ---------------
 
-        # (B, chunk_num, T, F)
+        # (chunk_num, B, T, F), already chunk-major from dino_collate_fn
         local_feats = batch['local_chunks'].float().to(device)
-        # (B, chunk_num', T, F)
+        # (chunk_num', B, T, F)
         global_feats = batch['global_chunks'].float().to(device)
 
-        # (B, chunk_num, T, F) --> (chunk_num, B, T, F)
-        # --> (chunk_num * B, T, F)
-        local_T, local_F = local_feats.shape[-2:]
-        local_feats = local_feats.transpose(0, 1).contiguous().view(
-            -1, local_T, local_F)
-        global_T, global_F = global_feats.shape[-2:]
-        global_feats = global_feats.transpose(0, 1).contiguous().view(
-            -1, global_T, global_F)
+        # (chunk_num, B, T, F) --> (chunk_num * B, T, F), no copy needed
+        local_feats = local_feats.flatten(0, 1)
+        global_feats = global_feats.flatten(0, 1)
 
         with torch.cuda.amp.autocast(enabled=enable_amp):
             loss = model(local_feats, global_feats, epoch - 1)
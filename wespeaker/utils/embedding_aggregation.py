@@ -0,0 +1,109 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-speaker aggregation of utterance embeddings (speaker means for the
+cohort of score normalization, multi-session enrollment models).
+
+The embeddings (embedding store or kaldi scp) are read in one streaming
+pass, batch_size rows at a time. The rows of a batch are sorted by speaker
+and summed with np.add.reduceat, the memory is the one of a batch plus the
+(num_speakers, D) sums.
+"""
+
+import numpy as np
+
+from wespeaker.utils.embedding_store import iter_embeddings
+
+
+def read_spk2utt(spk2utt_file):
+    """ spk2utt file => dict spk => [utt], in the order of the file
+    """
+    spk2utt = {}
+    with open(spk2utt_file, 'r', encoding='utf-8') as fin:
+        for line in fin:
+            tokens = line.strip().split()
+            if len(tokens) > 0:
+                spk2utt[tokens[0]] = tokens[1:]
+    return spk2utt
+
+
+def aggregate_embeddings(embeddings_path,
+                         utt2spk,
+                         spks=None,
+                         length_norm=False,
+                         batch_size=100000):
+    """ Sums and counts of the embeddings of each speaker
+
+    Args:
+        embeddings_path: embedding store or kaldi scp
+        utt2spk: dict utt => spk, the other embeddings are skipped
+        spks: order of the speakers, the order of their first embedding
+            otherwise
+        length_norm: length normalize the embeddings before the sums
+        batch_size: number of embeddings read at a time
+
+    Returns:
+        spks (List[str]), sums (S, D) float64 and counts (S,) int64
+    """
+    spk2idx = {} if spks is None else {
+        spk: i
+        for i, spk in enumerate(spks)
+    }
+    sums = None
+    counts = np.zeros(len(spk2idx), dtype=np.int64)
+    for keys, embeds in iter_embeddings(embeddings_path, batch_size):
+        # speaker index of each row, -1 for the skipped ones
+        idx = np.fromiter((spk2idx.setdefault(utt2spk[key], len(spk2idx))
+                           if key in utt2spk else -1 for key in keys),
+                          dtype=np.int64,
+                          count=len(keys))
+        keep = np.flatnonzero(idx >= 0)
+        if len(keep) == 0:
+            continue
+        order = keep[np.argsort(idx[keep], kind='stable')]
+        idx = idx[order]
+        embeds = embeds[order].astype(np.float64)
+        if length_norm:
+            embeds /= np.linalg.norm(embeds, axis=1, keepdims=True)
+        if sums is None:
+            sums = np.zeros((len(counts), embeds.shape[1]))
+        if len(spk2idx) > len(counts):
+            # new speakers, the sums grow geometrically
+            size = max(len(spk2idx), 2 * len(counts))
+            sums = np.pad(sums, ((0, size - len(counts)), (0, 0)))
+            counts = np.pad(counts, (0, size - len(counts)))
+        starts = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+        sums[idx[starts]] += np.add.reduceat(embeds, starts, axis=0)
+        counts[:len(spk2idx)] += np.bincount(idx, minlength=len(spk2idx))
+    num_spks = len(spk2idx)
+    if sums is None:
+        sums = np.zeros((num_spks, 0))
+    return list(spk2idx.keys()), sums[:num_spks], counts[:num_spks]
+
+
+def speaker_means(embeddings_path,
+                  utt2spk,
+                  spks=None,
+                  length_norm=False,
+                  batch_size=100000):
+    """ Mean embedding of each speaker, see aggregate_embeddings()
+
+    Returns:
+        spks (List[str]), means (S, D) float64 and counts (S,) int64
+    """
+    spks, sums, counts = aggregate_embeddings(embeddings_path, utt2spk, spks,
+                                              length_norm, batch_size)
+    if np.any(counts == 0):
+        raise KeyError('no embedding of speaker {} in {}'.format(
+            spks[int(np.argmin(counts))], embeddings_path))
+    return spks, sums / counts[:, np.newaxis], counts
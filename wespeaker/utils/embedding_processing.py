@@ -12,11 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import re
-import kaldiio
 import pickle
+import zipfile
 import scipy.linalg as spl
 import numpy as np
+from wespeaker.utils.embedding_store import load_embeddings
 from wespeaker.utils.plda.plda_utils import get_data_for_plda
 
 
@@ -177,16 +179,22 @@ class Lda:
     def __call__(self, embd):
         return (embd - self.m).dot(self.lda)
 
+    def affine(self):
+        return self.lda, -self.m.dot(self.lda)
+
 
 class Length_norm:
 
     def __init__(self, args=None, current_chain=None):
         pass
 
-    def __call__(self, embd):
-        embd_proc = embd.copy()
-        embd_proc /= np.sqrt((embd_proc**2).sum(
-            axis=1)[:, np.newaxis])  # This would make the lengths equal to one
+    def __call__(self, embd, inplace=False):
+        # inplace: embd is overwritten instead of copied
+        embd_proc = embd if inplace else embd.copy()
+        # This would make the lengths equal to one, the squared lengths
+        # are computed without a temporary copy of embd
+        embd_proc /= np.sqrt(np.einsum('ij,ij->i', embd_proc,
+                                       embd_proc))[:, np.newaxis]
         """
         Todo: For Kaldi compatibility we may want to add this as option as
         well as Kaldi style normalization.
@@ -198,7 +206,25 @@ class Length_norm:
 class Whitening:
 
     def __init__(self, args, current_chain):
-        pass
+        # Whitens the total covariance of the embeddings of args['scp'],
+        # after the preceding links of the chain.
+        print(" Whitening")
+        eps = float(args['eps']) if 'eps' in args else 1e-10
+
+        _, e = load_embeddings(args['scp'])
+        e = current_chain(e)
+        self.m = np.mean(e, axis=0)
+        E, M = spl.eigh(np.cov(e, rowvar=False, bias=True))
+        # Floor the eigenvalues as for the within-class covariance of LDA.
+        E_floor = np.max(E) * eps
+        E[E < E_floor] = E_floor
+        self.T = M / np.sqrt(E)
+
+    def __call__(self, embd):
+        return (embd - self.m).dot(self.T)
+
+    def affine(self):
+        return self.T, -self.m.dot(self.T)
 
 
 class MeanSubtraction():
@@ -207,14 +233,42 @@ class MeanSubtraction():
         if current_chain is None:
             current_chain = []
 
-        e = []
-        for key, vec in kaldiio.load_scp_sequential(args['scp']):
-            e.append(vec)
-        self.mean = np.mean(current_chain(np.vstack(e)), axis=0)
+        _, e = load_embeddings(args['scp'])
+        self.mean = np.mean(current_chain(e), axis=0)
 
     def __call__(self, embd):
         return embd - self.mean
 
+    def affine(self):
+        # None is the identity, no matrix product is needed
+        return None, -self.mean
+
+
+class Affine:
+    # embd.dot(A) + b, consecutive affine links of a chain fused into one,
+    # see EmbeddingProcessingChain.compile(). A is None for the identity.
+
+    def __init__(self, A, b):
+        self.A, self.b = A, b
+
+    def __call__(self, embd):
+        if self.A is None:
+            return embd + self.b
+        embd_proc = embd.dot(self.A)
+        embd_proc += self.b
+        return embd_proc
+
+    def affine(self):
+        return self.A, self.b
+
+    def then(self, A, b):
+        # The link applying self then (A, b)
+        if A is None:
+            return Affine(self.A, self.b + b)
+        if self.A is None:
+            return Affine(A, self.b.dot(A) + b)
+        return Affine(self.A.dot(A), self.b.dot(A) + b)
+
 
 class EmbeddingProcessingChain:
 
@@ -224,7 +278,17 @@ class EmbeddingProcessingChain:
         'lda': Lda,
         'length-norm': Length_norm,
         'whitening': Whitening,
-        'mean-subtract': MeanSubtraction
+        'mean-subtract': MeanSubtraction,
+        'affine': Affine
+    }
+
+    # The arrays of each link, saved by save() in the npz format.
+    class2arrays = {
+        Lda: ['m', 'lda'],
+        Length_norm: [],
+        Whitening: ['m', 'T'],
+        MeanSubtraction: ['mean'],
+        Affine: ['A', 'b']
     }
 
     def __init__(self, chain=None):
@@ -235,20 +299,69 @@ class EmbeddingProcessingChain:
             print("Argument: {}".format(a))
             self.chain_of_classes.append(self.string2class[m](a, self))
 
-    def __call__(self, embd):
+    def compile(self):
+        # The chain with the consecutive affine links (mean subtraction,
+        # LDA, whitening) fused into one Affine link, applied with one
+        # matrix product.
+        compiled = []
         for c in self.chain_of_classes:
-            embd = c(embd)
+            if not hasattr(c, 'affine'):
+                compiled.append(c)
+            elif len(compiled) > 0 and isinstance(compiled[-1], Affine):
+                compiled[-1] = compiled[-1].then(*c.affine())
+            else:
+                compiled.append(Affine(*c.affine()))
+        return compiled
+
+    def __call__(self, embd, inplace=False):
+        # inplace: embd may be overwritten by the length normalization, the
+        # intermediate results of the chain always are
+        for c in self.compile():
+            if isinstance(c, Length_norm):
+                embd = c(embd, inplace=inplace)
+            else:
+                embd = c(embd)
+            inplace = True
         return embd
 
-    def save(self, path, data_format='pickle'):
+    def save(self, path, data_format='npz'):
         print("Saving embedding processing chain to {}".format(path))
+        if data_format == 'pickle':
+            with open(path, 'wb') as f:
+                pickle.dump(self.chain_of_classes, f)
+            return
+        assert data_format == 'npz', data_format
+        class2string = {v: k for k, v in self.string2class.items()}
+        links, arrays = [], {}
+        for i, c in enumerate(self.chain_of_classes):
+            links.append(class2string[type(c)])
+            for name in self.class2arrays[type(c)]:
+                value = getattr(c, name)
+                if value is not None:
+                    arrays['{}_{}'.format(i, name)] = value
+        # written to the file object, np.savez would append .npz to path
         with open(path, 'wb') as f:
-            pickle.dump(self.chain_of_classes, f)
+            np.savez(f, links=np.array(json.dumps(links)), **arrays)
 
-    def load(self, path, data_format='pickle'):
+    def load(self, path, data_format=None):
+        # data_format: 'npz' or 'pickle', detected if None
         print("Loading embedding processing chain from {}".format(path))
-        with open(path, 'rb') as f:
-            self.chain_of_classes = pickle.load(f)
+        if data_format is None:
+            data_format = 'npz' if zipfile.is_zipfile(path) else 'pickle'
+        if data_format == 'pickle':
+            with open(path, 'rb') as f:
+                self.chain_of_classes = pickle.load(f)
+            return
+        self.chain_of_classes = []
+        with np.load(path) as data:
+            for i, m in enumerate(json.loads(str(data['links']))):
+                cls = self.string2class[m]
+                # the estimated arrays are restored without __init__
+                c = cls.__new__(cls)
+                for name in self.class2arrays[cls]:
+                    key = '{}_{}'.format(i, name)
+                    setattr(c, name, data[key] if key in data else None)
+                self.chain_of_classes.append(c)
 
     def update_link(self, link_no_to_replace, new_link):
         nl = chain_string_to_dict(new_link)
@@ -0,0 +1,417 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Memory-mapped embedding store, an alternative to kaldi ark/scp for the
+backends.
+
+A store is a directory (e.g. exp/xxx/embeddings/vox1/xvector.store):
+
+    meta.json          {"num": N, "dim": D, "dtype": "float32"|"float16",
+                        "generation": G, "data_generation": G'}
+    embeddings.G'.bin  the (N, D) row-major matrix, opened with np.memmap
+    keys.G'.txt        the N keys in the row order
+    index_keys.G.npy   the keys sorted, fixed width utf-8 bytes
+    index_rows.G.npy   the row of each sorted key
+
+Opening a store only reads meta.json and maps the files, the lookup of a
+batch of keys is a vectorized np.searchsorted on the sorted keys.
+
+Rows are written by EmbeddingStoreWriter. Every commit writes the index
+under a new generation G, an overwrite also writes the matrix and the keys
+under it (an append extends the files of G' past the committed rows), then
+replaces meta.json atomically (os.replace), the files of the previous
+generation are removed afterwards. meta.json always names a complete
+generation: a writer which is killed or fails at any point leaves the
+store as it was before, readers never see a half written commit. The
+stores written without the generations (files without G) are still read.
+
+Most backends go through load_embeddings(), which reads a store or a kaldi
+scp into (keys, matrix), or iter_embeddings() to stream it.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+
+_META = 'meta.json'
+_MATRIX = 'embeddings.bin'
+_KEYS = 'keys.txt'
+_INDEX_KEYS = 'index_keys.npy'
+_INDEX_ROWS = 'index_rows.npy'
+# files of any generation, the stale ones are removed after a commit
+_STORE_FILE = re.compile(
+    r'^((embeddings|keys|index_keys|index_rows)(\.\d+)?\.(bin|txt|npy)'
+    r'|meta\.json\.tmp)$')
+
+
+def is_embedding_store(path):
+    return os.path.isfile(os.path.join(path, _META))
+
+
+def _generation_file(name, generation):
+    """ embeddings.bin => embeddings.3.bin, generation 0 is the one of the
+        stores written before the generations
+    """
+    if generation == 0:
+        return name
+    stem, ext = os.path.splitext(name)
+    return '{}.{}{}'.format(stem, generation, ext)
+
+
+def _read_meta(path):
+    with open(os.path.join(path, _META), 'r') as fin:
+        meta = json.load(fin)
+    meta.setdefault('generation', 0)
+    meta.setdefault('data_generation', 0)
+    return meta
+
+
+def _encode_keys(keys):
+    return np.array([key.encode('utf-8') for key in keys], dtype=bytes)
+
+
+class EmbeddingStore:
+    """ Read-only view of an embedding store
+
+        store.matrix                  (N, D) np.memmap, the stored dtype
+        store.keys                    the N keys in the row order
+        store.rows(keys)              rows of a batch of keys
+        store.get(keys)               (len(keys), D) float32 embeddings
+        store[key]                    (D,) float32 embedding
+    """
+
+    def __init__(self, path):
+        self.path = path
+        meta = _read_meta(path)
+        self.num, self.dim = meta['num'], meta['dim']
+        self.dtype = np.dtype(meta['dtype'])
+        generation, data_generation = (meta['generation'],
+                                       meta['data_generation'])
+        self._keys_file = _generation_file(_KEYS, data_generation)
+        if self.num > 0:
+            self.matrix = np.memmap(os.path.join(
+                path, _generation_file(_MATRIX, data_generation)),
+                                    dtype=self.dtype,
+                                    mode='r',
+                                    shape=(self.num, self.dim))
+            self._index_keys = np.load(os.path.join(
+                path, _generation_file(_INDEX_KEYS, generation)),
+                                       mmap_mode='r')
+            self._index_rows = np.load(os.path.join(
+                path, _generation_file(_INDEX_ROWS, generation)),
+                                       mmap_mode='r')
+        else:
+            self.matrix = np.zeros((0, self.dim), dtype=self.dtype)
+            self._index_keys = np.zeros(0, dtype=bytes)
+            self._index_rows = np.zeros(0, dtype=np.int64)
+        self._keys = None
+
+    def __len__(self):
+        return self.num
+
+    @property
+    def keys(self):
+        # loaded on first use, the lookups do not need them
+        if self._keys is None:
+            with open(os.path.join(self.path, self._keys_file), 'r',
+                      encoding='utf8') as fin:
+                self._keys = fin.read().split('\n')[:self.num]
+        return self._keys
+
+    def _find(self, keys):
+        query = _encode_keys(keys)
+        pos = np.searchsorted(self._index_keys, query)
+        pos = np.minimum(pos, max(self.num - 1, 0))
+        found = self._index_keys[pos] == query if self.num > 0 else \
+            np.zeros(len(query), dtype=bool)
+        return pos, found
+
+    def rows(self, keys):
+        """ Rows (int64) of a batch of keys, KeyError if one is missing
+        """
+        pos, found = self._find(keys)
+        if not found.all():
+            raise KeyError(keys[int(np.argmin(found))])
+        return np.asarray(self._index_rows[pos])
+
+    def __contains__(self, key):
+        return bool(self._find([key])[1][0])
+
+    def get(self, keys):
+        """ (len(keys), D) float32 embeddings of a batch of keys
+        """
+        rows = self.rows(keys)
+        # sorted reads are sequential on the mapped file
+        order = np.argsort(rows, kind='stable')
+        embeds = np.empty((len(rows), self.dim), dtype=np.float32)
+        embeds[order] = self.matrix[rows[order]]
+        return embeds
+
+    def __getitem__(self, key):
+        return self.get([key])[0]
+
+    def items(self):
+        for key, embed in zip(self.keys, self.matrix):
+            yield key, embed.astype(np.float32)
+
+
+class EmbeddingStoreWriter:
+    """ Append-friendly writer, writer(key, embedding) as the one of
+        kaldiio.WriteHelper, or writer.write_batch(keys, matrix)
+
+        Args:
+            path: directory of the store
+            dtype: 'float32' or 'float16', the one of the store if append
+            append: extend an existing store instead of overwriting it
+    """
+
+    def __init__(self, path, dtype='float32', append=False):
+        self.path = path
+        self.dim = None
+        self.num = 0
+        self.dtype = np.dtype(dtype)
+        # the committed store is left untouched until close()
+        generation = 0
+        self.data_generation = None
+        if is_embedding_store(path):
+            meta = _read_meta(path)
+            generation = meta['generation']
+            if append:
+                self.num, self.dim = meta['num'], meta['dim'] or None
+                self.dtype = np.dtype(meta['dtype'])
+                self.data_generation = meta['data_generation']
+        self.generation = generation + 1
+        if self.data_generation is None:
+            # overwritten, the rows go to new files
+            self.data_generation = self.generation
+        os.makedirs(path, exist_ok=True)
+        matrix_file, keys_file = self._data_files()
+        # truncated to the committed rows, drops the leftovers of a crash
+        self._fmatrix = open(matrix_file, 'r+b' if self.num > 0 else 'wb')
+        self._fmatrix.truncate(self.num * (self.dim or 0) *
+                               self.dtype.itemsize)
+        self._fmatrix.seek(0, os.SEEK_END)
+        # the same for the keys, the committed ones are kept in place
+        self._fkeys = open(keys_file, 'r+b' if self.num > 0 else 'wb')
+        size = 0
+        for _ in range(self.num):
+            size += len(self._fkeys.readline())
+        self._fkeys.truncate(size)
+        self._fkeys.seek(0, os.SEEK_END)
+
+    def _data_files(self):
+        return (os.path.join(self.path,
+                             _generation_file(_MATRIX, self.data_generation)),
+                os.path.join(self.path,
+                             _generation_file(_KEYS, self.data_generation)))
+
+    def write_batch(self, keys, embeds):
+        embeds = np.asarray(embeds)
+        if embeds.ndim == 1:
+            embeds = embeds[np.newaxis]
+        assert len(keys) == embeds.shape[0]
+        if self.dim is None:
+            self.dim = embeds.shape[1]
+        assert embeds.shape[1] == self.dim, \
+            'dim {} != {} of the store'.format(embeds.shape[1], self.dim)
+        for key in keys:
+            assert ' ' not in key and '\n' not in key, \
+                'invalid key {}'.format(key)
+            self._fkeys.write((key + '\n').encode('utf-8'))
+        self._fmatrix.write(
+            np.ascontiguousarray(embeds, dtype=self.dtype).tobytes())
+        self.num += len(keys)
+
+    def __call__(self, key, embed):
+        self.write_batch([key], embed)
+
+    def _close_files(self):
+        for fout in (self._fmatrix, self._fkeys):
+            fout.flush()
+            os.fsync(fout.fileno())
+            fout.close()
+        self._fmatrix = self._fkeys = None
+
+    def abort(self):
+        """ Close the files without committing the new rows, the store stays
+            as it was before
+        """
+        if self._fmatrix is None:
+            return
+        self._close_files()
+        # the appended rows past the committed ones are kept until the next
+        # writer truncates them
+        self._remove_stale(self._committed_files())
+
+    def close(self):
+        if self._fmatrix is None:
+            return
+        self._close_files()
+        try:
+            self._commit()
+        except BaseException:
+            self._remove_stale(self._committed_files())
+            raise
+
+    def _committed_files(self):
+        """ Files of the committed store, the ones named by meta.json
+        """
+        if not is_embedding_store(self.path):
+            return set()
+        meta = _read_meta(self.path)
+        return {
+            _generation_file(_MATRIX, meta['data_generation']),
+            _generation_file(_KEYS, meta['data_generation']),
+            _generation_file(_INDEX_KEYS, meta['generation']),
+            _generation_file(_INDEX_ROWS, meta['generation'])
+        }
+
+    def _commit(self):
+        _, keys_file = self._data_files()
+        with open(keys_file, 'r', encoding='utf8') as fin:
+            keys = _encode_keys(fin.read().split('\n')[:self.num])
+        order = np.argsort(keys, kind='stable')
+        index_keys = keys[order]
+        duplicated = np.nonzero(index_keys[1:] == index_keys[:-1])[0]
+        if len(duplicated) > 0:
+            raise ValueError('duplicated key {} in {}'.format(
+                index_keys[duplicated[0]].decode('utf-8'), self.path))
+        # the index of a new generation, not read before meta.json names it
+        for name, array in ((_INDEX_KEYS, index_keys),
+                            (_INDEX_ROWS, order.astype(np.int64))):
+            with open(
+                    os.path.join(self.path,
+                                 _generation_file(name, self.generation)),
+                    'wb') as fout:
+                np.save(fout, array)
+                fout.flush()
+                os.fsync(fout.fileno())
+        # replaced last and atomically, commits the new generation
+        meta_tmp = os.path.join(self.path, _META + '.tmp')
+        with open(meta_tmp, 'w') as fout:
+            json.dump(
+                {
+                    'num': self.num,
+                    'dim': self.dim or 0,
+                    'dtype': self.dtype.name,
+                    'generation': self.generation,
+                    'data_generation': self.data_generation
+                }, fout)
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(meta_tmp, os.path.join(self.path, _META))
+        self._remove_stale(self._committed_files())
+
+    def _remove_stale(self, keep):
+        """ Remove the files of the other generations (the previous commit,
+            the leftovers of a crashed writer)
+        """
+        for name in os.listdir(self.path):
+            if _STORE_FILE.match(name) and name not in keep:
+                os.remove(os.path.join(self.path, name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a failed block does not publish its partial rows
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def load_embeddings(path, keys=None):
+    """ Embeddings of an embedding store (directory) or a kaldi scp
+
+        Args:
+            path: store directory or scp file
+            keys: optional keys to select, in this order
+
+        Returns:
+            keys (List[str]) and the (N, D) float32 matrix
+    """
+    if is_embedding_store(path):
+        store = EmbeddingStore(path)
+        if keys is None:
+            return store.keys, np.asarray(store.matrix, dtype=np.float32)
+        return list(keys), store.get(keys)
+    import kaldiio
+    all_keys, embeds = [], []
+    for key, embed in kaldiio.load_scp_sequential(path):
+        all_keys.append(key)
+        embeds.append(embed)
+    embeds = np.vstack(embeds).astype(np.float32, copy=False) if embeds \
+        else np.zeros((0, 0), dtype=np.float32)
+    if keys is None:
+        return all_keys, embeds
+    key2row = {key: i for i, key in enumerate(all_keys)}
+    return list(keys), embeds[[key2row[key] for key in keys]]
+
+
+def iter_embeddings(path, batch_size=100000):
+    """ Embeddings of an embedding store or a kaldi scp, batch_size at a
+        time in the stored order, a store is read sequentially
+
+        Returns:
+            Iterable[(keys, (B, D) float32 matrix)]
+    """
+    if is_embedding_store(path):
+        store = EmbeddingStore(path)
+        for i in range(0, len(store), batch_size):
+            yield (store.keys[i:i + batch_size],
+                   np.asarray(store.matrix[i:i + batch_size],
+                              dtype=np.float32))
+        return
+    import kaldiio
+    keys, embeds = [], []
+    for key, embed in kaldiio.load_scp_sequential(path):
+        keys.append(key)
+        embeds.append(embed)
+        if len(keys) == batch_size:
+            yield keys, np.vstack(embeds).astype(np.float32, copy=False)
+            keys, embeds = [], []
+    if len(keys) > 0:
+        yield keys, np.vstack(embeds).astype(np.float32, copy=False)
+
+
+def scp_to_store(scp, path, dtype='float32', batch_size=10000):
+    """ kaldi scp => embedding store, returns the number of embeddings
+    """
+    import kaldiio
+    with EmbeddingStoreWriter(path, dtype=dtype) as writer:
+        keys, embeds = [], []
+        for key, embed in kaldiio.load_scp_sequential(scp):
+            keys.append(key)
+            embeds.append(embed)
+            if len(keys) == batch_size:
+                writer.write_batch(keys, np.vstack(embeds))
+                keys, embeds = [], []
+        if len(keys) > 0:
+            writer.write_batch(keys, np.vstack(embeds))
+        return writer.num
+
+
+def store_to_ark(path, ark):
+    """ embedding store => kaldi ark,scp (the scp next to the ark), returns
+        the number of embeddings
+    """
+    import kaldiio
+    store = EmbeddingStore(path)
+    scp = os.path.splitext(ark)[0] + '.scp'
+    with kaldiio.WriteHelper('ark,scp:' + ark + ',' + scp) as writer:
+        for key, embed in store.items():
+            writer(key, embed)
+    return len(store)
@@ -13,25 +13,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from contextlib import nullcontext
+
 import tableprint as tp
 
 import torch
 import torchnet as tnt
 from wespeaker.dataset.dataset_utils import apply_cmvn, spec_aug
+from wespeaker.frontend.feature_cache import cached_frontend_forward
+from wespeaker.utils.utils import get_amp_dtype
 
 
-def run_epoch(dataloader, epoch_iter, model, criterion, optimizer, scheduler,
-              margin_scheduler, epoch, logger, scaler, device, configs):
+def run_epoch(dataloader,
+              epoch_iter,
+              model,
+              criterion,
+              optimizer,
+              scheduler,
+              margin_scheduler,
+              epoch,
+              logger,
+              scaler,
+              device,
+              configs,
+              feature_cache=None,
+              teacher=None):
     model.train()
     # By default use average pooling
     loss_meter = tnt.meter.AverageValueMeter()
     acc_meter = tnt.meter.ClassErrorMeter(accuracy=True)
 
     frontend_type = configs['dataset_args'].get('frontend', 'fbank')
+    amp_dtype = get_amp_dtype(configs.get('amp_dtype', 'float16'))
+    # gradient accumulation: epoch_iter counts micro-batches while the
+    # lr/margin schedulers count optimizer steps
+    accum_grad = configs.get('accum_grad', 1)
+    optim_epoch_iter = epoch_iter // accum_grad
     for i, batch in enumerate(dataloader):
-        cur_iter = (epoch - 1) * epoch_iter + i
-        scheduler.step(cur_iter)
-        margin_scheduler.step(cur_iter)
+        if i % accum_grad == 0:
+            cur_iter = (epoch - 1) * optim_epoch_iter + i // accum_grad
+            scheduler.step(cur_iter)
+            margin_scheduler.step(cur_iter)
+            optimizer.zero_grad()
+        is_update_step = (i + 1) % accum_grad == 0
 
         utts = batch['key']
         targets = batch['label']
@@ -44,37 +68,59 @@ def run_epoch(dataloader, epoch_iter, model, criterion, optimizer, scheduler,
             wavs = wavs.squeeze(1).float().to(device)  # (B,W)
             wavs_len = torch.LongTensor([wavs.shape[1]]).repeat(
                 wavs.shape[0]).to(device)  # (B)
-            with torch.cuda.amp.autocast(enabled=configs['enable_amp']):
-                features, _ = model.module.frontend(wavs, wavs_len)
+            with torch.cuda.amp.autocast(enabled=configs['enable_amp'],
+                                         dtype=amp_dtype):
+                if feature_cache is not None:
+                    # frozen upstream: its hidden states of the chunk are
+                    # read from the cache (filled in the first epoch)
+                    features, _ = cached_frontend_forward(
+                        model.module.frontend, feature_cache, utts,
+                        batch['chunk_offset'], wavs, wavs_len)
+                else:
+                    features, _ = model.module.frontend(wavs, wavs_len)
+
+        # skip the ddp gradient all-reduce on the intermediate micro-batches,
+        # no_sync has to cover both the forward and the backward pass
+        sync_context = nullcontext() if is_update_step else model.no_sync()
+        with sync_context:
+            with torch.cuda.amp.autocast(enabled=configs['enable_amp'],
+                                         dtype=amp_dtype):
+                # apply cmvn
+                if configs['dataset_args'].get('cmvn', True):
+                    features = apply_cmvn(
+                        features,
+                        **configs['dataset_args'].get('cmvn_args', {}))
+                # spec augmentation
+                if configs['dataset_args'].get('spec_aug', False):
+                    features = spec_aug(
+                        features, **configs['dataset_args']['spec_aug_args'])
 
-        with torch.cuda.amp.autocast(enabled=configs['enable_amp']):
-            # apply cmvn
-            if configs['dataset_args'].get('cmvn', True):
-                features = apply_cmvn(
-                    features, **configs['dataset_args'].get('cmvn_args', {}))
-            # spec augmentation
-            if configs['dataset_args'].get('spec_aug', False):
-                features = spec_aug(features,
-                                    **configs['dataset_args']['spec_aug_args'])
+                outputs = model(features)  # (embed_a,embed_b) in most cases
+                embeds = outputs[-1] if isinstance(outputs, tuple) else outputs
+                outputs = model.module.projection(embeds, targets)
+                if isinstance(outputs, tuple):
+                    outputs, loss = outputs
+                else:
+                    loss = criterion(outputs, targets)
+                # knowledge distillation from a frozen teacher
+                if teacher is not None:
+                    teacher_embeds = teacher(features, utts)
+                    loss = loss + model.module.distiller(
+                        embeds, teacher_embeds)
 
-            outputs = model(features)  # (embed_a,embed_b) in most cases
-            embeds = outputs[-1] if isinstance(outputs, tuple) else outputs
-            outputs = model.module.projection(embeds, targets)
-            if isinstance(outputs, tuple):
-                outputs, loss = outputs
-            else:
-                loss = criterion(outputs, targets)
+            # updata the model
+            # scaler does nothing here if enable_amp=False
+            scaler.scale(loss / accum_grad).backward()
 
         # loss, acc
         loss_meter.add(loss.item())
-        acc_meter.add(outputs.cpu().detach().numpy(), targets.cpu().numpy())
+        # numpy has no bfloat16, cast the logits back to fp32 first
+        acc_meter.add(outputs.float().cpu().detach().numpy(),
+                      targets.cpu().numpy())
 
-        # updata the model
-        optimizer.zero_grad()
-        # scaler does nothing here if enable_amp=False
-        scaler.scale(loss).backward()
-        scaler.step(optimizer)
-        scaler.update()
+        if is_update_step:
+            scaler.step(optimizer)
+            scaler.update()
 
         # log
         if (i + 1) % configs['log_batch_interval'] == 0:
@@ -94,3 +140,7 @@ def run_epoch(dataloader, epoch_iter, model, criterion, optimizer, scheduler,
             (loss_meter.value()[0], acc_meter.value()[0]),
             width=10,
             style='grid'))
+    if feature_cache is not None:
+        logger.info('feature cache hits: {}, misses: {}'.format(
+            feature_cache.num_hits, feature_cache.num_misses))
+        feature_cache.num_hits = feature_cache.num_misses = 0
@@ -0,0 +1,171 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Embedding extraction of long recordings with a bounded memory.
+
+A whole recording pushed through the model at once needs activations
+proportional to its duration. Here the (cmvn applied) features, see
+dataset_utils.chunked_fbank, are cut into overlapping windows which run
+through the model batch_size windows at a time, so that the peak memory of
+the model only depends on window_frames and batch_size. The embedding of
+the recording is aggregated from the windows:
+
+    embedding: the average of the window embeddings weighted by the number
+        of frames of each window
+    stats: the statistics of the pooling layer (TAP or TSTP) of the
+        windows are merged into the statistics of the whole recording
+        (weighted by their number of frames), the layers after the pooling
+        then run once on the merged statistics. Without overlap this equals
+        the statistics of the whole recording, up to the receptive field of
+        the frame level layers at the window boundaries.
+"""
+
+import torch
+
+from wespeaker.models.pooling_layers import TAP, TSTP
+
+
+def window_bounds(num_frames, window_frames, shift_frames, min_frames=50):
+    """ [begin, end) of the windows over num_frames frames, the last window
+        is truncated at num_frames. A last window shorter than min_frames
+        is merged into the previous one.
+    """
+    assert 0 < shift_frames <= window_frames
+    bounds = []
+    begin = 0
+    while True:
+        end = min(begin + window_frames, num_frames)
+        if len(bounds) > 0 and end - begin < min_frames:
+            bounds[-1] = (bounds[-1][0], end)
+        else:
+            bounds.append((begin, end))
+        if end == num_frames:
+            return bounds
+        begin += shift_frames
+
+
+def _get_stats_pool(model):
+    for name in ['pool', 'pooling']:
+        pool = getattr(model, name, None)
+        if isinstance(pool, (TAP, TSTP)):
+            return pool
+    # TSDP does not keep the means which are needed to merge the std
+    raise ValueError('stats aggregation needs a TAP or TSTP pooling layer, '
+                     'use the embedding aggregation for {}'.format(
+                         type(model).__name__))
+
+
+def _merge_stats(pool, stats, counts):
+    """ Merge the pooled statistics (N, D) of N windows of counts (N,)
+        frames, mean (TAP) or mean and unbiased std (TSTP), into the ones of
+        the N windows concatenated, in the layout of the output of pool
+    """
+    counts = counts.to(stats.dtype).unsqueeze(1)
+    total = counts.sum()
+    if isinstance(pool, TAP):
+        return (stats * counts).sum(dim=0) / total
+    mean, std = stats.chunk(2, dim=1)
+    merged_mean = (mean * counts).sum(dim=0) / total
+    # sum of squares of each window from the unbiased variance
+    var = (std**2 - 1e-7).clamp(min=0)
+    sum_sq = (var * (counts - 1) + mean**2 * counts).sum(dim=0)
+    merged_var = (sum_sq - merged_mean**2 * total) / (total - 1).clamp(min=1)
+    merged_std = torch.sqrt(merged_var.clamp(min=0) + 1e-7)
+    return torch.cat((merged_mean, merged_std))
+
+
+def extract_windowed_embedding(model,
+                               feats,
+                               window_frames=1000,
+                               shift_frames=500,
+                               batch_size=16,
+                               aggregation='embedding',
+                               min_frames=50):
+    """ Embedding of a long utterance from overlapping windows
+
+    Args:
+        model: speaker model in eval mode
+        feats: (T, F) features of the whole utterance, cmvn applied, on the
+            device of the model
+        window_frames, shift_frames: window length and shift in frames
+        batch_size: number of windows per forward
+        aggregation: 'embedding' or 'stats', see the module docstring
+        min_frames: the last window is merged if shorter
+    Returns:
+        embedding (D,), window embeddings (N, D) and window bounds
+        List[(begin, end)] in frames
+    """
+    assert aggregation in ['embedding', 'stats']
+    bounds = window_bounds(feats.size(0), window_frames, shift_frames,
+                           min_frames)
+    pool = _get_stats_pool(model) if aggregation == 'stats' else None
+
+    pooled = []  # (stats (B, D), frames (B,)) at the resolution of the pool
+
+    def _record_hook(module, inputs, output):
+        frames = torch.full((output.size(0), ),
+                            inputs[0].size(-1),
+                            device=output.device)
+        pooled.append((output.float(), frames))
+
+    def _forward(x):
+        outputs = model(x)
+        return outputs[-1] if isinstance(outputs, tuple) else outputs
+
+    # the full length windows are batched, the others run one by one
+    full = [i for i, (b, e) in enumerate(bounds) if e - b == window_frames]
+    others = [i for i, (b, e) in enumerate(bounds) if e - b != window_frames]
+    groups = [
+        full[i:i + batch_size] for i in range(0, len(full), batch_size)
+    ]
+    groups += [[i] for i in others]
+    window_embeds = [None] * len(bounds)
+    handle = None
+    if pool is not None:
+        handle = pool.register_forward_hook(_record_hook)
+    try:
+        with torch.no_grad():
+            for group in groups:
+                x = torch.stack([feats[bounds[i][0]:bounds[i][1]]
+                                 for i in group])
+                for i, embed in zip(group, _forward(x).float()):
+                    window_embeds[i] = embed
+    finally:
+        if handle is not None:
+            handle.remove()
+    window_embeds = torch.stack(window_embeds)
+
+    if aggregation == 'embedding':
+        counts = torch.tensor([e - b for b, e in bounds],
+                              dtype=window_embeds.dtype,
+                              device=window_embeds.device)
+        embedding = (window_embeds * counts.unsqueeze(1)).sum(dim=0) / \
+            counts.sum()
+        return embedding, window_embeds, bounds
+
+    stats = torch.cat([s for s, _ in pooled])
+    counts = torch.cat([c for _, c in pooled])
+    merged = _merge_stats(pool, stats, counts)
+    # run the layers after the pooling on the merged statistics, the
+    # frame level layers run on the shortest window
+    shortest = min(range(len(bounds)),
+                   key=lambda i: bounds[i][1] - bounds[i][0])
+    handle = pool.register_forward_hook(
+        lambda module, inputs, output: merged.unsqueeze(0).to(output.dtype))
+    try:
+        with torch.no_grad():
+            x = feats[bounds[shortest][0]:bounds[shortest][1]].unsqueeze(0)
+            embedding = _forward(x)[0].float()
+    finally:
+        handle.remove()
+    return embedding, window_embeds, bounds
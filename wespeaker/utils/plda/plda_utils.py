@@ -13,20 +13,20 @@
 # limitations under the License.
 import math
 
-import kaldiio
 import numpy as np
 
+from wespeaker.utils.embedding_store import load_embeddings
+
 
 def read_vec_scp_file(scp_file):
     """
     Read the pre-extracted kaldi-format speaker embeddings.
-    :param scp_file: path to xvector.scp
-    :return: dict {wav_name: embedding}
+    :param scp_file: path to xvector.scp or to an embedding store
+    :return: dict {wav_name: embedding}, the embeddings are rows of one
+        matrix
     """
-    samples_dict = {}
-    for key, vec in kaldiio.load_scp_sequential(scp_file):
-        samples_dict[key] = vec
-    return samples_dict
+    keys, embeds = load_embeddings(scp_file)
+    return dict(zip(keys, embeds))
 
 
 def read_label_file(label_file):
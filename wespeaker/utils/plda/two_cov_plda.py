@@ -15,18 +15,21 @@
 # limitations under the License.
 
 import collections
+import concurrent.futures
 import math
 import h5py
 import numpy as np
 import scipy.linalg as spl
 from numpy.linalg import inv
-from tqdm import tqdm
+from wespeaker.utils.embedding_store import EmbeddingStore, \
+    is_embedding_store, load_embeddings
+from wespeaker.utils.embedding_aggregation import speaker_means
 from wespeaker.utils.plda.kaldi_utils import read_plda
+from wespeaker.utils.scoring import format_scores, read_trials
 
 from wespeaker.utils.plda.plda_utils import compute_normalizing_transform
-from wespeaker.utils.plda.plda_utils import get_data_for_plda
 from wespeaker.utils.plda.plda_utils import norm_embeddings
-from wespeaker.utils.plda.plda_utils import read_vec_scp_file
+from wespeaker.utils.plda.plda_utils import read_label_file
 from wespeaker.utils.plda.plda_utils import sort_svd
 
 M_LOG_2PI = 1.8378770664093454835606594728112
@@ -62,6 +65,146 @@ class PldaStats(object):
         self.example_weight += weight * n
         self.sum_ += weight * mean
 
+    def add_classes(self, weight, embeddings, labels):
+        """
+        Add the samples of several speakers at once, all the samples of a
+        speaker must be in this batch
+        :param weight: class_weight, default set to 1.
+        :param embeddings: (N, D) embedding samples
+        :param labels: (N,) speaker of each sample
+        :return:
+        """
+        labels = np.asarray(labels)
+        order = np.argsort(labels, kind='stable')
+        labels = labels[order]
+        embeddings = np.asarray(embeddings, dtype=np.float64)[order]
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+        counts = np.diff(np.r_[starts, len(labels)])
+        means = np.add.reduceat(embeddings, starts, axis=0) / \
+            counts[:, np.newaxis]
+        tmp = embeddings - np.repeat(means, counts, axis=0)
+        self.offset_scatter += weight * np.matmul(tmp.T, tmp)
+        self.classinfo.extend(
+            ClassInfo(weight, n, mean)
+            for n, mean in zip(counts.tolist(), means))
+        self.num_example += len(labels)
+        self.num_classes += len(counts)
+        self.class_weight += weight * len(counts)
+        self.example_weight += weight * len(labels)
+        self.sum_ += weight * means.sum(axis=0)
+
+    def merge(self, other):
+        """
+        Add the stats of other, accumulated on other speakers
+        """
+        self.offset_scatter += other.offset_scatter
+        self.classinfo.extend(other.classinfo)
+        self.num_example += other.num_example
+        self.num_classes += other.num_classes
+        self.class_weight += other.class_weight
+        self.example_weight += other.example_weight
+        self.sum_ += other.sum_
+
+    def class_arrays(self):
+        """
+        :return: weights (C,), num_examples (C,) and means (C, D) of the
+            classes
+        """
+        weights = np.array([info.weight for info in self.classinfo],
+                           dtype=np.float64)
+        counts = np.array([info.num_example for info in self.classinfo],
+                          dtype=np.int64)
+        means = np.vstack([info.mu for info in self.classinfo]) \
+            if self.classinfo else np.zeros((0, self.dim))
+        return weights, counts, means
+
+
+def _accumulate_shard(dim, embeddings, rows, labels, mean_vec,
+                      normalize_length):
+    if isinstance(embeddings, str):
+        # embedding store, the worker only reads the rows of its shard
+        embeddings = EmbeddingStore(embeddings).matrix
+    embeddings = np.asarray(embeddings[rows], dtype=np.float64) - mean_vec
+    if normalize_length:
+        embeddings = norm_embeddings(embeddings)
+    stats = PldaStats(dim)
+    stats.add_classes(1.0, embeddings, labels)
+    return stats
+
+
+def accumulate_plda_stats(scp_file,
+                          utt2spk_file,
+                          embed_dim,
+                          subtract_train_set_mean=False,
+                          normalize_length=False,
+                          num_shards=1):
+    """
+    PldaStats of the embeddings of scp_file, the speakers are split into
+    num_shards shards accumulated in parallel processes and merged
+    :param scp_file: xvector.scp or embedding store
+    :param utt2spk_file: the path to utt2spk
+    :return: PldaStats
+    """
+    if is_embedding_store(scp_file):
+        store = EmbeddingStore(scp_file)
+        keys, embeddings = store.keys, store.matrix
+    else:
+        keys, embeddings = load_embeddings(scp_file)
+    labels_dict = read_label_file(utt2spk_file)
+    rows, labels = [], []
+    for i, key in enumerate(keys):
+        if key in labels_dict:
+            rows.append(i)
+            labels.append(labels_dict[key])
+        else:
+            print("WARNING: {} not in utt2spk ({}), skipping it.".format(
+                key, utt2spk_file))
+    if subtract_train_set_mean:
+        # over all the samples, chunk by chunk for a mapped store
+        train_mean_vec = np.zeros(embed_dim)
+        for i in range(0, len(keys), 100000):
+            train_mean_vec += np.sum(embeddings[i:i + 100000],
+                                     axis=0,
+                                     dtype=np.float64)
+        train_mean_vec /= len(keys)
+    else:
+        train_mean_vec = np.zeros(embed_dim)
+
+    # speakers in the order of their first sample, split into shards
+    spk_ids = {}
+    labels = np.array([spk_ids.setdefault(label, len(spk_ids))
+                       for label in labels], dtype=np.int64)
+    order = np.argsort(labels, kind='stable')
+    rows, labels = np.array(rows, dtype=np.int64)[order], labels[order]
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    bounds = [starts[i * len(starts) // num_shards]
+              for i in range(num_shards)] + [len(labels)]
+    shards = [(rows[b:e], labels[b:e])
+              for b, e in zip(bounds[:-1], bounds[1:]) if e > b]
+    source = scp_file if is_embedding_store(scp_file) else embeddings
+
+    def _shard_args(shard_rows, shard_labels):
+        if isinstance(source, str):
+            return (embed_dim, source, shard_rows, shard_labels,
+                    train_mean_vec, normalize_length)
+        # the rows of the shard are sent to its worker
+        return (embed_dim, source[shard_rows], slice(None), shard_labels,
+                train_mean_vec, normalize_length)
+
+    stats = PldaStats(embed_dim)
+    if num_shards == 1:
+        for shard in shards:
+            stats.merge(_accumulate_shard(*_shard_args(*shard)))
+        return stats
+    with concurrent.futures.ProcessPoolExecutor(num_shards) as executor:
+        futures = [
+            executor.submit(_accumulate_shard, *_shard_args(*shard))
+            for shard in shards
+        ]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
 
 class TwoCovPLDA:
 
@@ -70,7 +213,8 @@ class TwoCovPLDA:
                  utt2spk_file=None,
                  embed_dim=256,
                  subtract_train_set_mean=False,
-                 normalize_length=False):
+                 normalize_length=False,
+                 num_shards=1):
         self.subtract_train_set_mean = subtract_train_set_mean
         self.normalize_length = normalize_length
         self.dim = embed_dim
@@ -89,18 +233,10 @@ class TwoCovPLDA:
         self.W_stats = np.zeros((self.dim, self.dim))
         self.W_count = 0
         if scp_file is not None:
-            samples, self.embeddings_dict = get_data_for_plda(
-                scp_file, utt2spk_file)
-            if subtract_train_set_mean:
-                train_mean_vec = samples.mean(0)
-            else:
-                train_mean_vec = np.zeros(embed_dim)
-            for key, mat in self.embeddings_dict.items():
-                mat = np.vstack(mat)
-                mat = mat - train_mean_vec
-                if self.normalize_length:
-                    mat = norm_embeddings(mat)
-                self.stats.add_samples(1.0, mat)
+            self.stats = accumulate_plda_stats(scp_file, utt2spk_file,
+                                               embed_dim,
+                                               subtract_train_set_mean,
+                                               normalize_length, num_shards)
             self.mu = self.stats.sum_ / self.stats.class_weight
 
     def train(self, num_em_iters):
@@ -118,18 +254,26 @@ class TwoCovPLDA:
         self.W_count += self.stats.example_weight - self.stats.class_weight
         B_inv = inv(self.B)
         W_inv = inv(self.W)
-        for i in range(self.stats.num_classes):
-            info = self.stats.classinfo[i]
-            m = info.mu - self.stats.sum_ / self.stats.class_weight
-            weight = info.weight
-            n = info.num_example
+        weights, counts, means = self.stats.class_arrays()
+        m = means - self.stats.sum_ / self.stats.class_weight
+        w = np.empty_like(m)
+        # mix_var only depends on the number of examples n, the classes are
+        # grouped by n: one inverse per distinct n
+        ns, inverse = np.unique(counts, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        groups = np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+        for n, group in zip(ns.tolist(), groups):
             mix_var = inv(B_inv + n * W_inv)
-            w = np.matmul(mix_var, n * np.matmul(W_inv, m))
-            m_w = m - w
-            self.B_stats += weight * (mix_var + np.outer(w, w))
-            self.B_count += weight
-            self.W_stats += weight * n * (mix_var + np.outer(m_w, m_w))
-            self.W_count += weight
+            w[group] = n * np.matmul(m[group], np.matmul(mix_var, W_inv).T)
+            weight = weights[group].sum()
+            self.B_stats += weight * mix_var
+            self.W_stats += weight * n * mix_var
+        # the outer products of all the classes as GEMMs
+        m_w = m - w
+        self.B_stats += np.matmul(w.T * weights, w)
+        self.B_count += weights.sum()
+        self.W_stats += np.matmul(m_w.T * (weights * counts), m_w)
+        self.W_count += weights.sum()
 
         self.W = self.W_stats / self.W_count
         self.B = self.B_stats / self.B_count
@@ -154,13 +298,18 @@ class TwoCovPLDA:
         self.offset = -1.0 * np.matmul(self.transform, self.mu)
 
     def transform_embedding(self, embedding):
-        transformed_embedding = np.matmul(self.transform, embedding)
-        transformed_embedding += self.offset
-        normalization_factor = math.sqrt(
-            self.dim) / np.linalg.norm(transformed_embedding)
+        return self.transform_embeddings(embedding[np.newaxis])[0]
+
+    def transform_embeddings(self, embeddings):
+        """
+        Transform the rows of embeddings (N, D) in one matrix product
+        """
+        transformed = np.matmul(embeddings, self.transform.T)
+        transformed += self.offset
         if self.normalize_length:
-            transformed_embedding = normalization_factor * transformed_embedding
-        return transformed_embedding
+            transformed *= math.sqrt(self.dim) / np.linalg.norm(
+                transformed, axis=1, keepdims=True)
+        return transformed
 
     def log_likelihood_ratio(self, transformed_train_embedding,
                              transformed_test_embedding, n):
@@ -183,6 +332,40 @@ class TwoCovPLDA:
         loglike_ratio = loglike_given_class - loglike_without_class
         return loglike_ratio
 
+    def llr_terms(self, n):
+        """
+        Terms of the log likelihood ratio for n enrollment examples, the
+        llr of log_likelihood_ratio() expands to
+            llr = const + sum(scale * enroll * test) - sum(quad * enroll^2)
+                  + sum(test_quad * test^2)
+        :param n: distinct enrollment counts (K,)
+        :return: const (K,), scale, quad and test_quad (K, D)
+        """
+        n = np.asarray(n, dtype=np.float64)[:, np.newaxis]
+        a = n * self.psi / (n * self.psi + 1.0)
+        variance = 1.0 + self.psi / (n * self.psi + 1.0)
+        const = -0.5 * (np.sum(np.log(variance), axis=1) -
+                        np.sum(np.log(self.psi + 1.0)))
+        inv_var = 1.0 / variance
+        test_quad = 0.5 * (1.0 / (self.psi + 1.0) - inv_var)
+        return const, inv_var * a, 0.5 * inv_var * a * a, test_quad
+
+    def log_likelihood_ratios(self, transformed_train_embeddings,
+                              transformed_test_embeddings, n):
+        """
+        log_likelihood_ratio() of the rows of the (N, D) train and test
+        embeddings, with n (N,) enrollment examples, grouped by n
+        """
+        n = np.broadcast_to(n, (transformed_train_embeddings.shape[0], ))
+        counts, inverse = np.unique(n, return_inverse=True)
+        const, scale, quad, test_quad = self.llr_terms(counts)
+        enroll = transformed_train_embeddings
+        test = transformed_test_embeddings
+        return (const[inverse] +
+                np.einsum('ij,ij->i', scale[inverse] * enroll, test) -
+                np.einsum('ij,ij->i', quad[inverse], enroll**2) +
+                np.einsum('ij,ij->i', test_quad[inverse], test**2))
+
     def eval_sv(self,
                 enroll_scp,
                 enroll_utt2spk,
@@ -201,64 +384,66 @@ class TwoCovPLDA:
         :param indomain_scp:
         :return:
         """
-        _, enroll_embeddings_dict = get_data_for_plda(enroll_scp,
-                                                      enroll_utt2spk)
-        test_embeddings_dict = read_vec_scp_file(test_scp)
-
         if indomain_scp is not None:
-            indomain_embeddings_dict = read_vec_scp_file(indomain_scp)
-            mean_vec = np.vstack(list(
-                indomain_embeddings_dict.values())).mean(0)
+            mean_vec = load_embeddings(indomain_scp)[1].mean(0)
         else:
             mean_vec = np.zeros(self.dim)
 
-        enrollspks = {}
-        testspks = {}
-        enrollcounts = {}
-        for key, value in enroll_embeddings_dict.items():
-            if multisession_avg:
-                enrollcounts[key] = 1
-            else:
-                enrollcounts[key] = len(value)
-            value = np.vstack(value)
-            value = value - mean_vec  # Shuai
-
-            # Normalize length
-            # It is questionable whether this should be applied
-            # after speaker mean in case of multisession scoring.
-            if self.normalize_length:
-                tmp = norm_embeddings(np.mean(value, 0))
-
-            else:
-                tmp = np.mean(value, 0)
-            tmp = self.transform_embedding(tmp)
-            enrollspks[key] = tmp
-
-        for key, value in test_embeddings_dict.items():
-            value = value - mean_vec  # Shuai
-            if self.normalize_length:
-                tmp = norm_embeddings(value)
-            else:
-                tmp = value
-            tmp = self.transform_embedding(tmp)
-            testspks[key] = tmp
+        # multi-session enrollment models, one streaming pass
+        enroll_keys, enroll_means, enroll_counts = speaker_means(
+            enroll_scp, read_label_file(enroll_utt2spk))
+        enroll_means = enroll_means - mean_vec  # Shuai
+        if multisession_avg:
+            enroll_counts = np.ones_like(enroll_counts)
+        # Normalize length
+        # It is questionable whether this should be applied
+        # after speaker mean in case of multisession scoring.
+        if self.normalize_length:
+            enroll_means = norm_embeddings(enroll_means)
+        enrollspks = self.transform_embeddings(enroll_means)
 
+        test_keys, test_embeddings = load_embeddings(test_scp)
+        test_embeddings = test_embeddings - mean_vec  # Shuai
+        if self.normalize_length:
+            test_embeddings = norm_embeddings(test_embeddings)
+        testspks = self.transform_embeddings(test_embeddings)
+
+        # llr = enroll_const + enroll_scale . test + test_quad[n], the
+        # terms are computed once per enrollment model and distinct n
+        counts, count_idx = np.unique(enroll_counts, return_inverse=True)
+        const, scale, quad, test_quad = self.llr_terms(counts)
+        enroll_const = const[count_idx] - np.einsum(
+            'ij,ij->i', quad[count_idx], enrollspks**2)
+        enroll_scale = scale[count_idx] * enrollspks
+        test_quad = np.matmul(testspks**2, test_quad.T)  # (N_test, K)
+
+        batch_size = 65536
+        enroll2row = {key: i for i, key in enumerate(enroll_keys)}
+        test2row = {key: i for i, key in enumerate(test_keys)}
         with open(score_file, 'w') as write_score:
-            with open(trials, 'r') as read_trials:
-                for line in tqdm(read_trials):
-                    tokens = line.strip().split()
-                    score = self.log_likelihood_ratio(enrollspks[tokens[0]],
-                                                      testspks[tokens[1]],
-                                                      enrollcounts[tokens[0]])
-                    segs = line.strip().split()
-                    output_line = ('{} {} {:.5f} {}\n'.format(
-                        segs[0], segs[1], score, segs[2]))
-                    write_score.write(output_line)
+            with open(trials, 'r') as fin:
+                # streamed chunk by chunk
+                for enroll, test, labels in read_trials(fin):
+                    enroll_rows = np.fromiter(
+                        (enroll2row[key] for key in enroll), dtype=np.int64,
+                        count=len(enroll))
+                    test_rows = np.fromiter((test2row[key] for key in test),
+                                            dtype=np.int64,
+                                            count=len(test))
+                    scores = enroll_const[enroll_rows] + test_quad[
+                        test_rows, count_idx[enroll_rows]]
+                    for i in range(0, len(scores), batch_size):
+                        e = enroll_rows[i:i + batch_size]
+                        t = test_rows[i:i + batch_size]
+                        scores[i:i + batch_size] += np.einsum(
+                            'ij,ij->i', enroll_scale[e], testspks[t])
+                    write_score.write(
+                        format_scores(enroll, test, scores, labels))
 
     def adapt(self, adapt_scp, ac_scale=0.5, wc_scale=0.5):
         # Implemented by the BUT speech group
         # plda = load_model(model_path, from_kaldi=from_kaldi)
-        adp_data = np.array(list(read_vec_scp_file(adapt_scp).values()))
+        adp_data = load_embeddings(adapt_scp)[1]
         mean_vec = adp_data.mean(0)
         adp_data = adp_data - mean_vec
         if self.normalize_length:
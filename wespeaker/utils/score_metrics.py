@@ -65,7 +65,15 @@ def compute_pmiss_pfa_rbst(scores, labels, weights=None):
     labels = labels[sorted_ndx]
     if weights is not None:
         weights = weights[sorted_ndx]
-    else:
+    return compute_pmiss_pfa_sorted(labels, weights)
+
+
+def compute_pmiss_pfa_sorted(labels, weights=None):
+    """ computes FNR and FPR given the trial labels (and weights) sorted by
+    ascending score, see compute_pmiss_pfa_rbst.
+    """
+
+    if weights is None:
         weights = np.ones((labels.shape), dtype='f8')
 
     tgt_wghts = weights * (labels == 1).astype('f8')
@@ -116,6 +124,93 @@ def compute_c_dcf(fnr, fpr, p_target, c_miss=1, c_fa=1):
     return c_det
 
 
+def compute_act_dcf(scores, labels, p_target, c_miss=1, c_fa=1):
+    """ computes normalized actual detection cost function (DCF) of scores
+        which are log-likelihood ratios, at the Bayes decision threshold
+    """
+
+    thres = np.log(c_fa * (1 - p_target) / (c_miss * p_target))
+    p_miss = np.mean(scores[labels == 1] < thres)
+    p_fa = np.mean(scores[labels == 0] >= thres)
+    c_det = c_miss * p_miss * p_target + c_fa * p_fa * (1 - p_target)
+    c_def = min(c_miss * p_target, c_fa * (1 - p_target))
+
+    return c_det / c_def
+
+
+def compute_cllr(scores, labels):
+    """ computes the log-likelihood-ratio cost (Cllr) of scores which are
+        log-likelihood ratios
+    """
+
+    c_tgt = np.mean(np.logaddexp(0, -scores[labels == 1]))
+    c_imp = np.mean(np.logaddexp(0, scores[labels == 0]))
+
+    return (c_tgt + c_imp) / (2 * np.log(2))
+
+
+def read_scores(scores_file, score_col=2, label_col=3):
+    """ reads the scores and the target labels (label == 'target') of a
+        score file in bulk, the other columns (keys) are not tokenized
+    """
+
+    data = np.loadtxt(scores_file,
+                      usecols=(score_col, label_col),
+                      dtype=[('score', 'f8'), ('label', 'U16')],
+                      comments=None,
+                      ndmin=1)
+    return data['score'], data['label'] == 'target'
+
+
+def compute_all_metrics(scores,
+                        labels,
+                        p_targets=(0.01, ),
+                        c_miss=1,
+                        c_fa=1,
+                        num_bootstrap=0,
+                        confidence=0.95,
+                        seed=777):
+    """ computes EER, minDCF and actDCF at each of p_targets and Cllr from
+        a single sort of the scores. With num_bootstrap > 0, the confidence
+        intervals of EER and minDCF are estimated by resampling the trials
+        with replacement, a resampling is a weighting of the sorted trials
+        so that no further sort is needed.
+    """
+
+    sorted_ndx = np.argsort(scores)
+    scores, labels = scores[sorted_ndx], labels[sorted_ndx]
+    fnr, fpr = compute_pmiss_pfa_sorted(labels)
+    results = {
+        'fnr': fnr,
+        'fpr': fpr,
+        'eer': compute_eer(fnr, fpr),
+        'min_dcf': [compute_c_norm(fnr, fpr, p, c_miss, c_fa)
+                    for p in p_targets],
+        'act_dcf': [compute_act_dcf(scores, labels, p, c_miss, c_fa)
+                    for p in p_targets],
+        'cllr': compute_cllr(scores, labels),
+    }
+    if num_bootstrap <= 0:
+        return results
+
+    rng = np.random.default_rng(seed)
+    samples = []  # [eer, min_dcf...] of each resampling
+    for _ in range(num_bootstrap):
+        counts = np.bincount(rng.integers(0, len(scores), len(scores)),
+                             minlength=len(scores)).astype('f8')
+        b_fnr, b_fpr = compute_pmiss_pfa_sorted(labels, counts)
+        samples.append([compute_eer(b_fnr, b_fpr)] + [
+            compute_c_norm(b_fnr, b_fpr, p, c_miss, c_fa) for p in p_targets
+        ])
+    bounds = np.percentile(np.array(samples),
+                           [50 * (1 - confidence), 50 * (1 + confidence)],
+                           axis=0)
+    results['eer_ci'] = tuple(bounds[:, 0])
+    results['min_dcf_ci'] = [tuple(bounds[:, i + 1])
+                             for i in range(len(p_targets))]
+    return results
+
+
 def plot_det_curve(fnr, fpr, save_path=None):
     """ plots the detection error trade-off (DET) curve
     """
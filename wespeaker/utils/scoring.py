@@ -0,0 +1,227 @@
+# Copyright 2026 WeSpeaker contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Vectorized cosine scoring of trial lists.
+
+The embedding matrix is mean subtracted and L2 normalized once, the trial
+file is read chunk_size lines at a time, the keys of a chunk are mapped to
+rows and the scores are gathered row-wise dot products. Lines are written
+in bulk, the same format as the per-trial loop it replaces:
+
+    enroll test score [label]
+
+cohort_stats() computes the top-N cohort statistics of the score
+normalization (AS-norm / S-norm) chunk by chunk, the memory only depends on
+the chunk sizes whatever the number of embeddings or cohort speakers.
+"""
+
+from itertools import islice
+
+import numpy as np
+
+
+def num_tokens_per_line(text, num_lines):
+    """ Number of whitespace separated tokens of each line of text
+    """
+    buf = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+    # ascii whitespace and control characters
+    space = buf <= 32
+    starts = np.flatnonzero(space[:-1] & ~space[1:]) + 1
+    if len(buf) > 0 and not space[0]:
+        starts = np.r_[0, starts]
+    newlines = np.flatnonzero(buf == ord('\n'))
+    return np.bincount(np.searchsorted(newlines, starts),
+                       minlength=num_lines)[:num_lines]
+
+
+def read_trials(fin, chunk_size=1000000):
+    """ Iterate over the trials of fin, chunk_size lines at a time
+
+        Returns:
+            Iterable[(enroll keys, test keys, labels)], labels is None for
+            a chunk of 2 column trials, a list otherwise (None for the lines
+            without label). Lines with less than 2 columns are skipped.
+    """
+    while True:
+        lines = list(islice(fin, chunk_size))
+        if len(lines) == 0:
+            return
+        text = ''.join(lines)
+        tokens = text.split()
+        num_cols = len(lines[0].split())
+        if num_cols in [2, 3] and len(tokens) == num_cols * len(lines) and \
+                np.all(num_tokens_per_line(text, len(lines)) == num_cols):
+            # all the lines have the same number of columns
+            labels = tokens[2::3] if num_cols == 3 else None
+            yield tokens[0::num_cols], tokens[1::num_cols], labels
+            continue
+        segs = [line.split() for line in lines]
+        segs = [seg for seg in segs if len(seg) >= 2]
+        yield ([seg[0] for seg in segs], [seg[1] for seg in segs],
+               [seg[2] if len(seg) == 3 else None for seg in segs])
+
+
+def format_scores(enroll, test, scores, labels=None, precision=5):
+    """ 'enroll test score [label]\\n' lines of a chunk, as one string
+    """
+    scores = scores.tolist()
+    fmt = '{} {} {:.%df}\n' % precision
+    if labels is None:
+        return ''.join(map(fmt.format, enroll, test, scores))
+    fmt_label = '{} {} {:.%df} {}\n' % precision
+    if None not in labels:
+        return ''.join(map(fmt_label.format, enroll, test, scores, labels))
+    return ''.join(
+        fmt.format(e, t, s) if label is None else fmt_label.format(
+            e, t, s, label)
+        for e, t, s, label in zip(enroll, test, scores, labels))
+
+
+class CosineScorer:
+    """ Cosine scores of the trials of embeddings (N, D) with keys
+
+        Args:
+            keys: N keys
+            embeds: (N, D) embeddings, e.g. of load_embeddings()
+            mean_vec: subtracted before the normalization
+    """
+
+    def __init__(self, keys, embeds, mean_vec=None):
+        embeds = np.asarray(embeds, dtype=np.float32)
+        if mean_vec is not None:
+            embeds = embeds - np.asarray(mean_vec, dtype=np.float32)
+        norms = np.linalg.norm(embeds, axis=1, keepdims=True)
+        # the normalized copy, shared by all the trial lists
+        self.embeds = embeds / norms
+        self.key2row = {key: i for i, key in enumerate(keys)}
+
+    def rows(self, keys):
+        """ Rows of keys, -1 for the missing ones
+        """
+        get = self.key2row.get
+        return np.fromiter((get(key, -1) for key in keys),
+                           dtype=np.int64,
+                           count=len(keys))
+
+    def score_rows(self, enroll_rows, test_rows, batch_size=65536):
+        """ Cosine scores (float32) of the pairs of rows
+        """
+        scores = np.empty(len(enroll_rows), dtype=np.float32)
+        for i in range(0, len(enroll_rows), batch_size):
+            e = self.embeds[enroll_rows[i:i + batch_size]]
+            t = self.embeds[test_rows[i:i + batch_size]]
+            scores[i:i + batch_size] = np.einsum('ij,ij->i', e, t)
+        return scores
+
+    def score_file(self,
+                   trial_file,
+                   score_file,
+                   chunk_size=1000000,
+                   precision=5,
+                   skip_missing=False,
+                   require_labels=False):
+        """ Score the trials of trial_file into score_file
+
+            Args:
+                skip_missing: skip the trials of missing keys, otherwise
+                    raise KeyError
+                require_labels: skip the trials without label
+
+            Returns:
+                (number of trials scored, keys missing)
+        """
+        num_scored, missing = 0, set()
+        with open(trial_file, 'r') as fin, open(score_file, 'w') as fout:
+            for enroll, test, labels in read_trials(fin, chunk_size):
+                if require_labels and labels is None:
+                    continue
+                if require_labels and None in labels:
+                    keep = [i for i, label in enumerate(labels)
+                            if label is not None]
+                    enroll = [enroll[i] for i in keep]
+                    test = [test[i] for i in keep]
+                    labels = [labels[i] for i in keep]
+                enroll_rows, test_rows = self.rows(enroll), self.rows(test)
+                valid = (enroll_rows >= 0) & (test_rows >= 0)
+                if not valid.all():
+                    for keys, rows in [(enroll, enroll_rows),
+                                       (test, test_rows)]:
+                        missing.update(keys[i]
+                                       for i in np.nonzero(rows < 0)[0])
+                    if not skip_missing:
+                        raise KeyError(sorted(missing)[0])
+                    keep = np.nonzero(valid)[0].tolist()
+                    enroll = [enroll[i] for i in keep]
+                    test = [test[i] for i in keep]
+                    labels = None if labels is None else \
+                        [labels[i] for i in keep]
+                    enroll_rows = enroll_rows[valid]
+                    test_rows = test_rows[valid]
+                scores = self.score_rows(enroll_rows, test_rows)
+                fout.write(
+                    format_scores(enroll, test, scores, labels, precision))
+                num_scored += len(scores)
+        return num_scored, missing
+
+
+def _normalize(embeds):
+    embeds = np.asarray(embeds, dtype=np.float32)
+    return embeds / np.linalg.norm(embeds, axis=1, keepdims=True)
+
+
+def cohort_stats(embeds,
+                 cohort,
+                 top_n,
+                 chunk_size=1000,
+                 cohort_chunk_size=100000):
+    """ Mean and std of the top_n cosine scores of each embedding against
+        the cohort, all the cohort if top_n >= len(cohort) (S-norm)
+
+        Args:
+            embeds: (N, D) embeddings, mean subtracted
+            cohort: (M, D) cohort embeddings, mean subtracted
+            chunk_size: number of embeddings scored at a time
+            cohort_chunk_size: number of cohort embeddings scored at a time
+
+        Returns:
+            (N,), (N,) float64 mean and std
+    """
+    cohort = _normalize(cohort)
+    top_n = min(top_n, len(cohort))
+    means = np.empty(len(embeds), dtype=np.float64)
+    stds = np.empty(len(embeds), dtype=np.float64)
+    for i in range(0, len(embeds), chunk_size):
+        chunk = _normalize(embeds[i:i + chunk_size])
+        # running top_n scores, or sums for all the cohort
+        top = np.empty((len(chunk), 0), dtype=np.float32)
+        sums = np.zeros((2, len(chunk)), dtype=np.float64)
+        for j in range(0, len(cohort), cohort_chunk_size):
+            scores = np.matmul(chunk, cohort[j:j + cohort_chunk_size].T)
+            if top_n == len(cohort):
+                sums[0] += scores.sum(axis=1, dtype=np.float64)
+                sums[1] += np.square(scores, dtype=np.float64).sum(axis=1)
+                continue
+            scores = np.concatenate((top, scores), axis=1)
+            if scores.shape[1] > top_n:
+                # unordered top_n, enough for the mean and std
+                scores = np.partition(scores, -top_n, axis=1)[:, -top_n:]
+            top = scores
+        if top_n < len(cohort):
+            top = top.astype(np.float64)
+            sums[0] = top.sum(axis=1)
+            sums[1] = np.square(top).sum(axis=1)
+        mean = sums[0] / top_n
+        means[i:i + chunk_size] = mean
+        stds[i:i + chunk_size] = np.sqrt(
+            np.maximum(sums[1] / top_n - mean**2, 0.0))
+    return means, stds
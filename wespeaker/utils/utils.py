@@ -81,3 +81,30 @@ def spk2id(utt_spk_list):
     for i, spk in enumerate(spk_list):
         spk2id_dict[spk] = i
     return spk2id_dict
+
+
+def get_amp_dtype(amp_dtype='float16'):
+    """ Map the amp_dtype config string to the autocast torch.dtype,
+        bfloat16 shares the fp32 exponent range and needs no GradScaler
+    """
+    assert amp_dtype in ['float16', 'bfloat16'], \
+        'amp_dtype should be float16 or bfloat16, got {}'.format(amp_dtype)
+    return getattr(torch, amp_dtype)
+
+
+def compile_model(model, **compile_args):
+    """ Compile the forward of model in place with torch.compile
+
+    :param model: torch.nn.Module, compiled in place so that the state_dict
+                  keys and submodules (e.g. model.projection) are unchanged
+    :param **compile_args: passed to torch.compile, e.g. mode, dynamic,
+                           backend. Use dynamic=True for variable length input
+    :return: the same model
+    """
+    if not hasattr(model, 'compile'):
+        logging.warning('torch.compile needs torch>=2.2, current version is '
+                        '{}, run the model in eager mode'.format(
+                            torch.__version__))
+        return model
+    model.compile(**compile_args)
+    return model